@@ -0,0 +1,488 @@
+"""
+Provides stacking accumulators : they hold what is needed to compute stacking results
+"""
+# ALS - Astro Live Stacker
+# Copyright (C) 2019  Sébastien Durand (Dragonlost) - Gilles Le Maréchal (Gehelem)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import os
+import tempfile
+from abc import abstractmethod
+from collections import deque
+
+import numpy as np
+
+from als.code_utilities import log
+
+_LOGGER = logging.getLogger(__name__)
+
+_SIGMA_CLIP_KAPPA = 3.
+_SIGMA_CLIP_MIN_FRAMES = 4
+# lower bounds of the standard deviation used by kappa-sigma clipping, relative to pixel mean and absolute, in ADU
+_SIGMA_CLIP_MIN_RELATIVE_SIGMA = 1e-2
+_SIGMA_CLIP_MIN_SIGMA = 1.
+_MEDIAN_TILE_MAX_ELEMENTS = 2 ** 22
+_REMOVABLE_FRAMES_COUNT = 3
+
+
+class StackAccumulator:
+    """
+    Base abstract class for stacking accumulators : frames are added to them, and stacking results are computed
+    from what they hold.
+
+    Subclasses must implement add(data) and get_result()
+    """
+
+    @log
+    def __init__(self):
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """
+        Retrieves the number of frames added to this accumulator
+
+        :return: the number of frames
+        :rtype: int
+        """
+        return self._count
+
+    @abstractmethod
+    def add(self, data: np.ndarray):
+        """
+        Adds a frame to the accumulator
+
+        :param data: the frame data
+        :type data: numpy.ndarray
+        """
+
+    @abstractmethod
+    def get_result(self) -> np.ndarray:
+        """
+        Computes stacking result from accumulated frames
+
+        :return: the stacking result, as float32
+        :rtype: numpy.ndarray
+        """
+
+    # pylint: disable=W0613, R0201
+    def remove_last(self, count: int) -> int:
+        """
+        Removes the most recently added frames from the accumulator, as far as it can. At least one frame is always
+        kept.
+
+        Default implementation removes nothing.
+
+        :param count: how many frames to remove
+        :type count: int
+
+        :return: the number of frames actually removed
+        :rtype: int
+        """
+        return 0
+
+    def close(self):
+        """
+        Releases resources held by the accumulator, if any. Default implementation does nothing.
+        """
+
+
+class SumAccumulator(StackAccumulator):
+    """
+    Accumulates frames into a float64 running sum, for SUM and MEAN stacking modes.
+
+    Frames are added in place, and the mean is only computed when a result is requested.
+
+    The last few frames are kept as float32, so they can be subtracted from the sum if needed.
+    """
+
+    @log
+    def __init__(self, shape: tuple, average: bool):
+        """
+        Creates an empty accumulator
+
+        :param shape: shape of the frames data
+        :type shape: tuple
+
+        :param average: do we compute the mean of accumulated frames ? If False, result is their sum
+        :type average: bool
+        """
+        super().__init__()
+        self._sum = np.zeros(shape, dtype=np.float64)
+        self._average = average
+        self._recent_frames = deque()
+
+    @log
+    def add(self, data: np.ndarray):
+        np.add(self._sum, data, out=self._sum)
+        self._count += 1
+
+        # recycle the oldest kept frame buffer, if any
+        if len(self._recent_frames) == _REMOVABLE_FRAMES_COUNT:
+            recent_frame = self._recent_frames.popleft()
+        else:
+            recent_frame = np.empty(self._sum.shape, dtype=np.float32)
+        np.copyto(recent_frame, data, casting='same_kind')
+        self._recent_frames.append(recent_frame)
+
+    @log
+    def remove_last(self, count: int) -> int:
+        removed_count = min(count, len(self._recent_frames), self._count - 1)
+        for _ in range(removed_count):
+            np.subtract(self._sum, self._recent_frames.pop(), out=self._sum)
+        self._count -= removed_count
+        return removed_count
+
+    @log
+    def get_result(self) -> np.ndarray:
+        factor = 1 / self._count if self._average else 1.
+        result = np.empty(self._sum.shape, dtype=np.float32)
+        np.multiply(self._sum, factor, out=result, casting='same_kind')
+        return result
+
+
+# pylint: disable=R0902
+class SigmaClipAccumulator(StackAccumulator):
+    """
+    Streaming kappa-sigma clipping accumulator.
+
+    Maintains per-pixel running mean and variance (Welford's algorithm). Once enough frames were accumulated, each
+    new pixel value farther than kappa standard deviations from current pixel mean is rejected and does not
+    contribute to statistics. Stacking result is the per-pixel mean of accepted values.
+
+    Standard deviation is floored, so a pixel whose first values were all identical can still accept new ones.
+
+    Memory use is bounded to a few frame-sized buffers, regardless of frames count. The last few frames are kept,
+    along with their acceptance masks, so their contribution can be reverted if needed.
+    """
+
+    @log
+    def __init__(self, shape: tuple, removable_frames_count: int = _REMOVABLE_FRAMES_COUNT):
+        """
+        Creates an empty accumulator
+
+        :param shape: shape of the frames data
+        :type shape: tuple
+
+        :param removable_frames_count: how many of the last frames are kept so they can be removed
+        :type removable_frames_count: int
+        """
+        super().__init__()
+        self._removable_frames_count = removable_frames_count
+        self._mean = np.zeros(shape, dtype=np.float32)
+        self._squared_deviations_sum = np.zeros(shape, dtype=np.float32)
+        self._pixel_counts = np.zeros(shape, dtype=np.float32)
+        self._delta = np.empty(shape, dtype=np.float32)
+        self._work = np.empty(shape, dtype=np.float32)
+        self._variance_floor = np.empty(shape, dtype=np.float32)
+        self._accepted = np.ones(shape, dtype=bool)
+        self._recent_frames = deque()
+
+    @log
+    def add(self, data: np.ndarray):
+        np.subtract(data, self._mean, out=self._delta)
+        self._accepted.fill(True)
+
+        if self._count >= _SIGMA_CLIP_MIN_FRAMES:
+            # accepted pixels are those for which delta^2 <= kappa^2 * variance
+            np.subtract(self._pixel_counts, 1, out=self._work)
+            np.maximum(self._work, 1, out=self._work)
+            np.divide(self._squared_deviations_sum, self._work, out=self._work)
+
+            # variance is never below max(relative min sigma * |mean|, min sigma)^2
+            np.abs(self._mean, out=self._variance_floor)
+            self._variance_floor *= _SIGMA_CLIP_MIN_RELATIVE_SIGMA
+            np.maximum(self._variance_floor, _SIGMA_CLIP_MIN_SIGMA, out=self._variance_floor)
+            np.square(self._variance_floor, out=self._variance_floor)
+            np.maximum(self._work, self._variance_floor, out=self._work)
+
+            self._work *= _SIGMA_CLIP_KAPPA ** 2
+            np.less_equal(np.square(self._delta), self._work, out=self._accepted)
+
+            rejected_count = self._accepted.size - np.count_nonzero(self._accepted)
+            _LOGGER.debug(f"Kappa-sigma clipping rejected {rejected_count} pixel values")
+
+        self._pixel_counts += self._accepted
+
+        np.divide(self._delta, self._pixel_counts, out=self._work, where=self._accepted)
+        np.add(self._mean, self._work, out=self._mean, where=self._accepted)
+
+        np.subtract(data, self._mean, out=self._work)
+        self._work *= self._delta
+        np.add(self._squared_deviations_sum, self._work, out=self._squared_deviations_sum, where=self._accepted)
+
+        self._count += 1
+
+        if self._removable_frames_count == 0:
+            return
+
+        # recycle the oldest kept frame buffers, if any
+        if len(self._recent_frames) == self._removable_frames_count:
+            recent_frame, recent_accepted = self._recent_frames.popleft()
+        else:
+            recent_frame = np.empty(self._mean.shape, dtype=np.float32)
+            recent_accepted = np.empty(self._mean.shape, dtype=bool)
+        np.copyto(recent_frame, data, casting='same_kind')
+        np.copyto(recent_accepted, self._accepted)
+        self._recent_frames.append((recent_frame, recent_accepted))
+
+    @log
+    def remove_last(self, count: int) -> int:
+        removed_count = min(count, len(self._recent_frames), self._count - 1)
+
+        for _ in range(removed_count):
+            data, accepted = self._recent_frames.pop()
+
+            # revert Welford's update on accepted pixels : previous mean is mean - (data - mean) / (n - 1)
+            np.subtract(self._pixel_counts, 1, out=self._work)
+            np.maximum(self._work, 1, out=self._work)
+            np.subtract(data, self._mean, out=self._delta)
+            np.divide(self._delta, self._work, out=self._work)
+            np.subtract(self._mean, self._work, out=self._work)
+
+            self._delta *= data - self._work
+            np.subtract(self._squared_deviations_sum, self._delta, out=self._squared_deviations_sum, where=accepted)
+            np.copyto(self._mean, self._work, where=accepted)
+            self._pixel_counts -= accepted
+
+        self._count -= removed_count
+        return removed_count
+
+    @log
+    def get_result(self) -> np.ndarray:
+        return self._mean.copy()
+
+
+class FrameRingBuffer:
+    """
+    Disk-backed, memory-mapped ring buffer of frames.
+
+    Frames are stored as float32 in a temporary file, so holding many of them does not eat up the heap : the OS
+    pages frame data in and out as needed. Once the buffer is full, each new frame overwrites the oldest one.
+    """
+
+    @log
+    def __init__(self, shape: tuple, capacity: int, folder_path: str):
+        """
+        Creates an empty ring buffer, backed by a temporary file
+
+        :param shape: shape of the frames data
+        :type shape: tuple
+
+        :param capacity: max number of frames held by the buffer
+        :type capacity: int
+
+        :param folder_path: path of the folder where backing file is created
+        :type folder_path: str
+
+        :raises: OSError if backing file could not be created
+        """
+        file_descriptor, self._path = tempfile.mkstemp(prefix="als_frames_", suffix=".dat", dir=folder_path)
+        os.close(file_descriptor)
+        _LOGGER.debug(f"Frame ring buffer of {capacity} frames backed by {self._path}")
+        self._frames = np.memmap(self._path, dtype=np.float32, mode='w+', shape=(capacity,) + tuple(shape))
+        self._capacity = capacity
+        self._size = 0
+        self._next_index = 0
+
+    @property
+    def size(self) -> int:
+        """
+        Retrieves the number of frames held by the buffer
+
+        :return: the number of frames
+        :rtype: int
+        """
+        return self._size
+
+    @property
+    def is_full(self) -> bool:
+        """
+        Is the buffer full ? If so, next pushed frame will overwrite the oldest one
+
+        :return: True if buffer is full, False otherwise
+        :rtype: bool
+        """
+        return self._size == self._capacity
+
+    @log
+    def oldest(self) -> np.ndarray:
+        """
+        Retrieves the oldest frame held by the buffer
+
+        :return: the oldest frame, as a view on the buffer
+        :rtype: numpy.memmap
+        """
+        return self._frames[(self._next_index - self._size) % self._capacity]
+
+    @log
+    def push(self, data: np.ndarray):
+        """
+        Stores a new frame, overwriting the oldest one if buffer is full
+
+        :param data: the frame data
+        :type data: numpy.ndarray
+        """
+        self._frames[self._next_index] = data
+        self._next_index = (self._next_index + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    @log
+    def pop_newest(self) -> np.ndarray:
+        """
+        Removes the newest frame from the buffer
+
+        :return: the removed frame, as a view on the buffer, valid until next push
+        :rtype: numpy.memmap
+        """
+        self._next_index = (self._next_index - 1) % self._capacity
+        self._size -= 1
+        return self._frames[self._next_index]
+
+    @log
+    def frames(self) -> np.ndarray:
+        """
+        Retrieves all frames held by the buffer, in no particular order
+
+        :return: the frames, as a view on the buffer, indexed by frame on first axis
+        :rtype: numpy.memmap
+        """
+        return self._frames[:self._size]
+
+    @log
+    def close(self):
+        """
+        Releases buffer and deletes its backing file
+        """
+        self._frames = None
+        try:
+            os.remove(self._path)
+        except OSError as os_error:
+            _LOGGER.warning(f"Could not remove frame buffer file {self._path} : {os_error}")
+
+
+class WindowedMedianAccumulator(StackAccumulator):
+    """
+    Computes the median of the last N frames.
+
+    Frames are held by a FrameRingBuffer and the median is computed tile by tile, streaming from the buffer, so
+    only a small part of the window is loaded in memory at any time.
+    """
+
+    @log
+    def __init__(self, shape: tuple, window_size: int, folder_path: str):
+        """
+        Creates an empty accumulator
+
+        :param shape: shape of the frames data
+        :type shape: tuple
+
+        :param window_size: the number of most recent frames to compute the median of
+        :type window_size: int
+
+        :param folder_path: path of the folder where frames buffer is stored
+        :type folder_path: str
+
+        :raises: OSError if frames buffer could not be created
+        """
+        super().__init__()
+        self._shape = tuple(shape)
+        self._buffer = FrameRingBuffer(shape, window_size, folder_path)
+
+    @log
+    def add(self, data: np.ndarray):
+        self._buffer.push(data)
+        self._count += 1
+
+    @log
+    def get_result(self) -> np.ndarray:
+        frame_count = self._buffer.size
+        frames = self._buffer.frames().reshape(frame_count, -1)
+        pixel_count = frames.shape[1]
+        result = np.empty(pixel_count, dtype=np.float32)
+
+        tile_size = max(1, _MEDIAN_TILE_MAX_ELEMENTS // frame_count)
+        for start in range(0, pixel_count, tile_size):
+            end = min(start + tile_size, pixel_count)
+            np.median(frames[:, start:end], axis=0, out=result[start:end])
+
+        return result.reshape(self._shape)
+
+    @log
+    def remove_last(self, count: int) -> int:
+        removed_count = min(count, self._buffer.size - 1)
+        for _ in range(removed_count):
+            self._buffer.pop_newest()
+        self._count -= removed_count
+        return removed_count
+
+    @log
+    def close(self):
+        self._buffer.close()
+
+
+class SlidingMeanAccumulator(StackAccumulator):
+    """
+    Computes the mean of the last N frames, in constant time per frame.
+
+    Frames of the window are held by a FrameRingBuffer. Each new frame is added to a float64 running sum, from
+    which the frame leaving the window is subtracted.
+    """
+
+    @log
+    def __init__(self, shape: tuple, window_size: int, folder_path: str):
+        """
+        Creates an empty accumulator
+
+        :param shape: shape of the frames data
+        :type shape: tuple
+
+        :param window_size: the number of most recent frames to compute the mean of
+        :type window_size: int
+
+        :param folder_path: path of the folder where frames buffer is stored
+        :type folder_path: str
+
+        :raises: OSError if frames buffer could not be created
+        """
+        super().__init__()
+        self._sum = np.zeros(shape, dtype=np.float64)
+        self._buffer = FrameRingBuffer(shape, window_size, folder_path)
+
+    @log
+    def add(self, data: np.ndarray):
+        if self._buffer.is_full:
+            np.subtract(self._sum, self._buffer.oldest(), out=self._sum)
+        self._buffer.push(data)
+        np.add(self._sum, data, out=self._sum)
+        self._count += 1
+
+    @log
+    def get_result(self) -> np.ndarray:
+        result = np.empty(self._sum.shape, dtype=np.float32)
+        np.multiply(self._sum, 1 / self._buffer.size, out=result, casting='same_kind')
+        return result
+
+    @log
+    def remove_last(self, count: int) -> int:
+        removed_count = min(count, self._buffer.size - 1)
+        for _ in range(removed_count):
+            np.subtract(self._sum, self._buffer.pop_newest(), out=self._sum)
+        self._count -= removed_count
+        return removed_count
+
+    @log
+    def close(self):
+        self._buffer.close()
@@ -0,0 +1,323 @@
+"""
+Provides alignment building blocks : star measurement, phase correlation, motion model and reference stars
+"""
+# ALS - Astro Live Stacker
+# Copyright (C) 2019  Sébastien Durand (Dragonlost) - Gilles Le Maréchal (Gehelem)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+from collections import deque
+
+import astroalign as al
+import numpy as np
+from scipy.spatial import KDTree
+from skimage.transform import SimilarityTransform
+
+from als.code_utilities import log
+
+_LOGGER = logging.getLogger(__name__)
+
+_PHASE_CORRELATION_MAX_SIZE = 1024
+_STAR_MEASURE_RADIUS = 4
+_STAR_DETECTION_SIGMA = 5
+_MOTION_MODEL_HISTORY_SIZE = 8
+
+
+class AlignmentError(Exception):
+    """
+    Raised when alignment building blocks cannot do their job
+    """
+
+
+def estimate_noise(data: np.ndarray) -> float:
+    """
+    Estimates background noise level of image data, using the median absolute deviation of a decimated copy
+
+    :param data: the image data (single channel)
+    :type data: numpy.ndarray
+
+    :return: the noise standard deviation estimate
+    :rtype: float
+    """
+    sample = data[::7, ::7]
+    return 1.4826 * float(np.median(np.abs(sample - np.median(sample))))
+
+
+# pylint: disable=R0914
+def measure_star_positions(data: np.ndarray, predicted_positions: np.ndarray, noise: float):
+    """
+    Measures actual star positions around a set of predicted positions.
+
+    For each predicted position, we compute the centroid of a small window centered on it, recentering window
+    on centroid once. Windows with no significant signal are ignored.
+
+    :param data: the image data (single channel)
+    :type data: numpy.ndarray
+
+    :param predicted_positions: (N, 2) array of predicted (x, y) star positions
+    :type predicted_positions: numpy.ndarray
+
+    :param noise: image background noise level
+    :type noise: float
+
+    :return: a tuple of 2 arrays : a (N,) boolean array telling if star was found and a (N, 2) array of
+             measured (x, y) positions
+    :rtype: tuple
+    """
+    radius = _STAR_MEASURE_RADIUS
+    height, width = data.shape
+    offsets = np.arange(-radius, radius + 1)
+
+    found = np.zeros(len(predicted_positions), dtype=bool)
+    measured_positions = np.array(predicted_positions, dtype=np.float64)
+
+    for index, position in enumerate(measured_positions):
+
+        for _ in range(2):
+            column, row = int(round(position[0])), int(round(position[1]))
+
+            if not (radius <= row < height - radius and radius <= column < width - radius):
+                found[index] = False
+                break
+
+            window = np.float64(data[row - radius:row + radius + 1, column - radius:column + radius + 1])
+            border = np.concatenate([window[0], window[-1], window[1:-1, 0], window[1:-1, -1]])
+            signal = window - np.median(border)
+
+            if signal.max() < _STAR_DETECTION_SIGMA * noise:
+                found[index] = False
+                break
+
+            signal[signal < 0] = 0
+            total = signal.sum()
+            position[0] = column + np.dot(signal.sum(axis=0), offsets) / total
+            position[1] = row + np.dot(signal.sum(axis=1), offsets) / total
+            found[index] = True
+
+    return found, measured_positions
+
+
+# pylint: disable=R0903
+class PhaseCorrelator:
+    """
+    Estimates the translation between images and a reference, using FFT phase correlation on a centered crop.
+
+    Reference spectrum is computed once, so each estimation only costs one forward and one inverse FFT.
+    """
+
+    @log
+    def __init__(self, reference_data: np.ndarray):
+        """
+        Prepares reference spectrum
+
+        :param reference_data: the reference data (single channel)
+        :type reference_data: numpy.ndarray
+        """
+        height, width = reference_data.shape
+        crop_height = min(height, _PHASE_CORRELATION_MAX_SIZE)
+        crop_width = min(width, _PHASE_CORRELATION_MAX_SIZE)
+
+        self._top = (height - crop_height) // 2
+        self._left = (width - crop_width) // 2
+        self._window = np.float32(np.outer(np.hanning(crop_height), np.hanning(crop_width)))
+        self._reference_spectrum = np.conj(np.fft.rfft2(self._prepare(reference_data)))
+
+    def _prepare(self, data: np.ndarray) -> np.ndarray:
+        """
+        Extracts centered crop from data, removes background and applies apodization window
+
+        :param data: the image data (single channel)
+        :type data: numpy.ndarray
+
+        :return: the prepared crop
+        :rtype: numpy.ndarray
+        """
+        crop_height, crop_width = self._window.shape
+        crop = np.array(data[self._top:self._top + crop_height, self._left:self._left + crop_width], dtype=np.float32)
+        crop -= np.median(crop)
+        np.clip(crop, 0, None, out=crop)
+        crop *= self._window
+        return crop
+
+    @log
+    def estimate_shift(self, data: np.ndarray):
+        """
+        Estimates the shift of data vs reference
+
+        :param data: the image data (single channel), same shape as reference
+        :type data: numpy.ndarray
+
+        :return: a tuple of 2 floats : horizontal and vertical shift of data vs reference, in pixels
+        :rtype: tuple
+        """
+        cross_power = np.fft.rfft2(self._prepare(data)) * self._reference_spectrum
+        cross_power /= np.maximum(np.abs(cross_power), 1e-12)
+        correlation = np.fft.irfft2(cross_power, s=self._window.shape)
+
+        height, width = correlation.shape
+        peak_row, peak_column = np.unravel_index(np.argmax(correlation), correlation.shape)
+
+        def sub_pixel_offset(before, peak, after):
+            denominator = before - 2 * peak + after
+            return 0. if denominator == 0 else .5 * (before - after) / denominator
+
+        shift_y = peak_row + sub_pixel_offset(correlation[(peak_row - 1) % height, peak_column],
+                                              correlation[peak_row, peak_column],
+                                              correlation[(peak_row + 1) % height, peak_column])
+        shift_x = peak_column + sub_pixel_offset(correlation[peak_row, (peak_column - 1) % width],
+                                                 correlation[peak_row, peak_column],
+                                                 correlation[peak_row, (peak_column + 1) % width])
+
+        if shift_y > height / 2:
+            shift_y -= height
+        if shift_x > width / 2:
+            shift_x -= width
+
+        return shift_x, shift_y
+
+
+class MotionModel:
+    """
+    Keeps track of recent alignment transformations against image timestamps, so we can predict the next one.
+
+    Each transformation parameter (translation and rotation) is modeled as a linear function of time, fitted on
+    the most recent transformations.
+    """
+
+    @log
+    def __init__(self):
+        self._history = deque(maxlen=_MOTION_MODEL_HISTORY_SIZE)
+
+    @log
+    def reset(self):
+        """
+        Forgets all recorded transformations
+        """
+        self._history.clear()
+
+    @log
+    def record(self, timestamp: float, transformation: SimilarityTransform):
+        """
+        Records a transformation found for an image
+
+        :param timestamp: the image timestamp
+        :type timestamp: float
+
+        :param transformation: the found transformation
+        :type transformation: skimage.transform._geometric.SimilarityTransform
+        """
+        translation_x, translation_y = transformation.translation
+        self._history.append((timestamp, translation_x, translation_y, transformation.rotation))
+
+    @log
+    def predict(self, timestamp: float) -> SimilarityTransform:
+        """
+        Predicts transformation for an image
+
+        :param timestamp: the image timestamp
+        :type timestamp: float
+
+        :return: the predicted transformation or None if no transformation was ever recorded
+        :rtype: skimage.transform._geometric.SimilarityTransform
+        """
+        if not self._history:
+            return None
+
+        history = np.array(self._history)
+        times = history[:, 0] - history[-1, 0]
+
+        if len(history) < 2 or np.ptp(times) == 0:
+            _, translation_x, translation_y, rotation = history[-1]
+
+        else:
+            elapsed = timestamp - history[-1, 0]
+            slopes, intercepts = np.polyfit(times, history[:, 1:], 1)
+            translation_x, translation_y, rotation = intercepts + slopes * elapsed
+
+        return SimilarityTransform(rotation=rotation, translation=(translation_x, translation_y))
+
+
+# pylint: disable=protected-access, R0903
+class ReferenceStars:
+    """
+    Holds alignment features extracted from a subset of the align reference : control points (stars) and
+    asterisms (star triangles) with their invariants index.
+
+    These only depend on the align reference, so we compute them once and reuse them for every new image.
+    """
+
+    @log
+    def __init__(self, subset_data: np.ndarray):
+        """
+        Extracts alignment features from reference subset
+
+        :param subset_data: the align reference subset
+        :type subset_data: numpy.ndarray
+        """
+        self.control_points = al._find_sources(subset_data)[:al.MAX_CONTROL_POINTS]
+
+        if len(self.control_points) >= 3:
+            invariants, self.asterisms = al._generate_invariants(self.control_points)
+            self.invariant_tree = KDTree(invariants)
+        else:
+            self.asterisms = None
+            self.invariant_tree = None
+
+    # pylint: disable=R0914
+    @log
+    def find_transform(self, source_data: np.ndarray):
+        """
+        Estimate the transform between source data and the reference subset these features were extracted from.
+
+        This mirrors astroalign.find_transform(), minus the reference part we already did.
+
+        :param source_data: subset of the image to align
+        :type source_data: numpy.ndarray
+
+        :return: the transformation object and a tuple of corresponding star positions in source and reference.
+        :raises: AlignmentError if not enough stars are found. Any astroalign error is also propagated.
+        """
+        if self.invariant_tree is None:
+            raise AlignmentError("Reference stars count is less than the minimum value (3)")
+
+        source_control_points = al._find_sources(source_data)[:al.MAX_CONTROL_POINTS]
+
+        if len(source_control_points) < 3:
+            raise AlignmentError("Source stars count is less than the minimum value (3)")
+
+        source_invariants, source_asterisms = al._generate_invariants(source_control_points)
+        source_invariant_tree = KDTree(source_invariants)
+
+        # r = 0.03 is the maximum search distance used by astroalign
+        matches_list = source_invariant_tree.query_ball_tree(self.invariant_tree, r=0.03)
+
+        matches = []
+        for source_asterism, reference_asterism_indices in zip(source_asterisms, matches_list):
+            for reference_asterism in self.asterisms[reference_asterism_indices]:
+                matches.append(list(zip(source_asterism, reference_asterism)))
+        matches = np.array(matches)
+
+        invariants_model = al._MatchTransform(source_control_points, self.control_points)
+        invariants_count = len(matches)
+        min_matches = min(10, int(invariants_count * al.MIN_MATCHES_FRACTION))
+
+        transformation, inliers_indices = al._ransac(
+            matches, invariants_model, 1, invariants_count, al.PIXEL_TOL, min_matches)
+
+        triangle_inliers = matches[inliers_indices]
+        inliers = triangle_inliers.reshape(-1, triangle_inliers.shape[2])
+        unique_inliers = np.array([list(pair) for pair in set(tuple(pair) for pair in inliers)])
+        source_indices, reference_indices = unique_inliers.T
+
+        return transformation, (source_control_points[source_indices], self.control_points[reference_indices])
@@ -0,0 +1,887 @@
+"""
+Provides light frames calibration, using a library of master darks, flats and biases
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from PyQt5.QtCore import QT_TRANSLATE_NOOP
+
+from als import config
+from als.accumulation import SigmaClipAccumulator
+from als.code_utilities import log, Timer, SignalingQueue
+from als.crunching import calibrate, find_defective_pixels
+from als.io import input as als_input
+from als.io.input import ACQUISITION_FRAME_TYPE, ACQUISITION_EXPOSURE, ACQUISITION_GAIN, ACQUISITION_TEMPERATURE, \
+    ACQUISITION_BINNING
+from als.io.output import save_fits
+from als.messaging import MESSAGE_HUB
+from als.model.base import Image
+from als.processing import ImageProcessor, Binning, QueueConsumer, get_effective_bayer_pattern
+
+_LOGGER = logging.getLogger(__name__)
+
+MASTER_TYPE_DARK = "DARK"
+MASTER_TYPE_FLAT = "FLAT"
+MASTER_TYPE_BIAS = "BIAS"
+
+# frame type header values, as written by acquisition and stacking software, are matched on these words
+_FRAME_TYPE_WORDS = [
+    ("DARK", MASTER_TYPE_DARK),
+    ("FLAT", MASTER_TYPE_FLAT),
+    ("BIAS", MASTER_TYPE_BIAS),
+    ("OFFSET", MASTER_TYPE_BIAS),
+    ("ZERO", MASTER_TYPE_BIAS),
+]
+
+_FITS_SUFFIXES = ['.fit', '.fits', '.fts']
+
+# a defective pixel is repaired from the 8 closest pixels of the same color
+_DEFECT_NEIGHBOR_OFFSETS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+
+_MASTER_DARK_FILE_NAME_BASE = "master_dark"
+_MASTER_DARK_WAIT_PERIOD_IN_SEC = 0.02
+
+# acquisition settings used to choose a master for a light frame, by order of importance.
+# Each entry tells if the setting is compared relatively to light frame value
+_MATCHING_SETTINGS = {
+    MASTER_TYPE_DARK: [(ACQUISITION_EXPOSURE, True), (ACQUISITION_GAIN, False), (ACQUISITION_TEMPERATURE, False)],
+    MASTER_TYPE_BIAS: [(ACQUISITION_GAIN, False), (ACQUISITION_TEMPERATURE, False)],
+    MASTER_TYPE_FLAT: [(ACQUISITION_GAIN, False)],
+}
+
+# an unchanged library folder is scanned again at most that often, to find masters written or overwritten in place
+_LIBRARY_REFRESH_PERIOD_IN_SEC = 5
+
+# light frame settings whose change warrants warning again about a missing master. Temperature drifts all the time
+_WARNING_SETTINGS = (ACQUISITION_EXPOSURE, ACQUISITION_GAIN, ACQUISITION_BINNING)
+
+
+# pylint: disable=R0903
+class CalibrationMaster:
+    """
+    Calibration library entry : a master frame file and the acquisition settings it was shot with.
+    """
+
+    def __init__(self, master_type: str, path: Path, modification_time: float, settings: dict):
+        """
+        Creates a calibration library entry
+
+        :param master_type: the master type, one of MASTER_TYPE_*
+        :type master_type: str
+
+        :param path: path of the master file
+        :type path: pathlib.Path
+
+        :param modification_time: master file modification time
+        :type modification_time: float
+
+        :param settings: acquisition settings read from master file header
+        :type settings: dict
+        """
+        self.master_type = master_type
+        self.path = path
+        self.modification_time = modification_time
+        self.settings = settings
+
+
+class CalibrationLibrary:
+    """
+    Index of the master darks, flats and biases stored as FITS files in a folder.
+
+    Master type and acquisition settings are read from FITS headers. On refresh, only headers of new or modified
+    files are read. Folder is scanned right away if its modification time changed. Otherwise, as files being written
+    or overwritten in place don't change folder modification time, it is scanned again once in a while.
+    """
+
+    @log
+    def __init__(self):
+        self._folder_path: str = None
+        self._folder_modification_time: float = None
+        self._scan_time: float = None
+        self._index = dict()
+
+    @log
+    def refresh(self, folder_path: str):
+        """
+        Updates index to match the content of a folder.
+
+        :param folder_path: path of the folder holding master files
+        :type folder_path: str
+        """
+        if folder_path != self._folder_path:
+            self._folder_path = folder_path
+            self._folder_modification_time = None
+            self._scan_time = None
+            self._index = dict()
+
+        try:
+            folder_modification_time = os.stat(folder_path).st_mtime
+
+            if folder_modification_time == self._folder_modification_time and \
+                    time.monotonic() - self._scan_time < _LIBRARY_REFRESH_PERIOD_IN_SEC:
+                return
+
+            entries = [entry for entry in os.scandir(folder_path)
+                       if entry.is_file() and Path(entry.name).suffix.lower() in _FITS_SUFFIXES]
+        except OSError as error:
+            _LOGGER.debug(f"Could not list calibration library folder {folder_path} : {error}")
+            folder_modification_time = None
+            entries = []
+
+        self._folder_modification_time = folder_modification_time
+        self._scan_time = time.monotonic()
+
+        index = dict()
+
+        for entry in entries:
+            try:
+                modification_time = entry.stat().st_mtime
+            except OSError as error:
+                _LOGGER.debug(f"Could not read calibration library file {entry.path} : {error}")
+                continue
+
+            known_master = self._index.get(entry.path)
+
+            if known_master is not None and known_master.modification_time == modification_time:
+                index[entry.path] = known_master
+            else:
+                index[entry.path] = CalibrationLibrary._read_master(Path(entry.path), modification_time)
+
+        self._index = index
+
+    @property
+    def folder_modification_time(self) -> float:
+        """
+        Retrieves library folder modification time, as of last refresh
+
+        :return: the modification time or None if folder could not be listed
+        :rtype: float
+        """
+        return self._folder_modification_time
+
+    @property
+    def masters(self) -> List[CalibrationMaster]:
+        """
+        Retrieves all indexed masters
+
+        :return: the indexed masters
+        :rtype: List[CalibrationMaster]
+        """
+        return [master for master in self._index.values() if master.master_type is not None]
+
+    @log
+    def find_masters(self, master_type: str, light_settings: dict) -> List[CalibrationMaster]:
+        """
+        Retrieves masters of a given type usable for a light frame, best matching ones first.
+
+        Masters shot with a different binning are excluded. Remaining ones are sorted by differences of their
+        acquisition settings with the light frame ones. A setting unknown for the light frame is ignored, a
+        setting only unknown for the master is the worst possible match.
+
+        :param master_type: the master type, one of MASTER_TYPE_*
+        :type master_type: str
+
+        :param light_settings: light frame acquisition settings
+        :type light_settings: dict
+
+        :return: the matching masters, best first
+        :rtype: List[CalibrationMaster]
+        """
+        light_binning = light_settings.get(ACQUISITION_BINNING)
+
+        candidates = [master for master in self.masters
+                      if master.master_type == master_type and
+                      (light_binning is None or master.settings.get(ACQUISITION_BINNING, light_binning) == light_binning)]
+
+        def matching_distances(master):
+            distances = []
+            for setting, relative in _MATCHING_SETTINGS[master_type]:
+                light_value = light_settings.get(setting)
+                master_value = master.settings.get(setting)
+                if light_value is None:
+                    distances.append(0.)
+                elif master_value is None:
+                    distances.append(float('inf'))
+                elif relative:
+                    distances.append(abs(light_value - master_value) / max(abs(light_value), 1e-6))
+                else:
+                    distances.append(abs(light_value - master_value))
+            return distances
+
+        return sorted(candidates, key=matching_distances)
+
+    @staticmethod
+    @log
+    def _read_master(path: Path, modification_time: float) -> CalibrationMaster:
+        """
+        Reads a master file header.
+
+        :param path: the master file path
+        :type path: pathlib.Path
+
+        :param modification_time: the master file modification time
+        :type modification_time: float
+
+        :return: the library entry. Its master type is None if file is not a usable master
+        :rtype: CalibrationMaster
+        """
+        settings = als_input.read_fits_acquisition_settings(path)
+        master_type = None
+
+        if settings is not None:
+            frame_type = settings.get(ACQUISITION_FRAME_TYPE, "")
+            master_type = next((master_type for word, master_type in _FRAME_TYPE_WORDS if word in frame_type), None)
+
+        if master_type is None:
+            _LOGGER.debug(f"Ignoring calibration library file {path} : no known frame type")
+        else:
+            _LOGGER.debug(f"Indexed calibration master {path} : {master_type} {settings}")
+
+        return CalibrationMaster(master_type, path, modification_time, settings if settings is not None else {})
+
+
+# pylint: disable=R0902
+class Calibrate(ImageProcessor):
+    """
+    Provides light frames calibration using masters from the calibration library.
+
+    For each light frame, best matching master dark, flat and bias are chosen from library. Chosen masters are read,
+    binned and conformed to light frame data scale once, then kept in memory :
+
+      - offset : master dark, scaled to light frame exposure using master bias if exposures differ. Master bias if
+        no dark is available
+      - flat reciprocal : mean of bias-subtracted master flat, divided by bias-subtracted master flat
+
+    So calibration is a single multiply-subtract pass on each light frame. Calibrated data is float32.
+    """
+
+    @log
+    def __init__(self):
+        super().__init__()
+        # restack loads frames from several threads at once
+        self._lock = threading.Lock()
+        self._library = CalibrationLibrary()
+        self._prepared_masters = dict()
+        self._rejected_masters = set()
+        self._calibration_key: tuple = None
+        self._warning_key: tuple = None
+        self._offset: np.ndarray = None
+        self._flat_reciprocal: np.ndarray = None
+
+    @log
+    def process_image(self, image: Image):
+
+        use_library = config.get_use_calibration_library()
+
+        _LOGGER.debug(f"Calibration library enabled : {use_library}")
+
+        with self._lock:
+            if use_library:
+                offset, flat_reciprocal = self._get_calibration_data(image)
+            else:
+                self._release_calibration_data()
+                return image
+
+        if offset is None and flat_reciprocal is None:
+            return image
+
+        with Timer() as calibration_timer:
+            image.data = calibrate(image.data, offset, flat_reciprocal)
+
+        _LOGGER.debug(f"Calibration of {image.origin} done in {calibration_timer.elapsed_in_milli_as_str} ms")
+
+        return image
+
+    @log
+    def _release_calibration_data(self):
+        """
+        Forgets all masters and calibration data kept in memory.
+        """
+        self._prepared_masters = dict()
+        self._rejected_masters = set()
+        self._calibration_key = None
+        self._warning_key = None
+        self._offset = None
+        self._flat_reciprocal = None
+
+    @log
+    def _get_calibration_data(self, image: Image):
+        """
+        Retrieves calibration data for a light frame, only computing it if chosen masters changed.
+
+        :param image: the light frame
+        :type image: Image
+
+        :return: offset and flat reciprocal, each one being None if not available
+        :rtype: tuple
+        """
+        folder_path = config.get_calibration_library_folder_path()
+        self._library.refresh(folder_path)
+
+        if not self._library.masters:
+            # warn once per library or light frames settings change, not for each frame
+            warning_key = (folder_path, self._library.folder_modification_time) + tuple(
+                image.acquisition.get(setting) for setting in _WARNING_SETTINGS)
+
+            if warning_key != self._warning_key:
+                MESSAGE_HUB.dispatch_warning(
+                    __name__,
+                    QT_TRANSLATE_NOOP("", "No usable master found in calibration library {}. Calibration is SKIPPED"),
+                    [folder_path, ])
+                self._warning_key = warning_key
+
+            return None, None
+
+        self._warning_key = None
+
+        chosen_masters = [self._choose_master(master_type, image)
+                          for master_type in (MASTER_TYPE_DARK, MASTER_TYPE_FLAT, MASTER_TYPE_BIAS)]
+
+        chosen_paths = {master.path for master in chosen_masters if master is not None}
+        self._prepared_masters = {path: prepared for path, prepared in self._prepared_masters.items()
+                                  if path in chosen_paths}
+
+        calibration_key = tuple((master.path, master.modification_time) if master is not None else None
+                                for master in chosen_masters)
+        calibration_key += (image.acquisition.get(ACQUISITION_EXPOSURE), image.data.shape, image.data.dtype.name,
+                            config.get_binning_mode(), config.get_bayer_pattern())
+
+        if calibration_key != self._calibration_key:
+
+            dark, flat, bias = chosen_masters
+
+            MESSAGE_HUB.dispatch_info(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Calibrating with dark : {}, flat : {}, bias : {}"),
+                [master.path.name if master is not None else "-" for master in chosen_masters])
+
+            with Timer() as preparation_timer:
+                self._offset = self._compute_offset(dark, bias, image.acquisition.get(ACQUISITION_EXPOSURE))
+                self._flat_reciprocal = self._compute_flat_reciprocal(flat, bias)
+
+            _LOGGER.debug(f"Calibration data prepared in {preparation_timer.elapsed_in_milli_as_str} ms")
+            self._calibration_key = calibration_key
+
+        return self._offset, self._flat_reciprocal
+
+    @log
+    def _choose_master(self, master_type: str, image: Image) -> CalibrationMaster:
+        """
+        Chooses the best master of a type for a light frame, among the ones with the same data shape.
+
+        Chosen master data is prepared and kept in memory.
+
+        :param master_type: the master type, one of MASTER_TYPE_*
+        :type master_type: str
+
+        :param image: the light frame
+        :type image: Image
+
+        :return: the chosen master or None if no master is usable
+        :rtype: CalibrationMaster
+        """
+        preparation_key = (config.get_binning_mode(), config.get_bayer_pattern(), image.data.dtype.name)
+
+        for master in self._library.find_masters(master_type, image.acquisition):
+
+            rejection_key = (master.path, master.modification_time, preparation_key, image.data.shape)
+
+            if rejection_key in self._rejected_masters:
+                continue
+
+            prepared_master = self._prepared_masters.get(master.path)
+
+            if prepared_master is None or prepared_master[0] != (master.modification_time, preparation_key):
+                data = Calibrate._prepare_master_data(master, image.data.dtype)
+                if data is None:
+                    # unreadable master : it is tried again if modified
+                    self._rejected_masters.add(rejection_key)
+                    continue
+                prepared_master = ((master.modification_time, preparation_key), data)
+                self._prepared_masters[master.path] = prepared_master
+
+            if prepared_master[1].shape == image.data.shape:
+                return master
+
+            _LOGGER.debug(f"Master {master.path} shape {prepared_master[1].shape} does not match light frame shape")
+            self._rejected_masters.add(rejection_key)
+            del self._prepared_masters[master.path]
+
+        return None
+
+    @log
+    def _compute_offset(self, dark: CalibrationMaster, bias: CalibrationMaster, light_exposure: float):
+        """
+        Computes the offset to subtract from light frames.
+
+        :param dark: chosen master dark, if any
+        :type dark: CalibrationMaster
+
+        :param bias: chosen master bias, if any
+        :type bias: CalibrationMaster
+
+        :param light_exposure: light frame exposure, if known
+        :type light_exposure: float
+
+        :return: the offset or None if no dark nor bias is available
+        :rtype: numpy.ndarray
+        """
+        if dark is None:
+            return self._prepared_masters[bias.path][1] if bias is not None else None
+
+        dark_data = self._prepared_masters[dark.path][1]
+        dark_exposure = dark.settings.get(ACQUISITION_EXPOSURE)
+
+        if bias is None or not light_exposure or not dark_exposure or light_exposure == dark_exposure:
+            return dark_data
+
+        # thermal signal scales with exposure, bias does not
+        bias_data = self._prepared_masters[bias.path][1]
+        offset = np.subtract(dark_data, bias_data)
+        offset *= light_exposure / dark_exposure
+        offset += bias_data
+        return offset
+
+    @log
+    def _compute_flat_reciprocal(self, flat: CalibrationMaster, bias: CalibrationMaster):
+        """
+        Computes the normalized flat reciprocal, to multiply light frames by.
+
+        :param flat: chosen master flat, if any
+        :type flat: CalibrationMaster
+
+        :param bias: chosen master bias, if any
+        :type bias: CalibrationMaster
+
+        :return: the flat reciprocal or None if no flat is available
+        :rtype: numpy.ndarray
+        """
+        if flat is None:
+            return None
+
+        flat_signal = np.array(self._prepared_masters[flat.path][1])
+
+        if bias is not None:
+            flat_signal -= self._prepared_masters[bias.path][1]
+
+        valid_pixels = flat_signal > 0
+        flat_mean = float(flat_signal[valid_pixels].mean()) if valid_pixels.any() else 1.
+
+        # dead flat pixels are left uncorrected
+        flat_reciprocal = np.ones_like(flat_signal)
+        np.divide(flat_mean, flat_signal, out=flat_reciprocal, where=valid_pixels)
+        return flat_reciprocal
+
+    @staticmethod
+    @log
+    def _prepare_master_data(master: CalibrationMaster, light_dtype: np.dtype):
+        """
+        Reads master data, bins it like light frames and conforms it to light frames data scale.
+
+        :param master: the master
+        :type master: CalibrationMaster
+
+        :param light_dtype: light frames data type
+        :type light_dtype: numpy.dtype
+
+        :return: the master data as float32, or None if master could not be read
+        :rtype: numpy.ndarray
+        """
+        master_image = als_input.read_disk_image(master.path)
+
+        if master_image is None:
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Could not read calibration master {}. It is IGNORED"),
+                [str(master.path), ])
+            return None
+
+        Binning.bin_image(master_image, config.get_binning_mode())
+
+        master_dtype = master_image.data.dtype
+        data = np.array(master_image.data, dtype=np.float32)
+
+        light_max = np.iinfo(light_dtype).max if issubclass(light_dtype.type, np.integer) else 1.
+        master_max = np.iinfo(master_dtype).max if issubclass(master_dtype.type, np.integer) else 1.
+
+        if light_max != master_max:
+            _LOGGER.debug(f"Conforming master {master.path} from {master_dtype.name} to {light_dtype.name} scale")
+            data *= light_max / master_max
+
+        return data
+
+
+class DefectMap:
+    """
+    Sparse map of defective pixels, along with the same color neighbors each one is repaired from.
+
+    Neighbors out of frame, or defective themselves, are not used. Defective pixels without any usable neighbor are
+    left as is.
+    """
+
+    @log
+    def __init__(self, shape: tuple, rows: np.ndarray, columns: np.ndarray, step: int):
+        """
+        Creates a defect map
+
+        :param shape: shape of the data the map applies to
+        :type shape: tuple
+
+        :param rows: rows of defective pixels
+        :type rows: numpy.ndarray
+
+        :param columns: columns of defective pixels
+        :type columns: numpy.ndarray
+
+        :param step: distance between pixels of the same color : 1 for mono data, 2 for raw CFA data
+        :type step: int
+        """
+        self._shape = shape
+
+        defective = np.zeros(shape, dtype=bool)
+        defective[rows, columns] = True
+
+        neighbor_rows = rows[:, np.newaxis] + _DEFECT_NEIGHBOR_OFFSETS[:, 0] * step
+        neighbor_columns = columns[:, np.newaxis] + _DEFECT_NEIGHBOR_OFFSETS[:, 1] * step
+
+        usable = ((neighbor_rows >= 0) & (neighbor_rows < shape[0]) &
+                  (neighbor_columns >= 0) & (neighbor_columns < shape[1]))
+        np.clip(neighbor_rows, 0, shape[0] - 1, out=neighbor_rows)
+        np.clip(neighbor_columns, 0, shape[1] - 1, out=neighbor_columns)
+        usable &= ~defective[neighbor_rows, neighbor_columns]
+
+        repairable = usable.any(axis=1)
+
+        self._rows = rows[repairable]
+        self._columns = columns[repairable]
+        self._neighbor_rows = neighbor_rows[repairable]
+        self._neighbor_columns = neighbor_columns[repairable]
+        self._unusable = ~usable[repairable]
+
+    @property
+    def shape(self) -> tuple:
+        """
+        Retrieves the shape of the data the map applies to
+
+        :return: the data shape
+        :rtype: tuple
+        """
+        return self._shape
+
+    @property
+    def count(self) -> int:
+        """
+        Retrieves the number of repairable defective pixels
+
+        :return: the number of repairable defective pixels
+        :rtype: int
+        """
+        return self._rows.size
+
+    @log
+    def repair(self, data: np.ndarray):
+        """
+        Replaces, in place, each defective pixel by the median of its usable neighbors.
+
+        :param data: the data to repair
+        :type data: numpy.ndarray
+        """
+        neighbor_values = np.asarray(data[self._neighbor_rows, self._neighbor_columns], dtype=np.float32)
+        neighbor_values[self._unusable] = np.nan
+        repaired_values = np.nanmedian(neighbor_values, axis=1)
+
+        if issubclass(data.dtype.type, np.integer):
+            np.rint(repaired_values, out=repaired_values)
+
+        data[self._rows, self._columns] = repaired_values
+
+
+class CosmeticCorrection(ImageProcessor):
+    """
+    Provides defective pixels repair, using a defect map built from master dark.
+
+    Hot and cold pixels are found in master dark only once, and their coordinates are cached. Per frame cost only
+    depends on defects count. Raw CFA data is repaired using neighbors of the same color, so this works before
+    debayering.
+
+    Defect map is built again when master dark file path or modification time, binning mode, bayer pattern or
+    detection threshold change.
+    """
+
+    @log
+    def __init__(self):
+        super().__init__()
+        # restack loads frames from several threads at once
+        self._lock = threading.Lock()
+        self._defect_map_key: tuple = None
+        self._defect_map: DefectMap = None
+
+    @log
+    def process_image(self, image: Image):
+
+        use_defect_map = config.get_use_defect_map()
+
+        _LOGGER.debug(f"Defect map correction enabled : {use_defect_map}")
+
+        if not use_defect_map:
+            with self._lock:
+                self._defect_map_key = None
+                self._defect_map = None
+            return image
+
+        if image.is_color():
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Defect map correction cannot work on debayered color images."))
+            return image
+
+        with self._lock:
+            defect_map = self._get_defect_map(image)
+
+        if defect_map is None:
+            return image
+
+        if defect_map.shape != image.data.shape:
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Data structure inconsistency. Light: {} vs Defect map: {}. "
+                                      "Defect map correction is SKIPPED"),
+                [image.data.shape, defect_map.shape])
+            return image
+
+        if not image.data.flags.writeable:
+            image.data = image.data.copy()
+
+        with Timer() as repair_timer:
+            defect_map.repair(image.data)
+        image.mark_data_modified()
+
+        _LOGGER.debug(f"Repaired {defect_map.count} defective pixels in {repair_timer.elapsed_in_milli_as_str} ms")
+
+        return image
+
+    @log
+    def _get_defect_map(self, image: Image) -> DefectMap:
+        """
+        Retrieves the defect map for a light frame, only building it if cache is invalid.
+
+        :param image: the light frame
+        :type image: Image
+
+        :return: the defect map, or None if master dark could not be used
+        :rtype: DefectMap
+        """
+        step = 2 if get_effective_bayer_pattern(image) else 1
+        dark_path = Path(config.get_master_dark_file_path())
+
+        try:
+            dark_modification_time = dark_path.stat().st_mtime
+        except OSError:
+            dark_modification_time = None
+
+        defect_map_key = (str(dark_path),
+                          dark_modification_time,
+                          config.get_binning_mode(),
+                          step,
+                          config.get_defect_map_sigma())
+
+        if defect_map_key == self._defect_map_key:
+            return self._defect_map
+
+        dark = als_input.read_disk_image(dark_path)
+
+        if dark is None or dark.data.ndim != 2:
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Could not use dark {} to build defect map. Defect map correction is SKIPPED"),
+                [str(dark_path), ])
+            return None
+
+        # lights are binned before reaching us, so dark must be binned the same way
+        Binning.bin_image(dark, config.get_binning_mode())
+
+        with Timer() as build_timer:
+            rows, columns = find_defective_pixels(dark.data, config.get_defect_map_sigma(), step)
+            defect_map = DefectMap(dark.data.shape, rows, columns, step)
+
+        _LOGGER.debug(f"Defect map built in {build_timer.elapsed_in_milli_as_str} ms")
+        MESSAGE_HUB.dispatch_info(__name__,
+                                  QT_TRANSLATE_NOOP("", "Defect map built from {} : {} defective pixels"),
+                                  [str(dark_path), defect_map.count])
+
+        self._defect_map_key = defect_map_key
+        self._defect_map = defect_map
+
+        return defect_map
+
+
+# pylint: disable=R0902
+class MasterDarkBuilder(QueueConsumer):
+    """
+    Integrates dark frames into a master dark, as they arrive.
+
+    Frames are integrated with a streaming kappa-sigma clipping accumulator. Memory use only depends on frame size,
+    not on frames count : no frame is kept.
+
+    Resulting master dark is saved as a FITS file, with the data type of the dark frames, and headers describing
+    acquisition settings. So it can be used as is for dark subtraction, or stored in calibration library.
+    """
+
+    @log
+    def __init__(self, queue: SignalingQueue):
+        QueueConsumer.__init__(self, "master dark", queue)
+        self._lock = threading.Lock()
+        self._accumulator: SigmaClipAccumulator = None
+        self._reference: Image = None
+        self._temperatures_sum = 0.
+        self._temperatures_count = 0
+        self._submitted_count = 0
+        self._handled_count = 0
+
+    @property
+    def size(self) -> int:
+        """
+        Retrieves how many frames are integrated in master dark
+
+        :return: how many frames are integrated
+        :rtype: int
+        """
+        return self._accumulator.count if self._accumulator is not None else 0
+
+    @log
+    def submit(self, image: Image):
+        """
+        Queues a dark frame for integration
+
+        :param image: the dark frame
+        :type image: Image
+        """
+        with self._lock:
+            self._submitted_count += 1
+        self._queue.put(image)
+
+    @log
+    def reset(self):
+        """
+        Forgets all integrated frames
+        """
+        with self._lock:
+            self._accumulator = None
+            self._reference = None
+            self._temperatures_sum = 0.
+            self._temperatures_count = 0
+
+    @log
+    def _handle_image(self, image: Image):
+
+        with self._lock:
+            try:
+                self._integrate(image)
+            finally:
+                self._handled_count += 1
+
+    @log
+    def _integrate(self, image: Image):
+        """
+        Integrates a dark frame, if it is consistent with the first integrated one.
+
+        :param image: the dark frame
+        :type image: Image
+        """
+        if self._reference is None:
+            self._reference = image
+            self._accumulator = SigmaClipAccumulator(image.data.shape, removable_frames_count=0)
+
+        elif not image.is_same_shape_as(self._reference):
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Dark frame {} shape differs from previous ones : {} vs {}. It is IGNORED"),
+                [image.origin, image.data.shape, self._reference.data.shape])
+            return
+
+        elif image.acquisition.get(ACQUISITION_EXPOSURE) != self._reference.acquisition.get(ACQUISITION_EXPOSURE):
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP("", "Dark frame {} exposure differs from previous ones : {} vs {}. It is IGNORED"),
+                [image.origin,
+                 image.acquisition.get(ACQUISITION_EXPOSURE),
+                 self._reference.acquisition.get(ACQUISITION_EXPOSURE)])
+            return
+
+        self._accumulator.add(np.asarray(image.data, dtype=np.float32))
+
+        temperature = image.acquisition.get(ACQUISITION_TEMPERATURE)
+        if temperature is not None:
+            self._temperatures_sum += temperature
+            self._temperatures_count += 1
+
+        MESSAGE_HUB.dispatch_info(__name__,
+                                  QT_TRANSLATE_NOOP("", "Master dark : {} frame(s) integrated"),
+                                  [self._accumulator.count])
+
+    @log
+    def save(self, folder_path: str) -> Path:
+        """
+        Saves master dark to a new FITS file, once all submitted frames are integrated, then forgets all frames.
+
+        :param folder_path: path of the folder to save master dark to
+        :type folder_path: str
+
+        :return: path of the saved master dark, or None if no frame was integrated
+        :rtype: pathlib.Path
+
+        :raises: OSError if master dark file could not be written
+        """
+        while self._handled_count < self._submitted_count and not self._stop_asked:
+            time.sleep(_MASTER_DARK_WAIT_PERIOD_IN_SEC)
+
+        with self._lock:
+
+            if self._accumulator is None:
+                return None
+
+            data = self._accumulator.get_result()
+            dtype = self._reference.data.dtype
+
+            if issubclass(dtype.type, np.integer):
+                np.rint(data, out=data)
+                np.clip(data, np.iinfo(dtype).min, np.iinfo(dtype).max, out=data)
+                data = data.astype(dtype)
+
+            header_values = {
+                'IMAGETYP': "Master Dark",
+                'NCOMBINE': self._accumulator.count,
+            }
+
+            header_keywords = {
+                ACQUISITION_EXPOSURE: 'EXPTIME',
+                ACQUISITION_GAIN: 'GAIN',
+                ACQUISITION_BINNING: 'XBINNING',
+            }
+
+            for setting, keyword in header_keywords.items():
+                if setting in self._reference.acquisition:
+                    header_values[keyword] = self._reference.acquisition[setting]
+
+            if self._temperatures_count > 0:
+                header_values['CCD-TEMP'] = self._temperatures_sum / self._temperatures_count
+
+            if self._reference.bayer_pattern:
+                header_values['BAYERPAT'] = self._reference.bayer_pattern
+
+            timestamp = time.strftime("%Y-%m-%d-%H-%M-%S")
+            target_path = Path(folder_path) / f"{_MASTER_DARK_FILE_NAME_BASE}-{timestamp}.fits"
+
+            save_fits(data, target_path, header_values)
+
+            self._accumulator = None
+            self._reference = None
+            self._temperatures_sum = 0.
+            self._temperatures_count = 0
+
+        return target_path
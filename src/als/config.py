@@ -23,7 +23,7 @@ from configparser import ConfigParser, DuplicateOptionError, ParsingError
 from pathlib import Path
 
 from als.code_utilities import AlsException
-from als.model.data import IMAGE_SAVE_TYPE_JPEG, DYNAMIC_DATA
+from als.model.data import IMAGE_SAVE_TYPE_JPEG, DYNAMIC_DATA, BINNING_MODE_NONE, BINNING_MODES
 
 _CONFIG_FILE_PATH = os.path.expanduser("~/.als.cfg")
 
@@ -39,6 +39,7 @@ _IMAGE_SAVE_FORMAT = "image_save_format"
 _FULL_SCREEN = "full_screen"
 _WWW_REFRESH_PERIOD = "web_refresh_period"
 _MINIMUM_MATCH_COUNT = "alignment_minimum_match_count"
+_STACKING_WINDOW_SIZE = "stacking_window_size"
 _USE_MASTER_DARK = "use_master_dark"
 _MASTER_DARK_FILE_PATH = "master_dark_file_path"
 _USE_HOT_PIXEL_REMOVER = "use_hot_pixel_remover"
@@ -46,6 +47,16 @@ _LANG = "lang"
 _BAYER_PATTERN = "bayer_pattern"
 _NIGHT_MODE = "night_mode"
 _SAVE_ON_STOP = "save_on_stop"
+_USE_FRAME_QUALITY_FILTER = "use_frame_quality_filter"
+_STACK_CFA = "stack_cfa"
+_BINNING_MODE = "binning_mode"
+_USE_CALIBRATION_LIBRARY = "use_calibration_library"
+_CALIBRATION_LIBRARY_FOLDER_PATH = "calibration_library_folder_path"
+_USE_DEFECT_MAP = "use_defect_map"
+_DEFECT_MAP_SIGMA = "defect_map_sigma"
+_QUALITY_MINIMUM_STAR_COUNT = "quality_minimum_star_count"
+_QUALITY_MAXIMUM_BACKGROUND = "quality_maximum_background"
+_QUALITY_MAXIMUM_FWHM = "quality_maximum_fwhm"
 
 # keys used to describe logging level
 _LOG_LEVEL_DEBUG = "DEBUG"
@@ -76,6 +87,7 @@ _DEFAULTS = {
     _FULL_SCREEN:           0,
     _WWW_REFRESH_PERIOD:    5,
     _MINIMUM_MATCH_COUNT:   25,
+    _STACKING_WINDOW_SIZE:  50,
     _USE_MASTER_DARK:       0,
     _MASTER_DARK_FILE_PATH: "",
     _USE_HOT_PIXEL_REMOVER: 0,
@@ -83,6 +95,16 @@ _DEFAULTS = {
     _BAYER_PATTERN:         "AUTO",
     _NIGHT_MODE:            1,
     _SAVE_ON_STOP:          0,
+    _USE_FRAME_QUALITY_FILTER:      0,
+    _STACK_CFA:                     0,
+    _BINNING_MODE:                  BINNING_MODE_NONE,
+    _USE_CALIBRATION_LIBRARY:       0,
+    _CALIBRATION_LIBRARY_FOLDER_PATH: os.path.expanduser("~/als/calibration"),
+    _USE_DEFECT_MAP:                0,
+    _DEFECT_MAP_SIGMA:              5.,
+    _QUALITY_MINIMUM_STAR_COUNT:    10,
+    _QUALITY_MAXIMUM_BACKGROUND:    0,
+    _QUALITY_MAXIMUM_FWHM:          0.,
 }
 _MAIN_SECTION_NAME = "main"
 
@@ -196,6 +218,125 @@ def get_hot_pixel_remover():
         return int(_DEFAULTS[_USE_HOT_PIXEL_REMOVER]) == 1
 
 
+def set_stack_cfa(stack_cfa: bool):
+    """
+    Set 'stack raw CFA data' flag
+
+    :param stack_cfa: should we stack raw CFA frames and only debayer stacking results ?
+    :type stack_cfa: bool
+    """
+
+    _set(_STACK_CFA, "1" if stack_cfa else "0")
+
+
+def get_stack_cfa():
+    """
+    Get 'stack raw CFA data' flag
+
+    :return: True if app should stack raw CFA frames and only debayer stacking results, False otherwise
+    :rtype: bool
+    """
+
+    try:
+        return int(_get(_STACK_CFA)) == 1
+    except ValueError:
+        return int(_DEFAULTS[_STACK_CFA]) == 1
+
+
+def set_use_frame_quality_filter(use_filter: bool):
+    """
+    Set 'use frame quality filter' flag
+
+    :param use_filter: should we reject poor quality frames before stacking ?
+    :type use_filter: bool
+    """
+
+    _set(_USE_FRAME_QUALITY_FILTER, "1" if use_filter else "0")
+
+
+def get_use_frame_quality_filter():
+    """
+    Get 'use frame quality filter' flag
+
+    :return: True if app should reject poor quality frames before stacking, False otherwise
+    :rtype: bool
+    """
+
+    try:
+        return int(_get(_USE_FRAME_QUALITY_FILTER)) == 1
+    except ValueError:
+        return int(_DEFAULTS[_USE_FRAME_QUALITY_FILTER]) == 1
+
+
+def get_quality_minimum_star_count():
+    """
+    Retrieves the minimum star count of a frame for it to be stacked. 0 means no check.
+
+    :return: the minimum star count
+    :rtype: int
+    """
+    try:
+        return int(_get(_QUALITY_MINIMUM_STAR_COUNT))
+    except ValueError:
+        return _DEFAULTS[_QUALITY_MINIMUM_STAR_COUNT]
+
+
+def set_quality_minimum_star_count(star_count):
+    """
+    Sets the minimum star count of a frame for it to be stacked. 0 means no check.
+
+    :param star_count: the minimum star count
+    :type star_count: int
+    """
+    _set(_QUALITY_MINIMUM_STAR_COUNT, str(star_count))
+
+
+def get_quality_maximum_background():
+    """
+    Retrieves the maximum background level of a frame for it to be stacked. 0 means no check.
+
+    :return: the maximum background level
+    :rtype: int
+    """
+    try:
+        return int(_get(_QUALITY_MAXIMUM_BACKGROUND))
+    except ValueError:
+        return _DEFAULTS[_QUALITY_MAXIMUM_BACKGROUND]
+
+
+def set_quality_maximum_background(background):
+    """
+    Sets the maximum background level of a frame for it to be stacked. 0 means no check.
+
+    :param background: the maximum background level
+    :type background: int
+    """
+    _set(_QUALITY_MAXIMUM_BACKGROUND, str(background))
+
+
+def get_quality_maximum_fwhm():
+    """
+    Retrieves the maximum star FWHM of a frame, in pixels, for it to be stacked. 0 means no check.
+
+    :return: the maximum FWHM
+    :rtype: float
+    """
+    try:
+        return float(_get(_QUALITY_MAXIMUM_FWHM))
+    except ValueError:
+        return _DEFAULTS[_QUALITY_MAXIMUM_FWHM]
+
+
+def set_quality_maximum_fwhm(fwhm):
+    """
+    Sets the maximum star FWHM of a frame, in pixels, for it to be stacked. 0 means no check.
+
+    :param fwhm: the maximum FWHM
+    :type fwhm: float
+    """
+    _set(_QUALITY_MAXIMUM_FWHM, str(fwhm))
+
+
 def set_save_on_stop(save_on_stop: bool):
     """
     Set 'save on stop' flag
@@ -360,6 +501,116 @@ def set_bayer_pattern(pattern):
     _set(_BAYER_PATTERN, pattern)
 
 
+def get_use_calibration_library():
+    """
+    Get use calibration library flag
+
+    :return: True if light frames are calibrated using masters from calibration library, False otherwise
+    :rtype: bool
+    """
+    try:
+        return int(_get(_USE_CALIBRATION_LIBRARY)) == 1
+    except ValueError:
+        return _DEFAULTS[_USE_CALIBRATION_LIBRARY] == 1
+
+
+def set_use_calibration_library(use_library: bool):
+    """
+    Set use calibration library flag
+
+    :param use_library: Calibrate light frames using masters from calibration library ?
+    :type use_library: bool
+    """
+    _set(_USE_CALIBRATION_LIBRARY, "1" if use_library else "0")
+
+
+def get_calibration_library_folder_path():
+    """
+    Retrieves the path of the folder holding master darks, flats and biases.
+
+    :return: the calibration library folder path
+    :rtype: str
+    """
+    return _get(_CALIBRATION_LIBRARY_FOLDER_PATH)
+
+
+def set_calibration_library_folder_path(path):
+    """
+    Sets the path of the folder holding master darks, flats and biases.
+
+    :param path: the calibration library folder path
+    :type path: str
+    """
+    _set(_CALIBRATION_LIBRARY_FOLDER_PATH, path)
+
+
+def get_use_defect_map():
+    """
+    Get use defect map flag
+
+    :return: True if defective pixels found in master dark are repaired in light frames, False otherwise
+    :rtype: bool
+    """
+    try:
+        return int(_get(_USE_DEFECT_MAP)) == 1
+    except ValueError:
+        return _DEFAULTS[_USE_DEFECT_MAP] == 1
+
+
+def set_use_defect_map(use_defect_map: bool):
+    """
+    Set use defect map flag
+
+    :param use_defect_map: Repair defective pixels found in master dark ?
+    :type use_defect_map: bool
+    """
+    _set(_USE_DEFECT_MAP, "1" if use_defect_map else "0")
+
+
+def get_defect_map_sigma():
+    """
+    Retrieves how many standard deviations a master dark pixel must be away from the median to be defective.
+
+    :return: the defect detection threshold, in standard deviations
+    :rtype: float
+    """
+    try:
+        return float(_get(_DEFECT_MAP_SIGMA))
+    except ValueError:
+        return _DEFAULTS[_DEFECT_MAP_SIGMA]
+
+
+def set_defect_map_sigma(sigma):
+    """
+    Sets how many standard deviations a master dark pixel must be away from the median to be defective.
+
+    :param sigma: the defect detection threshold, in standard deviations
+    :type sigma: float
+    """
+    _set(_DEFECT_MAP_SIGMA, str(sigma))
+
+
+def get_binning_mode():
+    """
+    Retrieves software binning mode
+
+    :return: the binning mode, one of als.model.data.BINNING_MODES
+    :rtype: str
+    """
+    binning_mode = _get(_BINNING_MODE)
+    return binning_mode if binning_mode in BINNING_MODES else _DEFAULTS[_BINNING_MODE]
+
+
+def set_binning_mode(binning_mode):
+    """
+    Sets software binning mode
+
+    :param binning_mode: the binning mode, one of als.model.data.BINNING_MODES
+    :type binning_mode: str
+    """
+    _set(_BINNING_MODE, binning_mode)
+
+
 def get_lang():
     """
     Retrieves preferred language
@@ -443,6 +694,29 @@ def set_minimum_match_count(minimum_match_count):
     _set(_MINIMUM_MATCH_COUNT, str(minimum_match_count))
 
 
+def get_stacking_window_size():
+    """
+    Retrieves the number of most recent frames used by windowed stacking modes.
+
+    :return: the stacking window size
+    :rtype: int
+    """
+    try:
+        return int(_get(_STACKING_WINDOW_SIZE))
+    except ValueError:
+        return _DEFAULTS[_STACKING_WINDOW_SIZE]
+
+
+def set_stacking_window_size(window_size):
+    """
+    Sets the number of most recent frames used by windowed stacking modes.
+
+    :param window_size: the stacking window size
+    :type window_size: int
+    """
+    _set(_STACKING_WINDOW_SIZE, str(window_size))
+
+
 def set_use_master_dark(use_dark: bool):
     """
     Set use dark flag
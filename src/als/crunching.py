@@ -2,14 +2,47 @@
 A set of shared utilities for number crunching
 """
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+import cv2
 import numpy as np
+from scipy.ndimage import maximum_filter
+
 from als.code_utilities import log
 
 from als.model.data import HistogramContainer
 
 _LOGGER = logging.getLogger(__name__)
 
+_QUALITY_MAX_SIZE = 1024
+_QUALITY_DETECTION_SIGMA = 5
+_QUALITY_FWHM_STAR_COUNT = 30
+_QUALITY_FWHM_RADIUS = 3
+_SIGMA_TO_FWHM = 2 * np.sqrt(2 * np.log(2))
+_CALIBRATION_CHUNK_SIZE = 2**16
+_MAD_TO_SIGMA = 1.4826
+
+# adaptive equalization works on 14 bits levels and a 8x8 tiles grid, like scikit-image does by default
+_EQUALIZATION_MAX_LEVEL = 2**14 - 1
+_EQUALIZATION_TILES_GRID = (8, 8)
+
+# screen transfer function clips shadows at that many background noise sigmas below background median
+_SCREEN_TRANSFER_SHADOWS_CLIPPING = -2.8
+
+_WORKER_COUNT = os.cpu_count() or 1
+
+# per thread work buffers of hot pixel removal, as restack pre-processes frames in several threads
+_HOT_PIXELS_BUFFERS = threading.local()
+
+# data types whose 3x3 neighbor sums are computed exactly, as float32, by OpenCV box filter
+_HOT_PIXELS_FILTERED_TYPES = (np.uint8, np.uint16, np.int16, np.float32)
+
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR: ThreadPoolExecutor = None
+
 
 @log
 def compute_histograms_for_display(image, bin_count):
@@ -43,3 +76,654 @@ def _compute_single_channel_histogram_for_display(channel_data, bin_count):
             break
 
     return histogram
+
+
+@log
+def bin_data(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Bins 2D data by averaging blocks of factor x factor pixels.
+
+    Trailing rows and columns not filling a whole block are dropped.
+
+    :param data: the data to bin
+    :type data: numpy.ndarray
+
+    :param factor: the bin factor
+    :type factor: int
+
+    :return: the binned data, as float32
+    :rtype: numpy.ndarray
+    """
+    height = data.shape[0] // factor
+    width = data.shape[1] // factor
+
+    blocks = data[:height * factor, :width * factor].reshape(height, factor, width, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+@log
+def bin_cfa(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Bins raw CFA data, preserving Bayer phase.
+
+    Each of the 4 Bayer sub-planes is binned on its own, then written back to its sites in the result, so colors
+    never get mixed and the result keeps the same bayer pattern.
+
+    Trailing rows and columns not filling a whole block of 2 x factor pixels are dropped.
+
+    :param data: CFA data
+    :type data: numpy.ndarray
+
+    :param factor: the bin factor
+    :type factor: int
+
+    :return: the binned CFA data, as float32
+    :rtype: numpy.ndarray
+    """
+    height = data.shape[0] // (2 * factor) * 2
+    width = data.shape[1] // (2 * factor) * 2
+
+    result = np.empty((height, width), dtype=np.float32)
+
+    for row_offset in (0, 1):
+        for column_offset in (0, 1):
+            sub_plane = data[row_offset:height * factor:2, column_offset:width * factor:2]
+            result[row_offset::2, column_offset::2] = bin_data(sub_plane, factor)
+
+    return result
+
+
+@log
+def superpixel_debayer(data: np.ndarray, bayer_pattern: str) -> np.ndarray:
+    """
+    Debayers raw CFA data by turning each 2x2 Bayer cell into a single RGB pixel.
+
+    Red and blue come from their single site, green is the mean of both green sites. No interpolation is involved
+    and resolution is halved on both axes.
+
+    :param data: CFA data
+    :type data: numpy.ndarray
+
+    :param bayer_pattern: the Bayer pattern, like 'RGGB'
+    :type bayer_pattern: str
+
+    :return: RGB data, as float32, with colors on first axis
+    :rtype: numpy.ndarray
+    """
+    height = data.shape[0] // 2 * 2
+    width = data.shape[1] // 2 * 2
+
+    result = np.zeros((3, height // 2, width // 2), dtype=np.float32)
+
+    for index, color in enumerate(bayer_pattern[:4]):
+        row_offset, column_offset = index // 2, index % 2
+        result['RGB'.index(color)] += data[row_offset:height:2, column_offset:width:2]
+
+    result[1] *= .5
+    return result
+
+
+@log
+def calibrate(data: np.ndarray, offset: np.ndarray, flat_reciprocal: np.ndarray) -> np.ndarray:
+    """
+    Calibrates light frame data : offset is subtracted, result is multiplied by flat reciprocal then clipped to 0.
+
+    Work is done on chunks of rows small enough to stay in CPU cache, so each pixel only goes through memory once.
+
+    :param data: light frame data
+    :type data: numpy.ndarray
+
+    :param offset: float32 data to subtract, like a master dark. Same shape as data. None to skip subtraction
+    :type offset: numpy.ndarray
+
+    :param flat_reciprocal: float32 data to multiply by. Same shape as data. None to skip multiplication
+    :type flat_reciprocal: numpy.ndarray
+
+    :return: the calibrated data, as float32
+    :rtype: numpy.ndarray
+    """
+    result = np.empty(data.shape, dtype=np.float32)
+    rows_per_chunk = max(1, _CALIBRATION_CHUNK_SIZE // max(1, data[0].size))
+
+    for start_row in range(0, data.shape[0], rows_per_chunk):
+
+        rows = slice(start_row, start_row + rows_per_chunk)
+        chunk = result[rows]
+
+        if offset is not None:
+            np.subtract(data[rows], offset[rows], out=chunk)
+        else:
+            chunk[...] = data[rows]
+
+        if flat_reciprocal is not None:
+            np.multiply(chunk, flat_reciprocal[rows], out=chunk)
+
+        np.maximum(chunk, 0, out=chunk)
+
+    return result
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Retrieves the thread pool shared by number crunching functions working over row bands. Pool is created on first
+    call.
+
+    :return: the thread pool
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _EXECUTOR  # pylint: disable=W0603
+
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=_WORKER_COUNT, thread_name_prefix="crunching")
+
+    return _EXECUTOR
+
+
+@lru_cache(maxsize=4)
+def _neighbor_count_reciprocals(shape: tuple) -> np.ndarray:
+    """
+    Computes, for each pixel, the reciprocal of its neighbor count : 8 for inner pixels, 5 on borders, 3 in corners.
+
+    Result only depends on shape, so it is cached.
+
+    :param shape: the data shape
+    :type shape: tuple
+
+    :return: the reciprocals, as float32
+    :rtype: numpy.ndarray
+    """
+    counts = cv2.boxFilter(np.ones(shape, dtype=np.float32), -1, (3, 3), normalize=False,
+                           borderType=cv2.BORDER_CONSTANT)
+    counts -= 1
+    return np.reciprocal(counts)
+
+
+@log
+def replace_hot_pixels(data: np.ndarray, ratio: float) -> int:
+    """
+    Replaces, in place, each pixel more than ratio times brighter than the mean of its 8 neighbors by that mean.
+
+    Means of integer data are truncated to data type.
+
+    Neighbor sums of data types OpenCV filters exactly come from a single 3x3 box filter, minus the center pixel.
+    Non native byte order data, like FITS data read by astropy, is processed in native byte order, then written back.
+    Other data types are processed by numpy, in float64.
+
+    :param data: 2D data, modified in place
+    :type data: numpy.ndarray
+
+    :param ratio: the hot pixel ratio
+    :type ratio: float
+
+    :return: how many pixels were replaced
+    :rtype: int
+    """
+    if data.dtype.type not in _HOT_PIXELS_FILTERED_TYPES:
+        return _replace_hot_pixels_with_numpy(data, ratio)
+
+    if not data.dtype.isnative:
+        native_data = data.astype(data.dtype.newbyteorder('='))
+        replaced_count = _replace_hot_pixels_with_box_filter(native_data, ratio)
+        data[...] = native_data
+        return replaced_count
+
+    return _replace_hot_pixels_with_box_filter(data, ratio)
+
+
+def _replace_hot_pixels_with_box_filter(data: np.ndarray, ratio: float) -> int:
+    """
+    Replaces hot pixels of native byte order data OpenCV can filter. See replace_hot_pixels()
+
+    Neighbor means come from a box filter and a neighbor count only depending on shape. Per pixel work is then done
+    over row bands, in several threads, using per thread preallocated buffers.
+    """
+    buffers = getattr(_HOT_PIXELS_BUFFERS, 'buffers', None)
+
+    if buffers is None or buffers[0].shape != data.shape:
+        buffers = (np.empty(data.shape, dtype=np.float32),
+                   np.empty(data.shape, dtype=np.float32),
+                   np.empty(data.shape, dtype=bool))
+        _HOT_PIXELS_BUFFERS.buffers = buffers
+
+    means, thresholds, hot_pixels = buffers
+    reciprocals = _neighbor_count_reciprocals(data.shape)
+    truncate = issubclass(data.dtype.type, np.integer)
+    signed = not issubclass(data.dtype.type, np.unsignedinteger)
+
+    # OpenCV filters are multi-threaded on their own
+    cv2.boxFilter(data, cv2.CV_32F, (3, 3), dst=means, normalize=False, borderType=cv2.BORDER_CONSTANT)
+
+    def process_band(rows):
+        np.subtract(means[rows], data[rows], out=means[rows])
+        np.multiply(means[rows], reciprocals[rows], out=means[rows])
+        if truncate:
+            np.trunc(means[rows], out=means[rows])
+        np.multiply(means[rows], ratio, out=thresholds[rows])
+        _find_hot_pixels(data[rows], means[rows], thresholds[rows], signed, hot_pixels[rows])
+        np.copyto(data[rows], means[rows], casting='unsafe', where=hot_pixels[rows])
+        return int(np.count_nonzero(hot_pixels[rows]))
+
+    rows_per_band = -(-data.shape[0] // _WORKER_COUNT)
+    bands = [slice(start_row, start_row + rows_per_band) for start_row in range(0, data.shape[0], rows_per_band)]
+
+    if len(bands) == 1:
+        return process_band(bands[0])
+
+    return sum(_get_executor().map(process_band, bands))
+
+
+def _replace_hot_pixels_with_numpy(data: np.ndarray, ratio: float) -> int:
+    """
+    Replaces hot pixels of any data type. See replace_hot_pixels()
+
+    Neighbor means are computed in float64.
+    """
+    means = _sum_neighbors(data.astype(np.float64))
+    means /= _sum_neighbors(np.ones(data.shape))
+    means = means.astype(data.dtype).astype(np.float64)
+
+    hot_pixels = np.empty(data.shape, dtype=bool)
+    _find_hot_pixels(data, means, means * ratio, not issubclass(data.dtype.type, np.unsignedinteger), hot_pixels)
+    np.copyto(data, means, casting='unsafe', where=hot_pixels)
+
+    return int(np.count_nonzero(hot_pixels))
+
+
+def _sum_neighbors(data: np.ndarray) -> np.ndarray:
+    """
+    Sums the 8 neighbors of each pixel, from shifted views of zero padded data.
+
+    :param data: 2D data
+    :type data: numpy.ndarray
+
+    :return: the neighbor sums
+    :rtype: numpy.ndarray
+    """
+    padded = np.pad(data, 1, mode='constant')
+    height, width = data.shape
+
+    sums = -data
+    for row in range(3):
+        for column in range(3):
+            sums += padded[row:row + height, column:column + width]
+
+    return sums
+
+
+def _find_hot_pixels(data, means, thresholds, signed, hot_pixels):
+    """
+    Flags pixels whose ratio to their neighbors mean is above threshold ratio.
+
+    Comparing data to mean * ratio saves a division, but its direction is reversed where mean is negative, which only
+    happens for signed data.
+    """
+    np.greater(data, thresholds, out=hot_pixels)
+
+    if signed:
+        negatives = means < 0
+        if negatives.any():
+            hot_pixels[negatives] = data[negatives] < thresholds[negatives]
+
+
+@log
+def find_defective_pixels(data: np.ndarray, sigma: float, step: int):
+    """
+    Finds pixels too far from the median of their sub-plane : hot and cold pixels of a master dark.
+
+    Data is split into step x step sub-planes, so raw CFA data, with a step of 2, is analyzed per color. Noise is
+    estimated from median absolute deviation, so defects themselves do not skew it.
+
+    :param data: 2D data, like a master dark
+    :type data: numpy.ndarray
+
+    :param sigma: how many standard deviations away from the median a defective pixel is
+    :type sigma: float
+
+    :param step: sub-plane step : 1 for mono data, 2 for raw CFA data
+    :type step: int
+
+    :return: rows and columns of defective pixels
+    :rtype: tuple
+    """
+    all_rows = []
+    all_columns = []
+
+    for row_offset in range(step):
+        for column_offset in range(step):
+
+            plane = np.asarray(data[row_offset::step, column_offset::step], dtype=np.float32)
+            median = np.median(plane)
+            deviations = np.abs(plane - median)
+            noise = float(np.median(deviations)) * _MAD_TO_SIGMA
+
+            if noise == 0:
+                # quantized or synthetic data
+                noise = float(plane.std())
+
+            if noise == 0:
+                continue
+
+            rows, columns = np.nonzero(deviations > sigma * noise)
+            all_rows.append(rows * step + row_offset)
+            all_columns.append(columns * step + column_offset)
+
+    if not all_rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    return np.concatenate(all_rows), np.concatenate(all_columns)
+
+
+@log
+def apply_lut(data: np.ndarray, luts: np.ndarray, low: float, high: float) -> np.ndarray:
+    """
+    Maps data through per-channel lookup tables.
+
+    Data range [low, high] is quantized to lookup table size. Work is done over row bands of each channel, in several
+    threads.
+
+    :param data: 2D data, or color data with colors on first axis. All values must be in [low, high]
+    :type data: numpy.ndarray
+
+    :param luts: one lookup table for 2D data, or one lookup table per channel for color data
+    :type luts: numpy.ndarray
+
+    :param low: data value mapped by first lookup table entry
+    :type low: float
+
+    :param high: data value mapped by last lookup table entry. Must be greater than low
+    :type high: float
+
+    :return: the mapped data, with the lookup tables data type
+    :rtype: numpy.ndarray
+    """
+    channels = data if data.ndim > 2 else data[np.newaxis]
+    channel_luts = luts if luts.ndim > 1 else luts[np.newaxis]
+
+    result = np.empty(channels.shape, dtype=luts.dtype)
+
+    scale = (channel_luts.shape[1] - 1) / (high - low)
+    # adding .5 before truncation rounds to nearest entry, as all values are positive
+    offset = .5 - low * scale
+
+    rows_per_band = -(-channels.shape[1] // _WORKER_COUNT)
+    bands = [(channel, slice(start_row, start_row + rows_per_band))
+             for channel in range(channels.shape[0])
+             for start_row in range(0, channels.shape[1], rows_per_band)]
+
+    def process_band(band):
+        channel, rows = band
+        indices = np.multiply(channels[channel, rows], scale, dtype=np.float32)
+        indices += offset
+        np.take(channel_luts[channel], indices.astype(np.uint16), out=result[channel, rows])
+
+    if _WORKER_COUNT == 1:
+        for band in bands:
+            process_band(band)
+    else:
+        list(_get_executor().map(process_band, bands))
+
+    return result if data.ndim > 2 else result[0]
+
+
+@log
+def equalize_adaptive(data: np.ndarray, clip_limit: float) -> np.ndarray:
+    """
+    Performs contrast limited adaptive histogram equalization (CLAHE) of 2D data.
+
+    Data range is first mapped to 14 bits levels. Equalization itself is done by OpenCV, whose tiles are processed in
+    parallel and whose tile lookup tables are bilinearly interpolated.
+
+    :param data: 2D data
+    :type data: numpy.ndarray
+
+    :param clip_limit: histogram clipping limit, as a fraction of tile pixel count, like
+      skimage.exposure.equalize_adapthist() clip_limit
+    :type clip_limit: float
+
+    :return: equalized data, in [0, 1], as float32
+    :rtype: numpy.ndarray
+    """
+    levels = cv2.normalize(data, None, 0, _EQUALIZATION_MAX_LEVEL, cv2.NORM_MINMAX, dtype=cv2.CV_16U)
+
+    # OpenCV clip limit is relative to mean count of its 65536 histogram bins
+    clahe = cv2.createCLAHE(clipLimit=clip_limit * 2**16, tileGridSize=_EQUALIZATION_TILES_GRID)
+    equalized = clahe.apply(levels)
+
+    return cv2.normalize(equalized, None, 0, 1, cv2.NORM_MINMAX, dtype=cv2.CV_32F)
+
+
+def midtones_transfer(midtones: float, data):
+    """
+    Computes the midtones transfer function, mapping 0 to 0, midtones to .5 and 1 to 1.
+
+    :param midtones: midtones balance, in ]0, 1[
+    :type midtones: float
+
+    :param data: values in [0, 1]
+    :type data: numpy.ndarray or float
+
+    :return: the transferred values
+    :rtype: numpy.ndarray or float
+    """
+    return (midtones - 1) * data / ((2 * midtones - 1) * data - midtones)
+
+
+@log
+def compute_screen_transfer_lut(median: float, deviation: float, target_background: float, size: int) -> np.ndarray:
+    """
+    Computes a screen transfer function lookup table, for data normalized to [0, 1].
+
+    Shadows are clipped a few background noise sigmas below background median, and midtones balance is chosen so
+    background median is mapped to target background.
+
+    :param median: data median, normalized
+    :type median: float
+
+    :param deviation: data median absolute deviation, normalized
+    :type deviation: float
+
+    :param target_background: where background median is mapped, in ]0, 1[
+    :type target_background: float
+
+    :param size: lookup table size. Entry i maps normalized value i / (size - 1)
+    :type size: int
+
+    :return: the lookup table, with values in [0, 1]
+    :rtype: numpy.ndarray
+    """
+    values = np.linspace(0, 1, size)
+
+    shadows = min(max(median + _SCREEN_TRANSFER_SHADOWS_CLIPPING * _MAD_TO_SIGMA * deviation, 0.), 1.)
+
+    if median - shadows <= 0 or shadows >= 1:
+        # flat data : there is no background to adapt to
+        return values.astype(np.float32)
+
+    # midtones balance of the function mapping clipped background median to target background
+    midtones = midtones_transfer(target_background, (median - shadows) / (1 - shadows))
+
+    clipped = np.clip((values - shadows) / (1 - shadows), 0, 1)
+    return np.float32(midtones_transfer(midtones, clipped))
+
+
+@log
+def warp_affine(data: np.ndarray, inverse_matrix: np.ndarray, destination: np.ndarray):
+    """
+    Applies an affine transformation to image data, using bicubic interpolation.
+
+    Color data (color on first axis) is warped channel by channel, with one OpenCV call per channel, as OpenCV cannot
+    write several channels of this layout at once. Work is done in float32 and each channel warp is multi-threaded by
+    OpenCV. Pixels mapped from outside source data are filled with the median value of their channel.
+
+    :param data: source data, 2D or color data with colors on first axis
+    :type data: numpy.ndarray
+
+    :param inverse_matrix: 3x3 matrix mapping destination pixel coordinates to source pixel coordinates
+    :type inverse_matrix: numpy.ndarray
+
+    :param destination: preallocated, C-contiguous float32 array receiving the result. Same shape as data
+    :type destination: numpy.ndarray
+    """
+    source_planes = data if data.ndim > 2 else data[np.newaxis]
+    destination_planes = destination if destination.ndim > 2 else destination[np.newaxis]
+    height, width = source_planes.shape[1:]
+
+    for source_plane, destination_plane in zip(source_planes, destination_planes):
+
+        source_plane = np.asarray(source_plane, dtype=np.float32)
+        fill_value = float(np.median(source_plane[::4, ::4]))
+
+        cv2.warpAffine(source_plane,
+                       inverse_matrix[:2],
+                       (width, height),
+                       dst=destination_plane,
+                       flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+                       borderMode=cv2.BORDER_CONSTANT,
+                       borderValue=fill_value)
+
+
+@log
+def warp_affine_cfa(data: np.ndarray, inverse_matrix: np.ndarray, destination: np.ndarray):
+    """
+    Applies an affine transformation to raw CFA data, preserving Bayer phase.
+
+    Transformation is expressed in green superpixel coordinates (see green_superpixel()). Each of the 4 Bayer
+    sub-planes is warped on its own, with the transformation shifted to the sub-plane origin, then written back to
+    its sites. So colors never get mixed.
+
+    :param data: source CFA data, 2D with even dimensions
+    :type data: numpy.ndarray
+
+    :param inverse_matrix: 3x3 matrix mapping destination superpixel coordinates to source superpixel coordinates
+    :type inverse_matrix: numpy.ndarray
+
+    :param destination: preallocated float32 array receiving the result. Same shape as data
+    :type destination: numpy.ndarray
+    """
+    for row_offset in (0, 1):
+        for column_offset in (0, 1):
+
+            # sub-plane pixel (u, v) sits at superpixel coordinates (u + offset_x, v + offset_y)
+            to_superpixel = np.array([[1, 0, (column_offset - .5) / 2],
+                                      [0, 1, (row_offset - .5) / 2],
+                                      [0, 0, 1]])
+            sub_plane_matrix = np.linalg.inv(to_superpixel) @ inverse_matrix @ to_superpixel
+
+            source_plane = np.ascontiguousarray(data[row_offset::2, column_offset::2], dtype=np.float32)
+            destination_plane = np.empty(source_plane.shape, dtype=np.float32)
+            warp_affine(source_plane, sub_plane_matrix, destination_plane)
+            destination[row_offset::2, column_offset::2] = destination_plane
+
+
+@log
+def green_superpixel(data: np.ndarray, bayer_pattern: str) -> np.ndarray:
+    """
+    Builds a half resolution green image from raw CFA data, averaging both green sites of each 2x2 Bayer cell.
+
+    Superpixel (u, v) center sits at full resolution coordinates (2u + 0.5, 2v + 0.5).
+
+    :param data: CFA data
+    :type data: numpy.ndarray
+
+    :param bayer_pattern: the Bayer pattern, like 'RGGB'
+    :type bayer_pattern: str
+
+    :return: the green superpixel data, as float32
+    :rtype: numpy.ndarray
+    """
+    height = data.shape[0] // 2 * 2
+    width = data.shape[1] // 2 * 2
+    (first_row, first_column), (second_row, second_column) = [
+        (index // 2, index % 2) for index, color in enumerate(bayer_pattern[:4]) if color == 'G']
+
+    superpixel = np.array(data[first_row:height:2, first_column:width:2], dtype=np.float32)
+    superpixel += data[second_row:height:2, second_column:width:2]
+    superpixel *= .5
+    return superpixel
+
+
+@log
+def debayer_bilinear(data: np.ndarray, bayer_pattern: str) -> np.ndarray:
+    """
+    Debayers floating point CFA data using bilinear interpolation, without any loss of precision.
+
+    This is what OpenCV does for integer data.
+
+    :param data: CFA data
+    :type data: numpy.ndarray
+
+    :param bayer_pattern: the Bayer pattern, like 'RGGB'
+    :type bayer_pattern: str
+
+    :return: RGB data, as float32, with colors on last axis
+    :rtype: numpy.ndarray
+    """
+    red_blue_kernel = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32) / 4
+    green_kernel = np.array([[0, 1, 0], [1, 4, 1], [0, 1, 0]], dtype=np.float32) / 4
+
+    result = np.empty((3,) + data.shape, dtype=np.float32)
+
+    for channel, color in enumerate('RGB'):
+        sites = np.zeros(data.shape, dtype=np.float32)
+        for index, site_color in enumerate(bayer_pattern[:4]):
+            if site_color == color:
+                row_offset, column_offset = index // 2, index % 2
+                sites[row_offset::2, column_offset::2] = data[row_offset::2, column_offset::2]
+
+        # reflection around border pixels preserves Bayer phase
+        cv2.filter2D(sites,
+                     cv2.CV_32F,
+                     green_kernel if color == 'G' else red_blue_kernel,
+                     dst=result[channel],
+                     borderType=cv2.BORDER_REFLECT_101)
+
+    return np.moveaxis(result, 0, -1)
+
+
+# pylint: disable=R0914
+@log
+def measure_frame_quality(data: np.ndarray):
+    """
+    Measures cheap frame quality indicators on a decimated copy of 2D data.
+
+    Stars are local maxima standing above background by a few noise sigmas. FWHM is estimated from the second order
+    moments of the brightest stars.
+
+    :param data: 2D data to measure
+    :type data: numpy.ndarray
+
+    :return: star count, background level and approximate FWHM in full resolution pixels (nan if no star was found)
+    :rtype: tuple(int, float, float)
+    """
+    factor = max(1, int(np.ceil(max(data.shape) / _QUALITY_MAX_SIZE)))
+    small = bin_data(data, factor) if factor > 1 else np.asarray(data, dtype=np.float32)
+
+    background = float(np.median(small))
+    noise = 1.4826 * float(np.median(np.abs(small - background)))
+    threshold = background + _QUALITY_DETECTION_SIGMA * max(noise, 1e-6)
+
+    peaks = (small == maximum_filter(small, size=3)) & (small > threshold)
+    rows, columns = np.nonzero(peaks)
+    star_count = len(rows)
+
+    radius = _QUALITY_FWHM_RADIUS
+    height, width = small.shape
+    offsets_y, offsets_x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    fwhm_values = []
+
+    for index in np.argsort(small[rows, columns])[::-1][:_QUALITY_FWHM_STAR_COUNT]:
+        row, column = rows[index], columns[index]
+        if not (radius <= row < height - radius and radius <= column < width - radius):
+            continue
+
+        window = np.clip(small[row - radius:row + radius + 1, column - radius:column + radius + 1] - background, 0, None)
+        total = window.sum()
+        center_x = (window * offsets_x).sum() / total
+        center_y = (window * offsets_y).sum() / total
+        variance = (window * ((offsets_x - center_x) ** 2 + (offsets_y - center_y) ** 2)).sum() / total / 2
+        fwhm_values.append(_SIGMA_TO_FWHM * np.sqrt(variance) * factor)
+
+    fwhm = float(np.median(fwhm_values)) if fwhm_values else float('nan')
+
+    return star_count, background, fwhm
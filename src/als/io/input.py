@@ -28,6 +28,21 @@ _DEFAULT_SCAN_FILE_SIZE_RETRY_PERIOD_IN_SEC = 0.5
 
 SCANNER_TYPE_FILESYSTEM = "FS"
 
+ACQUISITION_FRAME_TYPE = "frame_type"
+ACQUISITION_EXPOSURE = "exposure"
+ACQUISITION_GAIN = "gain"
+ACQUISITION_TEMPERATURE = "temperature"
+ACQUISITION_BINNING = "binning"
+
+# FITS header keywords holding each acquisition setting, by order of preference
+_ACQUISITION_HEADER_KEYWORDS = {
+    ACQUISITION_FRAME_TYPE: ['IMAGETYP', 'FRAME'],
+    ACQUISITION_EXPOSURE: ['EXPTIME', 'EXPOSURE'],
+    ACQUISITION_GAIN: ['GAIN', 'ISOSPEED'],
+    ACQUISITION_TEMPERATURE: ['CCD-TEMP', 'SET-TEMP'],
+    ACQUISITION_BINNING: ['XBINNING'],
+}
+
 
 class InputError(Exception):
     """
@@ -243,6 +258,8 @@ def _read_fit_image(path: Path):
         if 'BAYERPAT' in header:
             image.bayer_pattern = header['BAYERPAT']
 
+        image.acquisition = get_acquisition_settings(header)
+
         _set_image_file_origin(image, path)
 
     except (OSError, TypeError) as error:
@@ -252,6 +269,56 @@ def _read_fit_image(path: Path):
     return image
 
 
+def get_acquisition_settings(header) -> dict:
+    """
+    Extracts acquisition settings from a FITS header.
+
+    Frame type is an upper case string, like 'DARK' or 'LIGHT FRAME'. Binning is an int. All other settings are
+    floats.
+
+    :param header: the FITS header
+    :type header: astropy.io.fits.Header
+
+    :return: the acquisition settings found in header, keyed by ACQUISITION_* constants
+    :rtype: dict
+    """
+    settings = dict()
+
+    for setting, keywords in _ACQUISITION_HEADER_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword in header:
+                try:
+                    if setting == ACQUISITION_FRAME_TYPE:
+                        settings[setting] = str(header[keyword]).strip().upper()
+                    elif setting == ACQUISITION_BINNING:
+                        settings[setting] = int(header[keyword])
+                    else:
+                        settings[setting] = float(header[keyword])
+                    break
+                except (TypeError, ValueError):
+                    _LOGGER.debug(f"Ignoring unreadable header value {keyword} = {header[keyword]}")
+
+    return settings
+
+
+@log
+def read_fits_acquisition_settings(path: Path):
+    """
+    Reads acquisition settings from a FITS file header, without reading image data.
+
+    :param path: path to the FITS file
+    :type path: pathlib.Path
+
+    :return: the acquisition settings, or None if file could not be read
+    :rtype: dict or None
+    """
+    try:
+        return get_acquisition_settings(fits.getheader(str(path.resolve())))
+    except (OSError, TypeError) as error:
+        _LOGGER.debug(f"Could not read FITS header of {path} : {error}")
+        return None
+
+
 @log
 def _read_raw_image(path: Path):
     """
@@ -334,6 +401,9 @@ def _read_raw_image(path: Path):
     except LibRawFatalError as fatal_error:
         _report_fs_error(path, fatal_error)
         return None
+    except OSError as os_error:
+        _report_fs_error(path, os_error)
+        return None
 
 
 @log
@@ -347,3 +417,11 @@ def _report_fs_error(path: Path, error: Exception):
 @log
 def _set_image_file_origin(image: Image, path: Path):
     image.origin = f"FILE : {str(path.resolve())}"
+    image.source_path = str(path.resolve())
+
+    try:
+        image.timestamp = path.stat().st_mtime
+    except OSError as os_error:
+        # file may have been moved away since it was read
+        _LOGGER.debug(f"Could not get modification time of {path} : {os_error}. Using current time")
+        image.timestamp = time.time()
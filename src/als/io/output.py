@@ -9,6 +9,8 @@ import sys
 from pathlib import Path
 
 import cv2
+import numpy as np
+from astropy.io import fits
 from PyQt5.QtCore import QT_TRANSLATE_NOOP
 
 import als.model.data
@@ -158,3 +160,27 @@ class ImageSaver(QueueConsumer):
         return cv2.imwrite(target_path,
                            cv2.cvtColor(image.data, cv2_color_conversion_flag),
                            [int(cv2.IMWRITE_JPEG_QUALITY), 90]), ''
+
+
+@log
+def save_fits(data: np.ndarray, target_path: Path, header_values: dict):
+    """
+    Saves data to a FITS file, with given header values. An existing file is overwritten.
+
+    :param data: the data to save
+    :type data: numpy.ndarray
+
+    :param target_path: path of the file to save to
+    :type target_path: pathlib.Path
+
+    :param header_values: values to write in file header, keyed by FITS keyword
+    :type header_values: dict
+
+    :raises: OSError if file could not be written
+    """
+    header = fits.Header()
+
+    for keyword, value in header_values.items():
+        header[keyword] = value
+
+    fits.writeto(str(target_path), data, header, overwrite=True)
@@ -20,6 +20,7 @@
 Module holding all application logic
 """
 import logging
+import threading
 
 from pathlib import Path
 from typing import List
@@ -27,9 +28,10 @@ from typing import List
 from PyQt5.QtCore import QFile, QT_TRANSLATE_NOOP, QCoreApplication
 
 from als import config
+from als.calibration import Calibrate, CosmeticCorrection, MasterDarkBuilder
 from als.code_utilities import log, AlsException, SignalingQueue, get_text_content_of_resource, get_timestamp
 from als.crunching import compute_histograms_for_display
-from als.io.input import InputScanner, ScannerStartError
+from als.io.input import InputScanner, ScannerStartError, read_disk_image
 from als.io.network import get_ip, WebServer
 from als.io.output import ImageSaver
 from als.messaging import MESSAGE_HUB
@@ -39,10 +41,11 @@ from als.model.data import (
     I18n, STACKED_IMAGE_FILE_NAME_BASE,
     IMAGE_SAVE_TYPE_JPEG, WEB_SERVED_IMAGE_FILE_NAME_BASE
 )
+from als.lut import PointwiseChain
 from als.model.params import ProcessingParameter
 from als.processing import Pipeline, Debayer, Standardize, ConvertForOutput, Levels, ColorBalance, AutoStretch, \
-    HotPixelRemover, RemoveDark
-from als.stack import Stacker
+    HotPixelRemover, RemoveDark, FrameQualityFilter, Binning
+from als.stack import Stacker, StackingError
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -70,12 +73,14 @@ class Controller:
 
     _BIN_COUNT = 512
 
+    # pylint: disable=R0915
     @log
     def __init__(self):
 
         DYNAMIC_DATA.session.set_status(Session.stopped)
         DYNAMIC_DATA.web_server_is_running = False
         self._save_every_image = False
+        self._build_master_dark = False
 
         DYNAMIC_DATA.pre_processor_busy = False
         DYNAMIC_DATA.stacker_busy = False
@@ -88,7 +93,14 @@ class Controller:
         self._pre_process_pipeline: Pipeline = Pipeline(
             'pre-process',
             self._pre_process_queue,
-            [RemoveDark(), HotPixelRemover(), Debayer(), Standardize()])
+            [Binning(),
+             Calibrate(),
+             RemoveDark(),
+             CosmeticCorrection(),
+             HotPixelRemover(),
+             Debayer(defer_to_stack=True),
+             Standardize(),
+             FrameQualityFilter()])
         self._pre_process_pipeline.start()
 
         self._stacker_queue: SignalingQueue = DYNAMIC_DATA.stacker_queue
@@ -98,19 +110,29 @@ class Controller:
         self._stacker.start()
 
         self._post_process_queue = DYNAMIC_DATA.process_queue
-        self._post_process_pipeline: Pipeline = Pipeline('post-process', self._post_process_queue, [ConvertForOutput()])
         self._rgb_processor = ColorBalance()
         self._autostretch_processor = AutoStretch()
         self._levels_processor = Levels()
+        # levels, color balance and output conversion are pointwise : they are applied in a single lookup table pass
+        self._post_process_pipeline: Pipeline = Pipeline(
+            'post-process',
+            self._post_process_queue,
+            [PointwiseChain([self._levels_processor, self._rgb_processor, ConvertForOutput()])],
+            cache_results=True)
+        # stacking results of raw CFA frames are debayered here
+        self._post_process_pipeline.add_process(Debayer())
+        self._post_process_pipeline.add_process(Standardize())
         self._post_process_pipeline.add_process(self._autostretch_processor)
-        self._post_process_pipeline.add_process(self._levels_processor)
-        self._post_process_pipeline.add_process(self._rgb_processor)
         self._post_process_pipeline.start()
 
         self._saver_queue = DYNAMIC_DATA.save_queue
         self._saver = ImageSaver(self._saver_queue)
         self._saver.start()
 
+        self._master_dark_builder = MasterDarkBuilder(DYNAMIC_DATA.master_dark_queue)
+        self._master_dark_builder.start()
+        self._master_dark_save_thread: threading.Thread = None
+
         self._last_stacking_result = None
         self._web_server = None
 
@@ -223,6 +245,29 @@ class Controller:
         """
         self._save_every_image = save_every_image
 
+    @log
+    def get_build_master_dark(self) -> bool:
+        """
+        Retrieves the flag that tells if session frames are darks to integrate into a master dark
+
+        :return: the flag that tells if session frames are darks to integrate into a master dark
+        :rtype: bool
+        """
+        return self._build_master_dark
+
+    @log
+    def set_build_master_dark(self, build_master_dark: bool):
+        """
+        Sets the flag that tells if session frames are darks to integrate into a master dark.
+
+        Only taken into account when session is stopped.
+
+        :param build_master_dark: flag that tells if session frames are darks to integrate into a master dark
+        :type build_master_dark: bool
+        """
+        if DYNAMIC_DATA.session.is_stopped:
+            self._build_master_dark = build_master_dark
+
     @log
     def get_align_before_stack(self) -> bool:
         """
@@ -310,7 +355,10 @@ class Controller:
         :param image: the new image
         :type image: Image
         """
-        self._pre_process_queue.put(image)
+        if self._build_master_dark:
+            self._master_dark_builder.submit(image)
+        else:
+            self._pre_process_queue.put(image)
 
     @log
     def on_new_pre_processed_image(self, image: Image):
@@ -395,7 +443,8 @@ class Controller:
         """
         stacker just finished working on new image
         """
-        DYNAMIC_DATA.stacker_busy = False
+        # a live frame may be stacked while a restack is running
+        DYNAMIC_DATA.stacker_busy = self._stacker.is_restacking
         self._notify_model_observers()
 
     @log
@@ -442,6 +491,8 @@ class Controller:
 
                 DYNAMIC_DATA.has_new_warnings = False
                 self._stacker.reset()
+                self._wait_for_master_dark_save()
+                self._master_dark_builder.reset()
 
                 folders_dict = {
                     "scan": config.get_scan_folder_path(),
@@ -473,10 +524,15 @@ class Controller:
             except ScannerStartError as scanner_start_error:
                 raise SessionError("Input scanner could not start", scanner_start_error)
 
-            MESSAGE_HUB.dispatch_info(
-                __name__,
-                QT_TRANSLATE_NOOP("", "Session running in mode {} with alignment {}"),
-                [self._stacker.stacking_mode, self._stacker.align_before_stack])
+            if self._build_master_dark:
+                MESSAGE_HUB.dispatch_info(
+                    __name__,
+                    QT_TRANSLATE_NOOP("", "Session running in master dark mode : new frames are integrated as darks"))
+            else:
+                MESSAGE_HUB.dispatch_info(
+                    __name__,
+                    QT_TRANSLATE_NOOP("", "Session running in mode {} with alignment {}"),
+                    [self._stacker.stacking_mode, self._stacker.align_before_stack])
             DYNAMIC_DATA.session.set_status(Session.running)
 
         except SessionError as session_error:
@@ -498,6 +554,117 @@ class Controller:
             Controller.purge_queue(self._post_process_queue)
             MESSAGE_HUB.dispatch_info(__name__, QT_TRANSLATE_NOOP("", "Session stopped"))
 
+            if self._build_master_dark:
+                # darks still waiting in queue must be integrated, so master dark is saved in background
+                self._master_dark_save_thread = threading.Thread(target=self._save_master_dark,
+                                                                 name="master dark",
+                                                                 daemon=True)
+                self._master_dark_save_thread.start()
+
+    @log
+    def _wait_for_master_dark_save(self):
+        """
+        Waits for the master dark of previous session to be saved, if still in progress, so its frames are neither
+        lost nor integrated in next master dark
+        """
+        if self._master_dark_save_thread is not None and self._master_dark_save_thread.is_alive():
+            MESSAGE_HUB.dispatch_info(__name__, QT_TRANSLATE_NOOP("", "Waiting for previous master dark to be saved..."))
+            self._master_dark_save_thread.join()
+
+        self._master_dark_save_thread = None
+
+    @log
+    def _save_master_dark(self):
+        """
+        Saves master dark built during session to work folder, and makes it the master dark used for dark subtraction
+        """
+        try:
+            master_dark_path = self._master_dark_builder.save(config.get_work_folder_path())
+        except OSError as os_error:
+            MESSAGE_HUB.dispatch_error(__name__,
+                                       QT_TRANSLATE_NOOP("", "Could not save master dark : {}"),
+                                       [os_error])
+            return
+
+        if master_dark_path is None:
+            MESSAGE_HUB.dispatch_warning(__name__, QT_TRANSLATE_NOOP("", "No dark frame integrated : no master dark"))
+            return
+
+        config.set_master_dark_file_path(str(master_dark_path))
+        MESSAGE_HUB.dispatch_info(__name__,
+                                  QT_TRANSLATE_NOOP("", "Master dark saved to {}. It is now the configured master dark"),
+                                  [master_dark_path])
+
+    @log
+    def drop_last_frames(self, count: int = 1):
+        """
+        Removes the most recently stacked frames from current stack, without restacking
+
+        Removal runs in background, as it waits for the stacker to be done with the image it is stacking, if any.
+        New result is published as any stacking result.
+
+        :param count: how many frames to remove
+        :type count: int
+        """
+        threading.Thread(target=self._drop_last_frames, args=(count,), name="drop frames", daemon=True).start()
+
+    @log
+    def _drop_last_frames(self, count: int):
+        try:
+            removed_count = self._stacker.drop_last_frames(count)
+            MESSAGE_HUB.dispatch_info(__name__,
+                                      QT_TRANSLATE_NOOP("", "Removed {} frame(s) from stack"),
+                                      [removed_count])
+        except StackingError as stacking_error:
+            MESSAGE_HUB.dispatch_warning(__name__,
+                                         QT_TRANSLATE_NOOP("", "Could not remove frames from stack : {}"),
+                                         [stacking_error])
+
+    @log
+    def restack(self):
+        """
+        Stacks current stack frames again in current stacking mode, using cached alignment transformations.
+
+        Restacking runs in background. New result is published as any stacking result.
+        """
+        MESSAGE_HUB.dispatch_info(__name__,
+                                  QT_TRANSLATE_NOOP("", "Restacking {} frames in mode {} with alignment {}..."),
+                                  [len(self._stacker.session_index),
+                                   self._stacker.stacking_mode,
+                                   self._stacker.align_before_stack])
+
+        threading.Thread(target=self._restack, name="restack", daemon=True).start()
+
+    @log
+    def _restack(self):
+        try:
+            self._stacker.restack(self._load_frame_for_restack)
+            MESSAGE_HUB.dispatch_info(__name__, QT_TRANSLATE_NOOP("", "Restack done"))
+        except StackingError as stacking_error:
+            MESSAGE_HUB.dispatch_warning(__name__,
+                                         QT_TRANSLATE_NOOP("", "Could not restack : {}"),
+                                         [stacking_error])
+
+    @log
+    def _load_frame_for_restack(self, path: str):
+        """
+        Reads a frame from disk and pre-processes it, right away
+
+        :param path: path of the frame file
+        :type path: str
+
+        :return: the pre-processed frame or None if it could not be read
+        :rtype: Image or None
+
+        :raises: ProcessingError if pre-processing failed
+        """
+        image = read_disk_image(Path(path))
+
+        if image is None:
+            return None
+
+        return self._pre_process_pipeline.apply_processes(image)
+
     @log
     def pause_session(self):
         """
@@ -658,10 +825,15 @@ class Controller:
         self._pre_process_pipeline.stop()
         self._stacker.stop()
         self._post_process_pipeline.stop()
+        self._master_dark_builder.stop()
 
         self._saver.stop()
         self._saver.wait()
 
+        # release stacking buffers, some of them being backed by files
+        self._stacker.wait()
+        self._stacker.reset()
+
     @log
     def _stop_input_scanner(self):
         self._input_scanner.stop()
@@ -0,0 +1,118 @@
+"""
+Provides a lookup table engine for pointwise image processors
+"""
+import logging
+from typing import List
+
+import numpy as np
+
+from als.code_utilities import log, Timer
+from als.crunching import apply_lut
+from als.model.base import Image
+from als.processing import ImageProcessor
+
+_LOGGER = logging.getLogger(__name__)
+
+# lookup tables have one entry per 16 bits value. They are processed as square images of that many pixels
+_LUT_SIDE = 2 ** 8
+_LUT_SIZE = _LUT_SIDE ** 2
+
+
+class PointwiseChain(ImageProcessor):
+    """
+    Composes consecutive pointwise image processors into a single per-channel lookup table, applied to image data in
+    a single pass.
+
+    Processors are not aware of this : they process a small image holding, for each channel, all values of image data
+    range, quantized to 65536 levels. Result of all processors on that image is the lookup table. So chained
+    processors must :
+
+      - compute each output value only from the input value at the same place, and from the same channel
+      - be monotonic, as image wide statistics, like minimum and maximum, are taken from the lookup table image
+
+    If image data range cannot be quantized, processors are applied one after the other, as usual.
+    """
+
+    @log
+    def __init__(self, processors: List[ImageProcessor]):
+        """
+        Creates a pointwise processors chain
+
+        :param processors: the pointwise processors, in the order they must be applied
+        :type processors: List[ImageProcessor]
+        """
+        super().__init__()
+        self._processors = processors
+
+    def get_parameters(self):
+        return [parameter for processor in self._processors for parameter in processor.get_parameters()]
+
+    def get_settings_key(self) -> tuple:
+        return tuple(processor.get_settings_key() for processor in self._processors)
+
+    @log
+    def process_image(self, image: Image):
+
+        if image.is_color():
+            image.set_color_axis_as(0)
+
+        low = image.statistics.minimum()
+        high = image.statistics.maximum()
+
+        if not np.isfinite(low) or not np.isfinite(high) or high <= low:
+            _LOGGER.debug(f"Cannot quantize data range [{low}, {high}]. Applying pointwise processes one by one")
+            for processor in self._processors:
+                image = processor.process_image(image)
+            return image
+
+        with Timer() as lut_timer:
+            lut_image = PointwiseChain._create_lut_image(image, low, high)
+
+            for processor in self._processors:
+                lut_image = processor.process_image(lut_image)
+
+            # processors may have moved colors to another axis
+            lut_data = lut_image.data
+            color_axis = lut_data.shape.index(min(lut_data.shape)) if lut_image.is_color() else None
+
+            if color_axis is not None:
+                luts = np.moveaxis(lut_data, color_axis, 0).reshape(lut_data.shape[color_axis], _LUT_SIZE)
+            else:
+                luts = lut_data.reshape(_LUT_SIZE)
+
+        _LOGGER.debug(f"Lookup tables computed in {lut_timer.elapsed_in_milli_as_str} ms")
+
+        with Timer() as apply_timer:
+            result = apply_lut(image.data, luts, low, high)
+
+        _LOGGER.debug(f"Lookup tables applied in {apply_timer.elapsed_in_milli_as_str} ms")
+
+        image.data = np.moveaxis(result, 0, color_axis) if color_axis else result
+
+        return image
+
+    @staticmethod
+    def _create_lut_image(image: Image, low: float, high: float) -> Image:
+        """
+        Creates the image processors work on, instead of actual image.
+
+        :param image: the actual image, with colors on first axis if any
+        :type image: Image
+
+        :param low: minimum value of image data
+        :type low: float
+
+        :param high: maximum value of image data
+        :type high: float
+
+        :return: an image with all quantized data values in each channel, in increasing order
+        :rtype: Image
+        """
+        values = np.linspace(low, high, _LUT_SIZE, dtype=np.float32).reshape(_LUT_SIDE, _LUT_SIDE)
+
+        if image.is_color():
+            values = np.repeat(values[np.newaxis], image.data.shape[0], axis=0)
+
+        lut_image = Image(values)
+        lut_image.origin = image.origin
+        return lut_image
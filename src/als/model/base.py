@@ -2,14 +2,18 @@
 Provide base application data types
 """
 import logging
+from itertools import count
 
 from PyQt5.QtCore import pyqtSignal, QObject
 import numpy as np
 
 from als.code_utilities import log
+from als.statistics import ImageStatistics
 
 _LOGGER = logging.getLogger(__name__)
 
+_CONTENT_TOKENS = count()
+
 
 class Session(QObject):
     """
@@ -86,6 +90,19 @@ class Image:
     We also store the bayer pattern the image was shot with, if applicable.
 
     If image is from a sensor without a bayer array, the bayer pattern must be None.
+
+    Image timestamp tells when image was shot, as seconds since epoch, if known.
+
+    Image source path is the path of the file image was read from, if any.
+
+    Image acquisition settings are the ones read from file headers, if any. See
+    als.io.input.get_acquisition_settings()
+
+    Image statistics are computed on first need and kept until image data is set again.
+
+    Image content token identifies image data content : it is kept by clones and renewed each time data is set.
+
+    Code modifying image data in place must call mark_data_modified().
     """
 
     def __init__(self, data):
@@ -99,6 +116,11 @@ class Image:
         self._bayer_pattern: str = ""
         self._origin: str = "UNDEFINED"
         self._destination: str = "UNDEFINED"
+        self._timestamp: float = None
+        self._source_path: str = None
+        self._acquisition: dict = {}
+        self._statistics: ImageStatistics = None
+        self._token: int = next(_CONTENT_TOKENS)
 
     @log
     def clone(self):
@@ -112,6 +134,10 @@ class Image:
         new.bayer_pattern = self.bayer_pattern
         new.origin = self.origin
         new.destination = self.destination
+        new.timestamp = self.timestamp
+        new.source_path = self.source_path
+        new.acquisition = dict(self.acquisition)
+        new.token = self.token
         return new
 
     @property
@@ -147,6 +173,44 @@ class Image:
     @data.setter
     def data(self, data):
         self._data = data
+        self.mark_data_modified()
+
+    @property
+    def token(self):
+        """
+        Retrieves image content token
+
+        :return: a token shared by all images with the same data content
+        :rtype: int
+        """
+        return self._token
+
+    @token.setter
+    def token(self, token):
+        self._token = token
+
+    @property
+    def statistics(self):
+        """
+        Retrieves image data statistics, computing them if needed.
+
+        :return: the statistics, with one channel per color
+        :rtype: ImageStatistics
+        """
+        if self._statistics is None:
+            shape = self._data.shape
+            color_axis = shape.index(min(shape)) if self._data.ndim > 2 else None
+            self._statistics = ImageStatistics(self._data, color_axis)
+
+        return self._statistics
+
+    def mark_data_modified(self):
+        """
+        Forgets image data statistics and renews content token. Must be called after image data has been modified in
+        place.
+        """
+        self._statistics = None
+        self._token = next(_CONTENT_TOKENS)
 
     @property
     def origin(self):
@@ -164,6 +228,48 @@ class Image:
     def origin(self, origin):
         self._origin = origin
 
+    @property
+    def timestamp(self):
+        """
+        Retrieves the time image was shot, as seconds since epoch.
+
+        :return: the image timestamp or None if unknown
+        :rtype: float
+        """
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp):
+        self._timestamp = timestamp
+
+    @property
+    def source_path(self):
+        """
+        Retrieves the path of the file image was read from.
+
+        :return: the source file path or None if image was not read from a file
+        :rtype: str
+        """
+        return self._source_path
+
+    @source_path.setter
+    def source_path(self, source_path):
+        self._source_path = source_path
+
+    @property
+    def acquisition(self):
+        """
+        Retrieves image acquisition settings, like exposure or gain.
+
+        :return: the acquisition settings, keyed by setting name. Unknown settings are missing
+        :rtype: dict
+        """
+        return self._acquisition
+
+    @acquisition.setter
+    def acquisition(self, acquisition):
+        self._acquisition = acquisition
+
     @property
     def bayer_pattern(self):
         """
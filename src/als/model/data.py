@@ -22,6 +22,12 @@ IMAGE_SAVE_TYPE_TIFF = "tiff"
 IMAGE_SAVE_TYPE_PNG = "png"
 IMAGE_SAVE_TYPE_JPEG = "jpg"
 
+BINNING_MODE_NONE = "NONE"
+BINNING_MODE_2X2 = "2X2"
+BINNING_MODE_3X3 = "3X3"
+BINNING_MODE_SUPERPIXEL = "SUPERPIXEL"
+BINNING_MODES = [BINNING_MODE_NONE, BINNING_MODE_2X2, BINNING_MODE_3X3, BINNING_MODE_SUPERPIXEL]
+
 STACKED_IMAGE_FILE_NAME_BASE = "stack_image"
 WEB_SERVED_IMAGE_FILE_NAME_BASE = "web_image"
 
@@ -36,8 +42,12 @@ class I18n(QObject):
 
     STACKING_MODE_SUM = "TEMP"
     STACKING_MODE_MEAN = "TEMP"
+    STACKING_MODE_SIGMA_CLIP = "TEMP"
+    STACKING_MODE_WINDOWED_MEDIAN = "TEMP"
+    STACKING_MODE_SLIDING_MEAN = "TEMP"
     STRETCH_MODE_LOCAL = "TEMP"
     STRETCH_MODE_GLOBAL = "TEMP"
+    STRETCH_MODE_SCREEN_TRANSFER = "TEMP"
     WORKER_STATUS_BUSY = "TEMP"
 
     SCANNER = "TEMP"
@@ -74,8 +84,12 @@ class I18n(QObject):
         """
         I18n.STACKING_MODE_SUM = self.tr("sum")
         I18n.STACKING_MODE_MEAN = self.tr("mean")
+        I18n.STACKING_MODE_SIGMA_CLIP = self.tr("kappa-sigma")
+        I18n.STACKING_MODE_WINDOWED_MEDIAN = self.tr("windowed median")
+        I18n.STACKING_MODE_SLIDING_MEAN = self.tr("last frames mean")
         I18n.STRETCH_MODE_LOCAL = self.tr("local")
         I18n.STRETCH_MODE_GLOBAL = self.tr("global")
+        I18n.STRETCH_MODE_SCREEN_TRANSFER = self.tr("screen transfer")
         I18n.WORKER_STATUS_BUSY = self.tr("busy")
         I18n.SCANNER = self.tr("scanner")
         I18n.OF = self.tr("of")
@@ -117,6 +131,7 @@ class DynamicData:
         self.stacker_queue = SignalingQueue()
         self.process_queue = SignalingQueue()
         self.save_queue = SignalingQueue()
+        self.master_dark_queue = SignalingQueue()
         self.pre_processor_busy = False
         self.stacker_busy = False
         self.post_processor_busy = False
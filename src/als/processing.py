@@ -2,6 +2,7 @@
 Provides all means of image processing
 """
 import logging
+import threading
 from abc import abstractmethod
 from typing import List
 from pathlib import Path
@@ -9,14 +10,17 @@ from pathlib import Path
 import cv2
 import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal, QT_TRANSLATE_NOOP
-from scipy.signal import convolve2d
 from skimage import exposure
 
 from als.code_utilities import log, Timer, SignalingQueue, human_readable_byte_size
+from als.crunching import apply_lut, bin_cfa, bin_data, compute_screen_transfer_lut, debayer_bilinear, \
+    equalize_adaptive, green_superpixel, measure_frame_quality, superpixel_debayer, replace_hot_pixels
 from als.messaging import MESSAGE_HUB
 from als.model.base import Image
-from als.model.data import I18n, DYNAMIC_DATA
+from als.model.data import I18n, DYNAMIC_DATA, BINNING_MODE_NONE, BINNING_MODE_2X2, BINNING_MODE_3X3, \
+    BINNING_MODE_SUPERPIXEL
 from als.model.params import ProcessingParameter, RangeParameter, SwitchParameter, ListParameter
+from als.processing_cache import ProcessingCache
 from als.io import input as als_input
 from als import config
 
@@ -32,6 +36,56 @@ class ProcessingError(Exception):
     """
 
 
+class FrameRejectedError(ProcessingError):
+    """Raised when a frame is deliberately kept out of the stack, like by the quality filter"""
+
+
+def get_effective_bayer_pattern(image: Image) -> str:
+    """
+    Retrieves the bayer pattern to use for an undebayered image : the one set in preferences if any, or the one
+    the image was shot with.
+
+    :param image: the image
+    :type image: Image
+
+    :return: the bayer pattern, or an empty string if image is not to be handled as raw CFA data
+    :rtype: str
+    """
+    if image.is_color():
+        return ""
+
+    preferred_bayer_pattern = config.get_bayer_pattern()
+
+    if preferred_bayer_pattern != "AUTO":
+        return preferred_bayer_pattern
+
+    return image.bayer_pattern if image.needs_debayering() else ""
+
+
+def _stretch_to_16_bits(data: np.ndarray, low: float, high: float) -> np.ndarray:
+    """
+    Linearly maps data range to [0, 65535].
+
+    :param data: the data, all in [low, high]
+    :type data: numpy.ndarray
+
+    :param low: data minimum
+    :type low: float
+
+    :param high: data maximum
+    :type high: float
+
+    :return: the mapped data, as float32
+    :rtype: numpy.ndarray
+    """
+    if high <= low:
+        return np.float32(np.interp(data, (low, high), (0, _16_BITS_MAX_VALUE)))
+
+    result = np.subtract(data, low, dtype=np.float32)
+    result *= _16_BITS_MAX_VALUE / (high - low)
+    return result
+
+
 # pylint: disable=R0903
 class ImageProcessor:
     """
@@ -54,6 +108,15 @@ class ImageProcessor:
         """
         return self._parameters
 
+    def get_settings_key(self) -> tuple:
+        """
+        Gets a summary of all settings driving this processor, besides its input image. Default is parameter values
+
+        :return: the settings summary. Equal summaries mean equal processing
+        :rtype: tuple
+        """
+        return tuple(parameter.value for parameter in self._parameters)
+
     @abstractmethod
     def process_image(self, image: Image):
         """
@@ -130,30 +193,18 @@ class ColorBalance(ImageProcessor):
             _LOGGER.debug(f"Color balance param {param.name} = {param.value}")
 
         active = self._parameters[0]
-        red = self._parameters[1]
-        green = self._parameters[2]
-        blue = self._parameters[3]
-
-        if active.value:
-            red_value = red.value if red.value > 0 else 0.1
-            green_value = green.value if green.value > 0 else 0.1
-            blue_value = blue.value if blue.value > 0 else 0.1
 
+        if active.value and image.is_color():
             processed = False
 
-            if not red.is_default():
-                image.data[0] = image.data[0] * red_value
-                processed = True
-
-            if not green.is_default():
-                image.data[1] = image.data[1] * green_value
-                processed = True
-
-            if not blue.is_default():
-                image.data[2] = image.data[2] * blue_value
-                processed = True
+            # red, green and blue levels are applied to channels 0, 1 and 2, in place
+            for channel, level in enumerate(self._parameters[1:4]):
+                if not level.is_default():
+                    image.data[channel] = image.data[channel] * (level.value if level.value > 0 else 0.1)
+                    processed = True
 
             if processed:
+                image.mark_data_modified()
                 image.data = np.clip(image.data, 0, _16_BITS_MAX_VALUE)
 
         return image
@@ -164,6 +215,11 @@ class AutoStretch(ImageProcessor):
     Implements auto stretch feature
     """
 
+    # strength is 3 times the target background of screen transfer stretch, so default strength gives the usual .25
+    _STRENGTH_PER_TARGET_BACKGROUND = 3
+    _MIN_TARGET_BACKGROUND = .01
+    _MAX_TARGET_BACKGROUND = .99
+
     @log
     def __init__(self):
         super().__init__()
@@ -179,7 +235,7 @@ class AutoStretch(ImageProcessor):
                 "stretch method",
                 I18n.TOOLTIP_STRETCH_METHOD,
                 default=I18n.STRETCH_MODE_GLOBAL,
-                choices=[I18n.STRETCH_MODE_GLOBAL, I18n.STRETCH_MODE_LOCAL]))
+                choices=[I18n.STRETCH_MODE_GLOBAL, I18n.STRETCH_MODE_LOCAL, I18n.STRETCH_MODE_SCREEN_TRANSFER]))
 
         self._parameters.append(
             RangeParameter(
@@ -199,27 +255,34 @@ class AutoStretch(ImageProcessor):
         stretch_method = self._parameters[1]
         stretch_strength = self._parameters[2]
 
-        if active.value:
+        if active.value and stretch_method.value == I18n.STRETCH_MODE_SCREEN_TRANSFER:
+            _LOGGER.debug("Performing screen transfer Autostretch...")
+            AutoStretch._apply_screen_transfer(image, stretch_strength.value)
+            _LOGGER.debug("Autostretch Done")
+
+        elif active.value:
             _LOGGER.debug("Performing Autostretch...")
-            image.data = np.interp(image.data,
-                                   (image.data.min(), image.data.max()),
-                                   (0, _16_BITS_MAX_VALUE))
+            statistics = image.statistics
+            low = statistics.minimum()
+            high = statistics.maximum()
+            image.data = _stretch_to_16_bits(image.data, low, high)
 
             @log
-            def histo_adpative_equalization(data):
+            def histo_adpative_equalization(data, _):
 
                 # special case for autostretch value == 0
                 strength = stretch_strength.value if stretch_strength.value != 0 else 0.1
 
-                return exposure.equalize_adapthist(
-                    np.uint16(data),
-                    nbins=_16_BITS_MAX_VALUE + 1,
-                    clip_limit=.01 * strength)
+                return equalize_adaptive(data, .01 * strength)
 
             @log
-            def contrast_stretching(data):
-                low, high = np.percentile(data, (stretch_strength.value, 100 - stretch_strength.value))
-                return exposure.rescale_intensity(data, in_range=(low, high))
+            def contrast_stretching(data, channel):
+                # percentiles of stretched data are the stretched percentiles of original data
+                percentiles = statistics.percentiles(
+                    [stretch_strength.value, 100 - stretch_strength.value],
+                    channel)
+                in_range = _stretch_to_16_bits(np.array(percentiles), low, high)
+                return exposure.rescale_intensity(data, in_range=(in_range[0], in_range[1]))
 
             available_stretches = [contrast_stretching, histo_adpative_equalization]
 
@@ -227,9 +290,10 @@ class AutoStretch(ImageProcessor):
 
             if image.is_color():
                 for channel in range(3):
-                    image.data[channel] = chosen_stretch(image.data[channel])
+                    image.data[channel] = chosen_stretch(image.data[channel], channel)
+                image.mark_data_modified()
             else:
-                image.data = chosen_stretch(image.data)
+                image.data = chosen_stretch(image.data, 0)
             _LOGGER.debug("Autostretch Done")
 
             # autostretch output range is [0, 1]
@@ -237,12 +301,46 @@ class AutoStretch(ImageProcessor):
             image.data *= _16_BITS_MAX_VALUE
 
             # final interpolation
-            image.data = np.float32(np.interp(image.data,
-                                              (image.data.min(), image.data.max()),
-                                              (0, _16_BITS_MAX_VALUE)))
+            image.data = _stretch_to_16_bits(image.data, image.statistics.minimum(), image.statistics.maximum())
 
         return image
 
+    @staticmethod
+    @log
+    def _apply_screen_transfer(image: Image, strength: float):
+        """
+        Stretches image with a screen transfer function, adapted to each channel background median and noise.
+
+        Stretch is applied as one lookup table per channel, in a single pass.
+
+        :param image: the image to stretch, with colors on first axis if any
+        :type image: Image
+
+        :param strength: stretch strength
+        :type strength: float
+        """
+        statistics = image.statistics
+        low = statistics.minimum()
+        high = statistics.maximum()
+
+        if high <= low:
+            image.data = _stretch_to_16_bits(image.data, low, high)
+            return
+
+        target_background = min(max(strength / AutoStretch._STRENGTH_PER_TARGET_BACKGROUND,
+                                    AutoStretch._MIN_TARGET_BACKGROUND),
+                                AutoStretch._MAX_TARGET_BACKGROUND)
+
+        luts = np.stack([
+            _16_BITS_MAX_VALUE * compute_screen_transfer_lut(
+                (statistics.median(channel) - low) / (high - low),
+                statistics.median_absolute_deviation(channel) / (high - low),
+                target_background,
+                _16_BITS_MAX_VALUE + 1)
+            for channel in range(statistics.channel_count)])
+
+        image.data = apply_lut(image.data, luts if image.is_color() else luts[0], low, high)
+
 
 class Levels(ImageProcessor):
     """Implements levels processing"""
@@ -315,9 +413,7 @@ class Levels(ImageProcessor):
                 _LOGGER.debug("Black / white level adjustments Done")
 
             # final interpolation
-            image.data = np.float32(np.interp(image.data,
-                                              (image.data.min(), image.data.max()),
-                                              (0, _16_BITS_MAX_VALUE)))
+            image.data = _stretch_to_16_bits(image.data, image.statistics.minimum(), image.statistics.maximum())
 
         return image
 
@@ -334,6 +430,8 @@ class Standardize(ImageProcessor):
 
       #. each array element is of type float32
 
+      #. data array is C-contiguous
+
     """
     @log
     def process_image(self, image: Image):
@@ -341,30 +439,81 @@ class Standardize(ImageProcessor):
         if image.is_color():
             image.set_color_axis_as(0)
 
-        image.data = np.float32(image.data)
+        image.data = np.ascontiguousarray(image.data, dtype=np.float32)
 
         return image
 
 
-class HotPixelRemover(ImageProcessor):
-    """Provides hot pixels removal"""
+# pylint: disable=R0903
+class Binning(ImageProcessor):
+    """
+    Provides software binning, to reduce the amount of data all downstream processes have to deal with.
+
+    Available modes are :
+
+      - 2x2 and 3x3 binning : blocks of pixels are averaged. Raw CFA data is binned per Bayer sub-plane and stays raw.
+      - superpixel : each 2x2 Bayer cell of raw CFA data becomes a single RGB pixel. Non-CFA data is binned 2x2.
+
+    Integer data keeps its data type.
+    """
+
+    _BIN_FACTORS = {
+        BINNING_MODE_2X2: 2,
+        BINNING_MODE_3X3: 3,
+        BINNING_MODE_SUPERPIXEL: 2,
+    }
+
+    @log
+    def process_image(self, image: Image):
+
+        binning_mode = config.get_binning_mode()
+
+        _LOGGER.debug(f"Binning mode : {binning_mode}")
+
+        if binning_mode != BINNING_MODE_NONE:
+            with Timer() as binning_timer:
+                Binning.bin_image(image, binning_mode)
+            _LOGGER.debug(f"Binning of {image.origin} done in {binning_timer.elapsed_in_milli_as_str} ms")
+
+        return image
 
     @staticmethod
-    def _neighbors_average(data):
+    @log
+    def bin_image(image: Image, binning_mode: str):
         """
-        returns an array containing the means of all original array's pixels' neighbors
-        :param data: the image to compute means for
-        :return: an array containing the means of all original array's pixels' neighbors
-        :rtype: np.Array
+        Bins image data in place.
+
+        :param image: the image to bin
+        :type image: Image
+
+        :param binning_mode: the binning mode, one of als.model.data.BINNING_MODES
+        :type binning_mode: str
         """
+        if binning_mode not in Binning._BIN_FACTORS:
+            return
+
+        factor = Binning._BIN_FACTORS[binning_mode]
+        original_dtype = image.data.dtype
+        bayer_pattern = get_effective_bayer_pattern(image)
 
-        kernel = np.ones((3, 3))
-        kernel[1, 1] = 0
+        if image.is_color():
+            image.set_color_axis_as(0)
+            binned_data = np.stack([bin_data(channel, factor) for channel in image.data])
+        elif bayer_pattern and binning_mode == BINNING_MODE_SUPERPIXEL:
+            binned_data = superpixel_debayer(image.data, bayer_pattern)
+        elif bayer_pattern:
+            binned_data = bin_cfa(image.data, factor)
+        else:
+            binned_data = bin_data(image.data, factor)
 
-        neighbor_sum = convolve2d(data, kernel, mode='same', boundary='fill', fillvalue=0)
-        num_neighbor = convolve2d(np.ones(data.shape), kernel, mode='same', boundary='fill', fillvalue=0)
+        if issubclass(original_dtype.type, np.integer):
+            binned_data = np.rint(binned_data, out=binned_data).astype(original_dtype)
 
-        return (neighbor_sum / num_neighbor).astype(data.dtype)
+        image.data = binned_data
+
+
+class HotPixelRemover(ImageProcessor):
+    """Provides hot pixels removal"""
 
     @log
     def process_image(self, image: Image):
@@ -382,8 +531,14 @@ class HotPixelRemover(ImageProcessor):
         if hpr_on:
 
             if not image.is_color():
-                means = HotPixelRemover._neighbors_average(image.data)
-                image.data = np.where(image.data / means > _HOT_PIXEL_RATIO, means, image.data)
+                if not image.data.flags.writeable:
+                    image.data = image.data.copy()
+
+                with Timer() as removal_timer:
+                    replaced_count = replace_hot_pixels(image.data, _HOT_PIXEL_RATIO)
+                image.mark_data_modified()
+
+                _LOGGER.debug(f"Replaced {replaced_count} hot pixels in {removal_timer.elapsed_in_milli_as_str} ms")
             else:
                 MESSAGE_HUB.dispatch_warning(
                     __name__,
@@ -397,11 +552,34 @@ class HotPixelRemover(ImageProcessor):
 class Debayer(ImageProcessor):
     """
     Provides image debayering.
+
+    Integer data is debayered by OpenCV. Floating point data, like stacking results, is debayered by our own
+    bilinear implementation, so no precision is lost.
+
+    If CFA stacking is enabled, a Debayer built with defer_to_stack=True leaves frames undebayered, with their
+    effective bayer pattern set : debayering is then done on stacking results.
     """
 
+    @log
+    def __init__(self, defer_to_stack: bool = False):
+        """
+        Constructs a Debayer
+
+        :param defer_to_stack: do we leave frames undebayered when CFA stacking is enabled ?
+        :type defer_to_stack: bool
+        """
+        super().__init__()
+        self._defer_to_stack = defer_to_stack
+
+    def get_settings_key(self) -> tuple:
+        return (config.get_bayer_pattern(),)
+
     @log
     def process_image(self, image: Image):
 
+        if image.is_color():
+            return image
+
         preferred_bayer_pattern = config.get_bayer_pattern()
 
         if preferred_bayer_pattern == "AUTO" and not image.needs_debayering():
@@ -431,10 +609,20 @@ class Debayer(ImageProcessor):
         else:
             bayer_pattern = image.bayer_pattern
 
+        if self._defer_to_stack and config.get_stack_cfa():
+            _LOGGER.debug(f"CFA stacking enabled : debayering of {image.origin} is deferred to stacking result")
+            image.bayer_pattern = bayer_pattern
+            return image
+
         cv_debay = bayer_pattern[3] + bayer_pattern[2]
 
         try:
-            debayered_data = cv2.cvtColor(image.data, cv2_debayer_dict[cv_debay])
+            if issubclass(image.data.dtype.type, np.floating):
+                if cv_debay not in cv2_debayer_dict:
+                    raise KeyError(cv_debay)
+                debayered_data = debayer_bilinear(image.data, bayer_pattern)
+            else:
+                debayered_data = cv2.cvtColor(image.data, cv2_debayer_dict[cv_debay])
         except KeyError:
             raise ProcessingError(f"unsupported bayer pattern : {bayer_pattern}")
         except cv2.error as error:
@@ -448,26 +636,34 @@ class Debayer(ImageProcessor):
 class RemoveDark(ImageProcessor):
     """
     Provides image dark removal.
+
+    Master dark is read, binned and conformed to light frames data type only once, then cached. Cache is invalidated
+    when master dark file path or modification time changes, or when any config setting affecting dark preparation
+    changes.
     """
 
+    @log
+    def __init__(self):
+        super().__init__()
+        # restack loads frames from several threads at once
+        self._cache_lock = threading.Lock()
+        self._cached_dark_key: tuple = None
+        self._cached_dark: Image = None
+
     @log
     def process_image(self, image: Image):
 
-        do_subtract = config.get_use_master_dark()
+        # when calibration library is used, it takes care of dark subtraction
+        do_subtract = config.get_use_master_dark() and not config.get_use_calibration_library()
 
         _LOGGER.debug(f"Dark subtraction enabled : {do_subtract}")
 
         if do_subtract:
 
-            dark = als_input.read_disk_image(Path(config.get_master_dark_file_path()))
+            with self._cache_lock:
+                dark = self._get_conformed_dark(image.data.dtype)
 
             if dark is None:
-                read_error_message = QT_TRANSLATE_NOOP(
-                    "",
-                    "Could not read dark {}. Dark subtraction is SKIPPED"
-                )
-                read_error_values = [config.get_master_dark_file_path(), ]
-                MESSAGE_HUB.dispatch_warning(__name__, read_error_message, read_error_values)
                 return image
 
             if not image.is_same_shape_as(dark):
@@ -479,42 +675,105 @@ class RemoveDark(ImageProcessor):
                 MESSAGE_HUB.dispatch_warning(__name__, mismatch_message, mismatch_values)
                 return image
 
-            if image.data.dtype.name != dark.data.dtype.name:
+            _LOGGER.debug("Subtracting dark frame...")
 
-                MESSAGE_HUB.dispatch_warning(
-                    __name__,
-                    QT_TRANSLATE_NOOP(
-                        "",
-                        "Dark & Light data types mismatch. Light: {} vs Dark: {}. Dark needs to be conformed."
-                    ),
-                    [image.data.dtype.name, dark.data.dtype.name])
+            with Timer() as subtraction_timer:
+                if not image.data.flags.writeable:
+                    image.data = image.data.copy()
 
-                with Timer() as conforming_timer:
+                # max(light, dark) - dark clips negative results to 0, without any temporary array
+                np.maximum(image.data, dark.data, out=image.data)
+                np.subtract(image.data, dark.data, out=image.data)
+                image.mark_data_modified()
 
-                    try:
-                        image_min_allowed, image_max_allowed = RemoveDark._get_allowed_min_and_max(image.data)
-                    except TypeError:
-                        raise ProcessingError(f"unhandled image data type : {image.data.dtype.type}")
+            _LOGGER.debug(f"Dark frame subtracted in {subtraction_timer.elapsed_in_milli_as_str} ms")
 
-                    try:
-                        dark_min_allowed, dark_max_allowed = RemoveDark._get_allowed_min_and_max(dark.data)
-                    except TypeError:
-                        raise ProcessingError(f"unhandled masterdark data type : {dark.data.dtype.type}")
+        else:
+            with self._cache_lock:
+                self._cached_dark_key = None
+                self._cached_dark = None
 
-                    dark.data = np.interp(
-                        dark.data,
-                        (dark_min_allowed, dark_max_allowed),
-                        (image_min_allowed, image_max_allowed)).astype(image.data.dtype)
+        return image
 
-                _LOGGER.debug(f"Dark frame conforming done in {conforming_timer.elapsed_in_milli_as_str} ms")
+    @log
+    def _get_conformed_dark(self, light_dtype: np.dtype):
+        """
+        Retrieves master dark, ready to be subtracted from light frames of a given data type.
 
-            _LOGGER.debug("Subtracting dark frame...")
+        Master dark is only read from disk if cache is invalid.
 
-            with Timer() as subtraction_timer:
-                image.data = np.where(image.data > dark.data, image.data - dark.data, 0)
-            _LOGGER.debug(f"Dark frame subtracted in {subtraction_timer.elapsed_in_milli_as_str} ms")
+        :param light_dtype: light frames data type
+        :type light_dtype: numpy.dtype
 
-        return image
+        :return: the conformed master dark, or None if it could not be read
+        :rtype: Image or None
+        """
+        dark_path = Path(config.get_master_dark_file_path())
+
+        try:
+            dark_modification_time = dark_path.stat().st_mtime
+        except OSError:
+            dark_modification_time = None
+
+        cache_key = (str(dark_path),
+                     dark_modification_time,
+                     config.get_binning_mode(),
+                     config.get_bayer_pattern(),
+                     light_dtype.name)
+
+        if cache_key == self._cached_dark_key:
+            return self._cached_dark
+
+        dark = als_input.read_disk_image(dark_path)
+
+        if dark is None:
+            read_error_message = QT_TRANSLATE_NOOP(
+                "",
+                "Could not read dark {}. Dark subtraction is SKIPPED"
+            )
+            read_error_values = [config.get_master_dark_file_path(), ]
+            MESSAGE_HUB.dispatch_warning(__name__, read_error_message, read_error_values)
+            return None
+
+        # lights are binned before reaching us, so dark must be binned the same way
+        Binning.bin_image(dark, config.get_binning_mode())
+
+        if light_dtype.name != dark.data.dtype.name:
+
+            MESSAGE_HUB.dispatch_warning(
+                __name__,
+                QT_TRANSLATE_NOOP(
+                    "",
+                    "Dark & Light data types mismatch. Light: {} vs Dark: {}. Dark needs to be conformed."
+                ),
+                [light_dtype.name, dark.data.dtype.name])
+
+            with Timer() as conforming_timer:
+
+                try:
+                    image_min_allowed, image_max_allowed = RemoveDark._get_allowed_min_and_max(
+                        np.empty(0, dtype=light_dtype))
+                except TypeError:
+                    raise ProcessingError(f"unhandled image data type : {light_dtype.type}")
+
+                try:
+                    dark_min_allowed, dark_max_allowed = RemoveDark._get_allowed_min_and_max(dark.data)
+                except TypeError:
+                    raise ProcessingError(f"unhandled masterdark data type : {dark.data.dtype.type}")
+
+                dark.data = np.interp(
+                    dark.data,
+                    (dark_min_allowed, dark_max_allowed),
+                    (image_min_allowed, image_max_allowed)).astype(light_dtype)
+
+            _LOGGER.debug(f"Dark frame conforming done in {conforming_timer.elapsed_in_milli_as_str} ms")
+
+        dark.data = np.ascontiguousarray(dark.data, dtype=light_dtype)
+
+        self._cached_dark_key = cache_key
+        self._cached_dark = dark
+
+        return dark
 
     @staticmethod
     def _get_allowed_min_and_max(data):
@@ -539,6 +798,52 @@ class RemoveDark(ImageProcessor):
         return allowed_min, allowed_max
 
 
+class FrameQualityFilter(ImageProcessor):
+    """
+    Rejects poor quality frames before they reach the stacker, so they don't go through costly alignment.
+
+    Star count, background level and approximate FWHM are measured on a decimated copy of the frame and compared
+    to user defined thresholds. A threshold set to 0 is not checked.
+    """
+
+    @log
+    def process_image(self, image: Image):
+
+        if not config.get_use_frame_quality_filter():
+            return image
+
+        pixel_scale = 1
+
+        if image.is_color():
+            data = image.data[1]
+        elif image.needs_debayering():
+            data = green_superpixel(image.data, image.bayer_pattern)
+            pixel_scale = 2
+        else:
+            data = image.data
+
+        with Timer() as measure_timer:
+            star_count, background, fwhm = measure_frame_quality(data)
+            fwhm *= pixel_scale
+
+        _LOGGER.debug(f"Frame quality of {image.origin} measured in {measure_timer.elapsed_in_milli_as_str} ms : "
+                      f"{star_count} stars, background {background:.1f}, FWHM {fwhm:.2f} px")
+
+        minimum_star_count = config.get_quality_minimum_star_count()
+        if minimum_star_count and star_count < minimum_star_count:
+            raise FrameRejectedError(f"Too few stars : {star_count} < {minimum_star_count}")
+
+        maximum_background = config.get_quality_maximum_background()
+        if maximum_background and background > maximum_background:
+            raise FrameRejectedError(f"Background is too high : {background:.1f} > {maximum_background}")
+
+        maximum_fwhm = config.get_quality_maximum_fwhm()
+        if maximum_fwhm and not fwhm <= maximum_fwhm:
+            raise FrameRejectedError(f"Stars are too wide : FWHM {fwhm:.2f} px > {maximum_fwhm} px")
+
+        return image
+
+
 class ConvertForOutput(ImageProcessor):
     """
     Moves colors data to 3rd array axis for color images and reduce data range to unsigned 16 bits
@@ -630,24 +935,59 @@ class Pipeline(QueueConsumer):
     """
 
     @log
-    def __init__(self, name: str, queue: SignalingQueue, final_processes: list):
+    def __init__(self, name: str, queue: SignalingQueue, final_processes: list, cache_results: bool = False):
+        """
+        Creates a pipeline
+
+        :param cache_results: if True, processing of an image resumes at the first processor whose settings changed
+          since that image was last processed. See ProcessingCache
+        :type cache_results: bool
+        """
         QueueConsumer.__init__(self, name, queue)
         self._processes = []
         self._final_processes = final_processes
+        self._cache = ProcessingCache() if cache_results else None
 
     @log
     def _handle_image(self, image: Image):
 
         try:
-            for processor in self._processes + self._final_processes:
+            processes = self._processes + self._final_processes
+            start, image = self._cache.restore(image, processes) if self._cache else (0, image)
+
+            for index, processor in enumerate(processes[start:], start):
+                if self._cache:
+                    self._cache.store(index, processor, image)
                 image = processor.process_image(image)
 
             self.new_result_signal.emit(image)
 
+        except FrameRejectedError as rejection:
+            message = QT_TRANSLATE_NOOP("", "Image {} rejected : {}")
+            MESSAGE_HUB.dispatch_info(__name__, message, [image, rejection])
+
         except ProcessingError as processing_error:
             message = QT_TRANSLATE_NOOP("", "Error applying process '{}' to image {} : {} *** Image will be ignored")
             MESSAGE_HUB.dispatch_warning(__name__, message, [processor.__class__.__name__, image, processing_error])
 
+    @log
+    def apply_processes(self, image: Image) -> Image:
+        """
+        Applies all image processors of this pipeline to an image, right away, in the calling thread
+
+        :param image: the image to process
+        :type image: Image
+
+        :return: the processed image
+        :rtype: Image
+
+        :raises: ProcessingError if any processor fails
+        """
+        for processor in self._processes + self._final_processes:
+            image = processor.process_image(image)
+
+        return image
+
     @log
     def add_process(self, process: ImageProcessor):
         """
@@ -0,0 +1,81 @@
+"""
+Provides caching of intermediate pipeline results
+"""
+import logging
+from typing import List
+
+from als.code_utilities import log
+from als.model.base import Image
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ProcessingCache:
+    """
+    Remembers the input image of each adjustable processor of a pipeline, so processing of an image can resume at the
+    first processor whose settings changed since that image was last processed.
+
+    A processor is adjustable if it has parameters. Each processor input is identified by a key chaining source
+    image content token and settings of all previous processors. See ImageProcessor.get_settings_key().
+
+    Only the latest input of each processor is kept.
+    """
+
+    @log
+    def __init__(self):
+        # processor index -> (input key, input image)
+        self._entries = dict()
+        self._keys: List[tuple] = []
+
+    @log
+    def restore(self, image: Image, processors: list):
+        """
+        Finds where processing of an image can resume.
+
+        :param image: the image to process
+        :type image: Image
+
+        :param processors: the processors to apply, in order
+        :type processors: list
+
+        :return: index of the first processor to run and its input image. That image is a copy the caller may modify
+        :rtype: tuple(int, Image)
+        """
+        key = (image.token,)
+        self._keys = []
+        for processor in processors:
+            self._keys.append(key)
+            key = (key, processor.get_settings_key())
+
+        for index in reversed(range(len(processors))):
+            entry = self._entries.get(index)
+            if entry is not None and entry[0] == self._keys[index]:
+                _LOGGER.debug(f"Resuming processing at {processors[index].__class__.__name__}")
+                return index, entry[1].clone()
+
+        return 0, image
+
+    @log
+    def store(self, index: int, processor, image: Image):
+        """
+        Remembers the input image of a processor, if it is adjustable.
+
+        Must be called for each processor about to run, after restore()
+
+        :param index: processor index
+        :type index: int
+
+        :param processor: the processor
+        :type processor: ImageProcessor
+
+        :param image: the processor input image
+        :type image: Image
+        """
+        if not processor.get_parameters():
+            return
+
+        entry = self._entries.get(index)
+        if entry is None or entry[0] != self._keys[index]:
+            # release outdated input before copying the new one
+            self._entries.pop(index, None)
+            self._entries[index] = (self._keys[index], image.clone())
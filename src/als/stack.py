@@ -17,21 +17,35 @@ Provides image stacking features
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
-from multiprocessing import Process, Manager
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Callable, List
 
 import astroalign as al
 import numpy as np
 from PyQt5.QtCore import pyqtSignal, QT_TRANSLATE_NOOP
 from skimage.transform import SimilarityTransform
 
+from als.accumulation import StackAccumulator, SigmaClipAccumulator, SlidingMeanAccumulator, SumAccumulator, \
+    WindowedMedianAccumulator
+from als.alignment import estimate_noise, measure_star_positions, MotionModel, PhaseCorrelator, ReferenceStars
 from als.messaging import MESSAGE_HUB
 from als.model.data import I18n
 from als.code_utilities import log, Timer
+from als.crunching import bin_data, green_superpixel, warp_affine, warp_affine_cfa
 from als.model.base import Image
-from als.processing import QueueConsumer
+from als.processing import QueueConsumer, ProcessingError
 from als import config
 _LOGGER = logging.getLogger(__name__)
 
+_MAX_REFINED_RMS_RESIDUAL = 1.
+_MAX_REFINED_SCALE_ERROR = .01
+_PYRAMID_TARGET_SIZE = 2048
+_PYRAMID_BIN_FACTORS = [2, 4]
+_RESTACK_WORKER_COUNT = os.cpu_count() or 1
 
 class StackingError(Exception):
     """
@@ -39,6 +53,31 @@ class StackingError(Exception):
     """
 
 
+# pylint: disable=R0903
+class StackedFrame:
+    """
+    Session index entry : what we need to know about a stacked frame, so it can be stacked again without
+    searching alignment transformation.
+    """
+
+    def __init__(self, source_path: str, transformation: SimilarityTransform, matches_count: int):
+        """
+        Creates a session index entry
+
+        :param source_path: path of the file frame was read from
+        :type source_path: str
+
+        :param transformation: the transformation used to align the frame. None if frame was not aligned
+        :type transformation: skimage.transform._geometric.SimilarityTransform
+
+        :param matches_count: how many stars were matched to find transformation. None if not applicable
+        :type matches_count: int
+        """
+        self.source_path = source_path
+        self.transformation = transformation
+        self.matches_count = matches_count
+
+
 # pylint: disable=R0902
 class Stacker(QueueConsumer):
     """
@@ -54,8 +93,20 @@ class Stacker(QueueConsumer):
         self._size: int = 0
         self._last_stacking_result: Image = None
         self._align_reference: Image = None
+        self._reference_stars = dict()
+        self._phase_correlator: PhaseCorrelator = None
+        self._binned_reference_stars: ReferenceStars = None
+        self._motion_model = MotionModel()
         self._stacking_mode = I18n.STACKING_MODE_MEAN
         self._align_before_stack = True
+        self._warp_buffer: np.ndarray = None
+        self._accumulator: StackAccumulator = None
+        self._lock = threading.Lock()
+        self._session_index: List[StackedFrame] = []
+        # incremented each time stack content changes, so a restack knows if stack changed while it ran
+        self._stack_version: int = 0
+        self._restacking = False
+        self._last_matches_count: int = None
 
     @property
     @log
@@ -106,10 +157,233 @@ class Stacker(QueueConsumer):
         """
         Reset stacker to its starting state : No reference, no result and counter = 0.
         """
-        self._size = 0
-        self._last_stacking_result = None
-        self._align_reference = None
-        self.stack_size_changed_signal.emit(self.size)
+        with self._lock:
+            self._size = 0
+            self._last_stacking_result = None
+            self._release_accumulator()
+            self._align_reference = None
+            self._reference_stars.clear()
+            self._phase_correlator = None
+            self._binned_reference_stars = None
+            self._motion_model.reset()
+            self._session_index.clear()
+            self._stack_version += 1
+            self.stack_size_changed_signal.emit(self.size)
+
+    @property
+    def session_index(self) -> List[StackedFrame]:
+        """
+        Retrieves the session index : one entry per frame currently in the stack, in stacking order
+
+        :return: the session index
+        :rtype: list of StackedFrame
+        """
+        return list(self._session_index)
+
+    @log
+    def drop_last_frames(self, count: int) -> int:
+        """
+        Removes the most recently stacked frames from the stack, and publishes the resulting stack.
+
+        Frames are subtracted from the stacking accumulator, which only keeps a few of the last frames around
+        for that purpose, so less than count frames may be removed. Stack always keeps at least one frame.
+
+        :param count: how many frames to remove
+        :type count: int
+
+        :return: the number of frames actually removed
+        :rtype: int
+
+        :raises: StackingError if no frame could be removed
+        """
+        with self._lock:
+            if self._accumulator is None or self.size < 2:
+                raise StackingError("Stack has not enough frames")
+
+            removed_count = self._accumulator.remove_last(count)
+            if removed_count == 0:
+                raise StackingError(f"No recent frame is kept in {self._stacking_mode} mode")
+
+            result = Image(self._accumulator.get_result())
+            result.bayer_pattern = self._last_stacking_result.bayer_pattern
+            result.origin = self._last_stacking_result.origin
+            result.timestamp = self._last_stacking_result.timestamp
+
+            # removed frames may have been badly tracked : don't trust them for next predictions
+            self._motion_model.reset()
+            del self._session_index[-removed_count:]
+
+            self._last_stacking_result = result
+            self._stack_version += 1
+            self.size -= removed_count
+            self.new_result_signal.emit(result)
+
+            return removed_count
+
+    @property
+    def is_restacking(self) -> bool:
+        """
+        Tells if a restack is running
+
+        :return: True if a restack is running, False otherwise
+        :rtype: bool
+        """
+        return self._restacking
+
+    @log
+    def restack(self, load_frame: Callable[[str], Image]):
+        """
+        Stacks all indexed frames again, using current stacking mode, without searching alignment transformations.
+
+        Frames are loaded and warped using their cached transformations in parallel, then accumulated in their
+        original order. New stacking result is published once all frames are stacked.
+
+        Stack is only locked while taking a snapshot of its index and while swapping in the new result, so incoming
+        frames are not blocked meanwhile. If stack changed while restacking, the new result is discarded.
+
+        :param load_frame: function loading a frame from its source path and running pre-processing on it.
+                           It returns None if frame could not be loaded and may raise ProcessingError
+        :type load_frame: callable
+
+        :raises: StackingError if stack cannot be restacked
+        """
+        with self._lock:
+            if self._restacking:
+                raise StackingError("A restack is already running")
+
+            index = list(self._session_index)
+
+            if not index or self._last_stacking_result is None:
+                raise StackingError("No frame to restack")
+
+            if any(frame.source_path is None for frame in index):
+                raise StackingError("Some stacked frames were not read from files")
+
+            if self._align_before_stack and any(frame.transformation is None for frame in index):
+                raise StackingError("Some stacked frames were not aligned and have no cached transformation")
+
+            shape = self._last_stacking_result.data.shape
+            align = self._align_before_stack
+            stacking_mode = self._stacking_mode
+            stack_version = self._stack_version
+            accumulator = self._create_accumulator(shape)
+            self._restacking = True
+
+        self.busy_signal.emit()
+        try:
+            with Timer() as restack_timer:
+                result, restacked_index = self._restack_frames(index, load_frame, accumulator, shape, align)
+
+            with self._lock:
+                if self._stack_version != stack_version or self._stacking_mode != stacking_mode:
+                    accumulator.close()
+                    raise StackingError("Stack changed while restacking. Restack result is DISCARDED")
+
+                self._release_accumulator()
+                self._accumulator = accumulator
+                self._session_index = restacked_index
+                self._last_stacking_result = result
+                self._stack_version += 1
+                self._motion_model.reset()
+                self.size = len(restacked_index)
+                self.new_result_signal.emit(result)
+        finally:
+            self._restacking = False
+            self.waiting_signal.emit()
+
+        _LOGGER.info(f"Restacked {len(restacked_index)} frames in {stacking_mode} mode in "
+                     f"{restack_timer.elapsed_in_milli_as_str} ms")
+
+    # pylint: disable=R0914
+    @log
+    def _restack_frames(self, index: List[StackedFrame], load_frame: Callable[[str], Image],
+                        accumulator: StackAccumulator, shape: tuple, align: bool):
+        """
+        Loads, warps and accumulates indexed frames into a new accumulator. Stack itself is left untouched.
+
+        :param index: the frames to restack
+        :type index: list of StackedFrame
+
+        :param load_frame: function loading a frame from its source path and running pre-processing on it
+        :type load_frame: callable
+
+        :param accumulator: the new accumulator, closed on failure
+        :type accumulator: StackAccumulator
+
+        :param shape: shape of stacked data
+        :type shape: tuple
+
+        :param align: are frames warped using their cached transformations ?
+        :type align: bool
+
+        :return: the new stacking result and the index of actually restacked frames
+        :rtype: tuple(Image, list of StackedFrame)
+
+        :raises: StackingError if no frame could be restacked
+        """
+        def prepare_frame(frame: StackedFrame) -> Image:
+            try:
+                image = load_frame(frame.source_path)
+            except ProcessingError as processing_error:
+                _LOGGER.warning(f"Could not pre-process {frame.source_path} : {processing_error}")
+                return None
+
+            if image is None or image.data.shape != shape:
+                return None
+
+            if align:
+                aligned_data = np.empty(shape, dtype=np.float32)
+                Stacker._warp_image_data(image, frame.transformation, aligned_data)
+                image.data = aligned_data
+
+            return image
+
+        restacked_index = []
+        last_image = None
+
+        try:
+            with ThreadPoolExecutor(max_workers=_RESTACK_WORKER_COUNT) as executor:
+
+                # keep a bounded number of frames in flight, so memory use does not depend on frames count
+                frames = iter(index)
+                pending = deque()
+                for frame in frames:
+                    pending.append((frame, executor.submit(prepare_frame, frame)))
+                    if len(pending) == 2 * _RESTACK_WORKER_COUNT:
+                        break
+
+                while pending:
+                    frame, future = pending.popleft()
+                    image = future.result()
+
+                    next_frame = next(frames, None)
+                    if next_frame is not None:
+                        pending.append((next_frame, executor.submit(prepare_frame, next_frame)))
+
+                    if image is None:
+                        MESSAGE_HUB.dispatch_warning(__name__,
+                                                     QT_TRANSLATE_NOOP("", "Could not restack {}. Frame is DISCARDED"),
+                                                     [frame.source_path])
+                        continue
+
+                    accumulator.add(image.data)
+                    restacked_index.append(frame)
+                    last_image = image
+
+        except OSError as os_error:
+            accumulator.close()
+            raise StackingError(os_error)
+
+        if last_image is None:
+            accumulator.close()
+            raise StackingError("None of the indexed frames could be restacked")
+
+        result = Image(accumulator.get_result())
+        result.bayer_pattern = last_image.bayer_pattern
+        result.origin = last_image.origin
+        result.timestamp = last_image.timestamp
+
+        return result, restacked_index
 
     @log
     def _publish_stacking_result(self, image: Image):
@@ -120,6 +394,7 @@ class Stacker(QueueConsumer):
         :type image: Image
         """
         self._last_stacking_result = image
+        self._stack_version += 1
         self.size += 1
         self.new_result_signal.emit(image)
 
@@ -149,35 +424,51 @@ class Stacker(QueueConsumer):
     @log
     def _handle_image(self, image: Image):
 
-        if self.size == 0:
-            _LOGGER.debug("This is the first image for this stack. Publishing right away")
-            self._publish_stacking_result(image)
-            self._align_reference = image
-
-        else:
+        with self._lock:
             try:
-                if not image.is_same_shape_as(self._last_stacking_result):
-                    raise StackingError(
-                        "Image dimensions or color don't match stack content. "
-                        f"New image shape : {image.data.shape} <=> "
-                        f"Reference shape : {self._last_stacking_result.data.shape}"
-                    )
-
-                try:
-                    if self._align_before_stack:
-
-                        # alignment is a memory greedy process, we take special care of such errors
-                        try:
-                            self._align_image(image)
-                        except OSError as os_error:
-                            raise StackingError(os_error)
-
-                    self._stack_image(image)
-
-                except AttributeError:
-                    raise StackingError("Our reference images are gone.")
-
-                self._publish_stacking_result(image)
+                if self.size == 0:
+                    _LOGGER.debug("This is the first image for this stack. Publishing right away")
+                    self._release_accumulator()
+                    self._accumulator = self._create_accumulator(image.data.shape)
+                    self._accumulator.add(image.data)
+                    self._session_index.clear()
+                    self._session_index.append(StackedFrame(image.source_path,
+                                                            SimilarityTransform() if self._align_before_stack else None,
+                                                            None))
+                    self._publish_stacking_result(image)
+                    self._align_reference = image
+                    self._reference_stars.clear()
+                    self._phase_correlator = None
+                    self._binned_reference_stars = None
+                    self._motion_model.reset()
+
+                else:
+                    if not image.is_same_shape_as(self._last_stacking_result):
+                        raise StackingError(
+                            "Image dimensions or color don't match stack content. "
+                            f"New image shape : {image.data.shape} <=> "
+                            f"Reference shape : {self._last_stacking_result.data.shape}"
+                        )
+
+                    try:
+                        stacked_frame = StackedFrame(image.source_path, None, None)
+
+                        if self._align_before_stack:
+
+                            # alignment is a memory greedy process, we take special care of such errors
+                            try:
+                                stacked_frame.transformation = self._align_image(image)
+                                stacked_frame.matches_count = self._last_matches_count
+                            except OSError as os_error:
+                                raise StackingError(os_error)
+
+                        self._stack_image(image)
+                        self._session_index.append(stacked_frame)
+
+                    except AttributeError:
+                        raise StackingError("Our reference images are gone.")
+
+                    self._publish_stacking_result(image)
 
             except StackingError as stacking_error:
                 message = QT_TRANSLATE_NOOP("", "Could not stack image {} : {}. Image is DISCARDED")
@@ -192,25 +483,35 @@ class Stacker(QueueConsumer):
 
         :param image: the image to be aligned
         :type image: Image
+
+        :return: the transformation used to align image
+        :rtype: skimage.transform._geometric.SimilarityTransform
         """
 
+        timestamp = image.timestamp if image.timestamp is not None else time()
+
         with Timer() as find_timer:
-            transformation = self._find_transformation(image)
+            transformation = self._find_transformation(image, timestamp)
         _LOGGER.debug(f"Found transformation for alignment of {image.origin} in "
                       f"{find_timer.elapsed_in_milli_as_str} ms")
 
+        self._motion_model.record(timestamp, transformation)
+
         with Timer() as apply_timer:
             self._apply_transformation(image, transformation)
         _LOGGER.debug(f"Applied transformation for alignment of {image.origin} in "
                       f"{apply_timer.elapsed_in_milli_as_str} ms")
 
+        return transformation
+
     @log
     def _apply_transformation(self, image: Image, transformation: SimilarityTransform):
         """
         Apply a transformation to an image.
 
-        If image is color, channels are processed using multiprocessing, allowing global operation to take less time on
-        a multi core CPU
+        Channels are warped one after the other by our multi-threaded float32 warp engine. Raw CFA data is warped
+        Bayer sub-plane by sub-plane. Result is written to a preallocated buffer, which is then swapped with original
+        image data : former image data will receive next image's warp result.
 
         Image is modified in place by this function
 
@@ -220,113 +521,138 @@ class Stacker(QueueConsumer):
         :param transformation: the transformation to apply
         :type transformation: skimage.transform._geometric.SimilarityTransform
         """
-        if image.is_color():
-            _LOGGER.debug(f"Aligning color image...")
-
-            manager = Manager()
-            results_dict = manager.dict()
-            channel_processors = []
-
-            for channel in range(3):
-                processor = Process(target=Stacker._apply_single_channel_transformation,
-                                    args=[image,
-                                          self._last_stacking_result,
-                                          transformation,
-                                          results_dict,
-                                          channel])
-                processor.start()
-                channel_processors.append(processor)
+        destination = self._warp_buffer
 
-            for processor in channel_processors:
-                processor.join()
+        if destination is None or destination.shape != image.data.shape:
+            destination = np.empty(image.data.shape, dtype=np.float32)
 
-            _LOGGER.debug("Color channel processes are done. Fetching results and storing results...")
+        Stacker._warp_image_data(image, transformation, destination)
 
-            for channel, data in results_dict.items():
-                image.data[channel] = data
-
-            _LOGGER.debug(f"Aligning color image DONE")
+        source = image.data
+        image.data = destination
 
+        if source.dtype == np.float32 and source.flags.c_contiguous:
+            self._warp_buffer = source
         else:
-            _LOGGER.debug(f"Aligning b&w image...")
+            self._warp_buffer = None
+
+    @staticmethod
+    def _warp_image_data(image: Image, transformation: SimilarityTransform, destination: np.ndarray):
+        """
+        Warps image data using a transformation found on its alignment data
 
-            result_dict = dict()
+        :param image: the image to warp
+        :type image: Image
 
-            Stacker._apply_single_channel_transformation(
-                image,
-                self._last_stacking_result,
-                transformation,
-                result_dict
-            )
+        :param transformation: the transformation to apply, in alignment data coordinates
+        :type transformation: skimage.transform._geometric.SimilarityTransform
 
-            image.data = result_dict[0]
+        :param destination: preallocated float32 array receiving the result
+        :type destination: numpy.ndarray
+        """
+        inverse_matrix = np.linalg.inv(transformation.params)
 
-            _LOGGER.debug(f"Aligning b&w image : DONE")
+        if image.needs_debayering():
+            warp_affine_cfa(image.data, inverse_matrix, destination)
+        else:
+            warp_affine(image.data, inverse_matrix, destination)
 
     @staticmethod
-    def _apply_single_channel_transformation(image, reference, transformation, results_dict, channel=None):
+    def _get_alignment_data(image: Image) -> np.ndarray:
         """
-        apply a transformation on a specific channel (RGB) of a color image, or whole data of a b&w image.
+        Retrieves the single channel data used to align an image : green channel if image has color, green
+        superpixel data if image is raw CFA data, whole data otherwise
 
-        :param image: the image to apply transformation to
+        :param image: the image
         :type image: Image
 
-        :param reference: the align reference image
-        :type reference: Image
+        :return: the data to use for alignment
+        :rtype: numpy.ndarray
+        """
+        if image.is_color():
+            return image.data[1]
 
-        :param transformation: the transformation to apply
-        :type transformation: skimage.transform._geometric.SimilarityTransform
+        if image.needs_debayering():
+            return green_superpixel(image.data, image.bayer_pattern)
 
-        :param results_dict: the dict into which transformation result is to be stored. dict key is the channel number
-               for a color image, or 0 for a b&w image
-        :type results_dict: dict
+        return image.data
 
-        :param channel: the 0 indexed number of the color channel to process (0=red, 1=green, 2=blue)
-        :type channel: int
+    @log
+    def _get_alignment_shape(self) -> tuple:
         """
+        Retrieves the shape of alignment data for current stack
 
-        if channel is not None:
-            target_index = channel
-            source_data = image.data[channel]
-            reference_data = reference.data[channel]
-        else:
-            target_index = 0
-            source_data = image.data
-            reference_data = reference.data
+        :return: height and width of alignment data
+        :rtype: tuple
+        """
+        height, width = self._last_stacking_result.data.shape[-2:]
+
+        if self._last_stacking_result.needs_debayering():
+            return height // 2, width // 2
 
-        results_dict[target_index] = np.float32(al.apply_transform(transformation, source_data, reference_data))
+        return height, width
 
+    # pylint: disable=R0914
     @log
-    def _find_transformation(self, image: Image):
+    def _find_transformation(self, image: Image, timestamp: float):
         """
-        Iteratively try and find a valid transformation to align image with stored align reference.
+        Find a valid transformation to align image with stored align reference.
+
+        We first try the transformation predicted by our motion model from previous images, confirmed on reference
+        stars.
 
-        We perform 3 tries with growing image sizes of a centered image subset : 10%, 30% and 100% of image size
+        Then we try the fast path : a translation estimated by phase correlation, confirmed on reference stars.
+
+        On large images, we then try star triangles matching on binned data, refined at full resolution.
+
+        If all these fail, we iteratively search a transformation using star triangles matching. We perform 3 tries with
+        growing image sizes of a centered image subset : 10%, 30% and 100% of image size
 
         :param image: the image to be aligned
         :type image: Image
 
+        :param timestamp: the image timestamp
+        :type timestamp: float
+
         :return: the found transformation
         :raises: StackingError when no transformation is found using the whole image
         """
 
+        alignment_data = Stacker._get_alignment_data(image)
+
+        predicted_transformation = self._motion_model.predict(timestamp)
+
+        if predicted_transformation is not None:
+            try:
+                return self._refine_transformation(alignment_data, predicted_transformation)
+            except StackingError as prediction_error:
+                _LOGGER.debug(f"Predicted transformation was not confirmed : {prediction_error}")
+
+        try:
+            return self._find_translation(alignment_data)
+        except StackingError as fast_path_error:
+            _LOGGER.debug(f"Phase correlation fast path failed : {fast_path_error}")
+
+        bin_factor = self._get_pyramid_bin_factor()
+
+        if bin_factor > 1:
+            try:
+                return self._find_transformation_on_binned_data(alignment_data, bin_factor)
+            # pylint: disable=W0703
+            except Exception as pyramid_error:
+                # astroalign raises Exception in some cases
+                _LOGGER.debug(f"Alignment on binned data failed : {pyramid_error}")
+
         for ratio in [.1, .33, 1.]:
 
             top, bottom, left, right = self._get_image_subset_boundaries(ratio)
-
-            # pick green channel if image has color
-            if image.is_color():
-                new_subset = image.data[1][top:bottom, left:right]
-                ref_subset = self._align_reference.data[1][top:bottom, left:right]
-            else:
-                new_subset = image.data[top:bottom, left:right]
-                ref_subset = self._align_reference.data[top:bottom, left:right]
+            new_subset = alignment_data[top:bottom, left:right]
 
             try:
                 _LOGGER.debug(f"Searching valid transformation on subset "
                               f"with ratio:{ratio} and shape: {new_subset.shape}")
 
-                transformation, matches = al.find_transform(new_subset, ref_subset)
+                transformation, matches = self._get_reference_stars(ratio).find_transform(new_subset)
 
                 _LOGGER.debug(f"Found transformation with subset ratio = {ratio}")
                 _LOGGER.debug(f"rotation : {transformation.rotation}")
@@ -335,10 +661,7 @@ class Stacker(QueueConsumer):
                 matches_count = len(matches[0])
                 _LOGGER.debug(f"image matched features count : {matches_count}")
 
-                minimum_matches_for_valid_transform = config.get_minimum_match_count()
-                if matches_count < minimum_matches_for_valid_transform:
-                    raise StackingError(f"Alignment matches count is lower than configured threshold : "
-                                        f"{matches_count} < {minimum_matches_for_valid_transform}.")
+                self._check_matches_count(matches_count)
 
                 return transformation
 
@@ -352,21 +675,195 @@ class Stacker(QueueConsumer):
                 _LOGGER.debug(f"Could not find valid transformation on subset with ratio = {ratio}.")
                 continue
 
+    def _check_matches_count(self, matches_count: int):
+        """
+        Checks that enough stars were matched for a transformation to be considered valid, and records that count
+
+        :param matches_count: how many stars were matched
+        :type matches_count: int
+
+        :raises: StackingError if matches count is lower than configured threshold
+        """
+        minimum_matches_for_valid_transform = config.get_minimum_match_count()
+        if matches_count < minimum_matches_for_valid_transform:
+            raise StackingError(f"Alignment matches count is lower than configured threshold : "
+                                f"{matches_count} < {minimum_matches_for_valid_transform}.")
+
+        self._last_matches_count = matches_count
+
+    @log
+    def _find_translation(self, alignment_data: np.ndarray) -> SimilarityTransform:
+        """
+        Fast alignment path for translation-only drift.
+
+        Shift is estimated by phase correlation, then confirmed and refined on reference stars.
+
+        :param alignment_data: data of the image to align
+        :type alignment_data: numpy.ndarray
+
+        :return: the found transformation
+        :raises: StackingError if shift could not be confirmed
+        """
+        if self._phase_correlator is None:
+            self._phase_correlator = PhaseCorrelator(Stacker._get_alignment_data(self._align_reference))
+
+        with Timer() as correlation_timer:
+            shift_x, shift_y = self._phase_correlator.estimate_shift(alignment_data)
+        _LOGGER.debug(f"Phase correlation shift estimate : ({shift_x:.2f}, {shift_y:.2f}) found in "
+                      f"{correlation_timer.elapsed_in_milli_as_str} ms")
+
+        return self._refine_transformation(alignment_data, SimilarityTransform(translation=(-shift_x, -shift_y)))
+
+    @log
+    def _get_pyramid_bin_factor(self) -> int:
+        """
+        Retrieves the bin factor to use for coarse alignment, so binned data is not larger than a target size
+
+        :return: the bin factor. 1 means image is small enough to be aligned at full resolution
+        :rtype: int
+        """
+        width = max(self._get_alignment_shape())
+
+        if width <= _PYRAMID_TARGET_SIZE:
+            return 1
+
+        for factor in _PYRAMID_BIN_FACTORS:
+            if width / factor <= _PYRAMID_TARGET_SIZE:
+                return factor
+
+        return _PYRAMID_BIN_FACTORS[-1]
+
+    @log
+    def _find_transformation_on_binned_data(self, alignment_data: np.ndarray, bin_factor: int):
+        """
+        Coarse to fine alignment : find transformation on binned data, scale it up to full resolution, then
+        refine it on full resolution reference stars.
+
+        :param alignment_data: data of the image to align
+        :type alignment_data: numpy.ndarray
+
+        :param bin_factor: the bin factor
+        :type bin_factor: int
+
+        :return: the found transformation
+        :rtype: skimage.transform._geometric.SimilarityTransform
+
+        :raises: StackingError or any astroalign error if no valid transformation is found
+        """
+        if self._binned_reference_stars is None:
+            self._binned_reference_stars = ReferenceStars(
+                bin_data(Stacker._get_alignment_data(self._align_reference), bin_factor))
+
+        with Timer() as coarse_timer:
+            binned_transformation, matches = self._binned_reference_stars.find_transform(
+                bin_data(alignment_data, bin_factor))
+        _LOGGER.debug(f"Found transformation on {bin_factor}x{bin_factor} binned data in "
+                      f"{coarse_timer.elapsed_in_milli_as_str} ms. Matched features count : {len(matches[0])}")
+
+        self._check_matches_count(len(matches[0]))
+
+        # binned pixel (u, v) center is located at full resolution coordinates (f * u + c, f * v + c)
+        center_offset = (bin_factor - 1) / 2
+        scale_up = np.array([[bin_factor, 0, center_offset],
+                             [0, bin_factor, center_offset],
+                             [0, 0, 1]])
+        full_resolution_transformation = SimilarityTransform(
+            matrix=scale_up @ binned_transformation.params @ np.linalg.inv(scale_up))
+
+        return self._refine_transformation(alignment_data, full_resolution_transformation)
+
+    @log
+    def _refine_transformation(self, alignment_data: np.ndarray, transformation: SimilarityTransform):
+        """
+        Checks a candidate transformation on the brightest reference stars and refines it on confirmed ones.
+
+        Reference stars are projected into image using the candidate transformation, then their actual positions
+        are measured around these predictions. Refined transformation is fitted on confirmed star pairs.
+
+        :param alignment_data: data of the image to align
+        :type alignment_data: numpy.ndarray
+
+        :param transformation: the candidate transformation
+        :type transformation: skimage.transform._geometric.SimilarityTransform
+
+        :return: the refined transformation
+        :rtype: skimage.transform._geometric.SimilarityTransform
+
+        :raises: StackingError if candidate transformation is not confirmed
+        """
+        top, _, left, _ = self._get_image_subset_boundaries(1.)
+        reference_positions = self._get_reference_stars(1.).control_points + (left, top)
+
+        if len(reference_positions) == 0:
+            raise StackingError("No reference star available")
+
+        predicted_positions = transformation.inverse(reference_positions)
+        found, measured_positions = measure_star_positions(alignment_data,
+                                                            predicted_positions,
+                                                            estimate_noise(alignment_data))
+
+        confirmed = found & (np.linalg.norm(measured_positions - predicted_positions, axis=1) < al.PIXEL_TOL)
+        confirmed_count = int(np.count_nonzero(confirmed))
+        self._check_matches_count(confirmed_count)
+
+        refined_transformation = SimilarityTransform()
+        if not refined_transformation.estimate(measured_positions[confirmed], reference_positions[confirmed]):
+            raise StackingError("Could not fit transformation on confirmed stars")
+
+        residuals = refined_transformation(measured_positions[confirmed]) - reference_positions[confirmed]
+        rms_residual = float(np.sqrt(np.mean(np.sum(residuals ** 2, axis=1))))
+
+        _LOGGER.debug(f"Refined transformation on {confirmed_count} stars. RMS residual : {rms_residual:.3f} px, "
+                      f"rotation : {refined_transformation.rotation}, "
+                      f"translation : {refined_transformation.translation}, "
+                      f"scale : {refined_transformation.scale}")
+
+        if rms_residual > _MAX_REFINED_RMS_RESIDUAL:
+            raise StackingError(f"Refined transformation residual is too high : {rms_residual:.3f} px")
+
+        if abs(refined_transformation.scale - 1) > _MAX_REFINED_SCALE_ERROR:
+            raise StackingError(f"Refined transformation scale is off : {refined_transformation.scale}")
+
+        return refined_transformation
+
+    @log
+    def _get_reference_stars(self, ratio: float) -> ReferenceStars:
+        """
+        Retrieves alignment features of the align reference subset matching a specific ratio.
+
+        Features are extracted on first request and cached until align reference changes
+
+        :param ratio: size ratio of subset vs stacking result
+        :type ratio: float
+
+        :return: the reference features
+        :rtype: ReferenceStars
+        """
+        if ratio not in self._reference_stars:
+            top, bottom, left, right = self._get_image_subset_boundaries(ratio)
+            ref_subset = Stacker._get_alignment_data(self._align_reference)[top:bottom, left:right]
+
+            with Timer() as extraction_timer:
+                self._reference_stars[ratio] = ReferenceStars(ref_subset)
+            _LOGGER.debug(f"Extracted reference features for subset ratio {ratio} in "
+                          f"{extraction_timer.elapsed_in_milli_as_str} ms")
+
+        return self._reference_stars[ratio]
+
     @log
     def _get_image_subset_boundaries(self, ratio: float):
         """
         Retrieves a tuple of 4 int values representing the limits of a centered box (a.k.a. subset) as big as
-        ratio * stored stacking result's size
+        ratio * alignment data size
 
-        :param ratio: size ratio of subset vs stacking result
+        :param ratio: size ratio of subset vs alignment data
         :type ratio: float
 
         :return: a tuple of 4 int for top, bottom, left, right
         :rtype: tuple
         """
 
-        width = self._last_stacking_result.width
-        height = self._last_stacking_result.height
+        height, width = self._get_alignment_shape()
 
         horizontal_margin = int((width - (width * ratio)) / 2)
         vertical_margin = int((height - (height * ratio)) / 2)
@@ -378,22 +875,64 @@ class Stacker(QueueConsumer):
 
         return top, bottom, left, right
 
+    @log
+    def _create_accumulator(self, shape: tuple):
+        """
+        Creates the stacking accumulator matching user defined stacking mode
+
+        :param shape: shape of the data to stack
+        :type shape: tuple
+
+        :return: the accumulator
+        :rtype: StackAccumulator
+
+        :raises: StackingError if stacking mode is not supported
+        """
+        if self._stacking_mode == I18n.STACKING_MODE_SUM:
+            return SumAccumulator(shape, average=False)
+
+        if self._stacking_mode == I18n.STACKING_MODE_MEAN:
+            return SumAccumulator(shape, average=True)
+
+        if self._stacking_mode == I18n.STACKING_MODE_SIGMA_CLIP:
+            return SigmaClipAccumulator(shape)
+
+        windowed_accumulator_types = {
+            I18n.STACKING_MODE_WINDOWED_MEDIAN: WindowedMedianAccumulator,
+            I18n.STACKING_MODE_SLIDING_MEAN: SlidingMeanAccumulator,
+        }
+
+        if self._stacking_mode in windowed_accumulator_types:
+            try:
+                return windowed_accumulator_types[self._stacking_mode](shape,
+                                                                       config.get_stacking_window_size(),
+                                                                       config.get_work_folder_path())
+            except OSError as os_error:
+                raise StackingError(f"Could not create frames buffer : {os_error}")
+
+        raise StackingError(f"Unsupported stacking mode : {self._stacking_mode}")
+
+    @log
+    def _release_accumulator(self):
+        """
+        Releases current stacking accumulator, if any
+        """
+        if self._accumulator is not None:
+            self._accumulator.close()
+            self._accumulator = None
+
     @log
     def _stack_image(self, image: Image):
         """
         Compute stacking according to user defined stacking mode
 
-        the image data is modified in place by this function
+        the image data is modified in place by this function : it receives the new stacking result
 
         :param image: the image to be stacked
         :type image: Image
         """
 
         _LOGGER.debug(f"Stacking in {self._stacking_mode} mode...")
-        if self._stacking_mode == I18n.STACKING_MODE_SUM:
-            image.data = image.data + self._last_stacking_result.data
-        elif self._stacking_mode == I18n.STACKING_MODE_MEAN:
-            image.data = (self.size * self._last_stacking_result.data + image.data) / (self.size + 1)
-        else:
-            raise StackingError(f"Unsupported stacking mode : {self._stacking_mode}")
+        self._accumulator.add(image.data)
+        image.data = self._accumulator.get_result()
         _LOGGER.debug(f"Stacking in {self._stacking_mode} done.")
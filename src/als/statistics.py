@@ -0,0 +1,219 @@
+"""
+Provides image statistics, answered from per-channel 16 bits histograms
+"""
+import logging
+from typing import List
+
+import cv2
+import numpy as np
+
+from als.code_utilities import log
+
+_LOGGER = logging.getLogger(__name__)
+
+_HISTOGRAM_SIZE = 2 ** 16
+
+# above that pixel count, histograms are computed on a strided subsample of each channel
+_HISTOGRAM_MAX_SAMPLE_SIZE = 2 ** 22
+
+_MIN_MAX_DTYPES = (np.uint8, np.int8, np.uint16, np.int16, np.int32, np.float32, np.float64)
+_HISTOGRAM_DTYPES = (np.uint8, np.uint16, np.float32)
+
+
+class ImageStatistics:
+    """
+    Statistics of image data : minimum, maximum, percentiles, median and median absolute deviation, per channel.
+
+    Minimum and maximum are exact, and computed at creation. All other statistics are answered from a histogram of
+    each channel, computed on first need : its 65536 bins evenly span channel data range. Integer data spanning less
+    than 65536 values gets one bin per value, so its statistics are exact. Other data statistics are quantized to
+    1/65535 of channel data range.
+
+    Histograms of big images are computed on a strided subsample.
+    """
+
+    @log
+    def __init__(self, data: np.ndarray, color_axis: int = None, stride: int = None):
+        """
+        Computes minimum and maximum of image data
+
+        :param data: image data
+        :type data: numpy.ndarray
+
+        :param color_axis: axis holding colors, or None for B&W data
+        :type color_axis: int
+
+        :param stride: subsampling step used for histograms, along both image axes. If None, it is chosen so each
+          histogram is computed on at most about 4 million values
+        :type stride: int
+        """
+        if color_axis is None:
+            self._channels = [data]
+        else:
+            leading_axes = (slice(None),) * color_axis
+            self._channels = [data[leading_axes + (channel,)] for channel in range(data.shape[color_axis])]
+
+        if stride is None:
+            stride = max(1, int(np.ceil(np.sqrt(self._channels[0].size / _HISTOGRAM_MAX_SAMPLE_SIZE))))
+        self._stride = stride
+        self._is_integer = np.issubdtype(data.dtype, np.integer)
+
+        bounds = [ImageStatistics._compute_min_max(channel) for channel in self._channels]
+        self._minimums = [low for low, _ in bounds]
+        self._maximums = [high for _, high in bounds]
+
+        self._cumulative_histograms: List[np.ndarray] = [None] * len(self._channels)
+
+    @property
+    def channel_count(self):
+        """
+        Retrieves channel count
+
+        :return: 1 for B&W data, color count otherwise
+        :rtype: int
+        """
+        return len(self._channels)
+
+    def minimum(self, channel: int = None) -> float:
+        """
+        Retrieves data minimum
+
+        :param channel: channel index, or None for minimum over all channels
+        :type channel: int
+
+        :return: the minimum
+        :rtype: float
+        """
+        return min(self._minimums) if channel is None else self._minimums[channel]
+
+    def maximum(self, channel: int = None) -> float:
+        """
+        Retrieves data maximum
+
+        :param channel: channel index, or None for maximum over all channels
+        :type channel: int
+
+        :return: the maximum
+        :rtype: float
+        """
+        return max(self._maximums) if channel is None else self._maximums[channel]
+
+    @log
+    def percentiles(self, percents: List[float], channel: int = 0) -> List[float]:
+        """
+        Retrieves percentiles of a channel
+
+        :param percents: the wanted percentiles, each in [0, 100]
+        :type percents: List[float]
+
+        :param channel: channel index
+        :type channel: int
+
+        :return: the percentiles, in the same order as requested
+        :rtype: List[float]
+        """
+        cumulative_histogram = self._get_cumulative_histogram(channel)
+        ranks = np.clip(np.asarray(percents, dtype=np.float64), 0, 100) / 100 * (cumulative_histogram[-1] - 1)
+        bins = np.searchsorted(cumulative_histogram, ranks, side='right')
+
+        return [self._get_bin_value(channel, histogram_bin) for histogram_bin in bins]
+
+    def median(self, channel: int = 0) -> float:
+        """
+        Retrieves median of a channel
+
+        :param channel: channel index
+        :type channel: int
+
+        :return: the median
+        :rtype: float
+        """
+        return self.percentiles([50], channel)[0]
+
+    @log
+    def median_absolute_deviation(self, channel: int = 0) -> float:
+        """
+        Retrieves median absolute deviation of a channel, around its median
+
+        :param channel: channel index
+        :type channel: int
+
+        :return: the median absolute deviation
+        :rtype: float
+        """
+        cumulative_histogram = self._get_cumulative_histogram(channel)
+        median_bin = np.searchsorted(cumulative_histogram, (cumulative_histogram[-1] - 1) / 2, side='right')
+
+        # count of values within each possible bin distance from median bin
+        distances = np.arange(_HISTOGRAM_SIZE)
+        upper_counts = cumulative_histogram[np.minimum(median_bin + distances, _HISTOGRAM_SIZE - 1)]
+        lower_bins = median_bin - distances - 1
+        lower_counts = np.where(lower_bins >= 0, cumulative_histogram[np.maximum(lower_bins, 0)], 0)
+
+        distance = np.searchsorted(upper_counts - lower_counts, cumulative_histogram[-1] / 2, side='left')
+
+        return self._get_bin_width(channel) * float(distance)
+
+    def _get_bin_width(self, channel: int) -> float:
+        data_range = self._maximums[channel] - self._minimums[channel]
+
+        if self._is_integer and data_range < _HISTOGRAM_SIZE:
+            return 1.
+
+        return data_range / (_HISTOGRAM_SIZE - 1)
+
+    def _get_bin_value(self, channel: int, histogram_bin: int) -> float:
+        return self._minimums[channel] + self._get_bin_width(channel) * float(histogram_bin)
+
+    def _get_cumulative_histogram(self, channel: int) -> np.ndarray:
+        """
+        Retrieves cumulative histogram of a channel, computing it if needed.
+
+        Bin i counts values closest to : channel minimum + i * bin width
+
+        :param channel: channel index
+        :type channel: int
+
+        :return: the cumulative histogram
+        :rtype: numpy.ndarray
+        """
+        if self._cumulative_histograms[channel] is None:
+
+            sample = self._channels[channel][::self._stride, ::self._stride]
+            if sample.dtype not in _HISTOGRAM_DTYPES:
+                sample = sample.astype(np.float32)
+
+            bin_width = self._get_bin_width(channel)
+            if bin_width == 0:
+                # all values are equal : they all are in first bin
+                bin_width = 1.
+
+            lower_bound = self._minimums[channel] - bin_width / 2
+
+            histogram = cv2.calcHist(
+                [np.ascontiguousarray(sample)],
+                [0],
+                None,
+                [_HISTOGRAM_SIZE],
+                [lower_bound, lower_bound + bin_width * _HISTOGRAM_SIZE])
+
+            self._cumulative_histograms[channel] = np.cumsum(histogram.ravel(), dtype=np.int64)
+
+        return self._cumulative_histograms[channel]
+
+    @staticmethod
+    def _compute_min_max(channel: np.ndarray):
+        """
+        Computes minimum and maximum of a channel, in a single pass if possible
+
+        :param channel: channel data
+        :type channel: numpy.ndarray
+
+        :return: minimum and maximum
+        :rtype: tuple(float, float)
+        """
+        if channel.dtype in _MIN_MAX_DTYPES:
+            low, high, _, _ = cv2.minMaxLoc(channel)
+            return float(low), float(high)
+
+        return float(channel.min()), float(channel.max())
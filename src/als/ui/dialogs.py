@@ -12,7 +12,7 @@ from als import config
 from als.code_utilities import log
 from als.logic import Controller
 from als.messaging import MESSAGE_HUB
-from als.model.data import VERSION, DYNAMIC_DATA, I18n
+from als.model.data import VERSION, DYNAMIC_DATA, I18n, BINNING_MODES
 from generated.about_ui import Ui_AboutDialog
 from generated.prefs_ui import Ui_PrefsDialog
 from generated.save_wait_ui import Ui_SaveWaitDialog
@@ -43,6 +43,10 @@ class PreferencesDialog(QDialog):
             self._ui.cmb_bayer_pattern.setItemData(pattern_index, self._ui.cmb_bayer_pattern.itemText(pattern_index))
         self._ui.cmb_bayer_pattern.setCurrentIndex(self._ui.cmb_bayer_pattern.findData(config.get_bayer_pattern()))
 
+        for mode_index, binning_mode in enumerate(BINNING_MODES):
+            self._ui.cmb_binning_mode.setItemData(mode_index, binning_mode)
+        self._ui.cmb_binning_mode.setCurrentIndex(self._ui.cmb_binning_mode.findData(config.get_binning_mode()))
+
         self._ui.ln_scan_folder_path.setText(config.get_scan_folder_path())
         self._ui.ln_work_folder_path.setText(config.get_work_folder_path())
         self._ui.ln_web_folder_path.setText(config.get_web_folder_path())
@@ -50,9 +54,19 @@ class PreferencesDialog(QDialog):
         self._ui.spn_webpage_refresh_period.setValue(config.get_www_server_refresh_period())
         self._ui.chk_debug_logs.setChecked(config.is_debug_log_on())
         self._ui.spn_minimum_match_count.setValue(config.get_minimum_match_count())
+        self._ui.spn_stacking_window_size.setValue(config.get_stacking_window_size())
         self._ui.chk_use_dark.setChecked(config.get_use_master_dark())
         self._ui.ln_master_dark_path.setText(config.get_master_dark_file_path())
+        self._ui.chk_use_calibration_library.setChecked(config.get_use_calibration_library())
+        self._ui.ln_calibration_folder_path.setText(config.get_calibration_library_folder_path())
         self._ui.chk_use_hpr.setChecked(config.get_hot_pixel_remover())
+        self._ui.chk_use_defect_map.setChecked(config.get_use_defect_map())
+        self._ui.dspn_defect_map_sigma.setValue(config.get_defect_map_sigma())
+        self._ui.chk_stack_cfa.setChecked(config.get_stack_cfa())
+        self._ui.chk_use_quality_filter.setChecked(config.get_use_frame_quality_filter())
+        self._ui.spn_quality_min_stars.setValue(config.get_quality_minimum_star_count())
+        self._ui.spn_quality_max_background.setValue(config.get_quality_maximum_background())
+        self._ui.dspn_quality_max_fwhm.setValue(config.get_quality_maximum_fwhm())
         self._ui.chk_save_on_stop.setChecked(config.get_save_on_stop())
 
         config_to_image_save_type_mapping = {
@@ -86,6 +100,9 @@ class PreferencesDialog(QDialog):
         if self._ui.chk_www_own_folder.isChecked():
             paths_to_check.append(self._ui.ln_web_folder_path)
 
+        if self._ui.chk_use_calibration_library.isChecked():
+            paths_to_check.append(self._ui.ln_calibration_folder_path)
+
         for folder_path in paths_to_check:
 
             if not Path(folder_path.text()).is_dir():
@@ -109,6 +126,15 @@ class PreferencesDialog(QDialog):
         """
         self._validate_all_paths()
 
+    @log
+    def on_chk_use_calibration_library_toggled(self, _):
+        """
+        Triggers config values validation when chk_use_calibration_library is toggled
+
+        :param _: well, you know, we really don't care. This the method we call that will check this
+        """
+        self._validate_all_paths()
+
     @log
     @pyqtSlot(bool)
     def on_chk_www_own_folder_clicked(self, checked):
@@ -149,9 +175,19 @@ class PreferencesDialog(QDialog):
 
         web_server_port_number_str = self._ui.ln_web_server_port.text()
         config.set_minimum_match_count(self._ui.spn_minimum_match_count.value())
+        config.set_stacking_window_size(self._ui.spn_stacking_window_size.value())
         config.set_use_master_dark(self._ui.chk_use_dark.isChecked())
         config.set_master_dark_file_path(self._ui.ln_master_dark_path.text())
+        config.set_use_calibration_library(self._ui.chk_use_calibration_library.isChecked())
+        config.set_calibration_library_folder_path(self._ui.ln_calibration_folder_path.text())
         config.set_hot_pixel_remover(self._ui.chk_use_hpr.isChecked())
+        config.set_use_defect_map(self._ui.chk_use_defect_map.isChecked())
+        config.set_defect_map_sigma(self._ui.dspn_defect_map_sigma.value())
+        config.set_stack_cfa(self._ui.chk_stack_cfa.isChecked())
+        config.set_use_frame_quality_filter(self._ui.chk_use_quality_filter.isChecked())
+        config.set_quality_minimum_star_count(self._ui.spn_quality_min_stars.value())
+        config.set_quality_maximum_background(self._ui.spn_quality_max_background.value())
+        config.set_quality_maximum_fwhm(self._ui.dspn_quality_max_fwhm.value())
         config.set_save_on_stop(self._ui.chk_save_on_stop.isChecked())
 
         if web_server_port_number_str.isdigit() and 1024 <= int(web_server_port_number_str) <= 65535:
@@ -182,6 +218,7 @@ class PreferencesDialog(QDialog):
 
         config.set_lang(self._ui.cmb_lang.currentData())
         config.set_bayer_pattern(self._ui.cmb_bayer_pattern.currentData())
+        config.set_binning_mode(self._ui.cmb_binning_mode.currentData())
 
         PreferencesDialog._save_config()
 
@@ -223,6 +260,18 @@ class PreferencesDialog(QDialog):
 
         self._validate_all_paths()
 
+    @pyqtSlot(name="on_btn_browse_calibration_clicked")
+    @log
+    def browse_calibration(self):
+        """Opens a folder dialog to choose calibration library folder"""
+        calibration_folder_path = QFileDialog.getExistingDirectory(self,
+                                                                   self.tr("Select calibration library folder"),
+                                                                   self._ui.ln_calibration_folder_path.text())
+        if calibration_folder_path:
+            self._ui.ln_calibration_folder_path.setText(calibration_folder_path)
+
+        self._validate_all_paths()
+
     @pyqtSlot(name="on_btn_dark_scan_clicked")
     @log
     def browse_dark(self):
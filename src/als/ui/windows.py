@@ -50,7 +50,11 @@ class MainWindow(QMainWindow):
 
         # populate stacking mode combo box=
         self._ui.cb_stacking_mode.blockSignals(True)
-        stacking_modes = [I18n.STACKING_MODE_SUM, I18n.STACKING_MODE_MEAN]
+        stacking_modes = [I18n.STACKING_MODE_SUM,
+                          I18n.STACKING_MODE_MEAN,
+                          I18n.STACKING_MODE_SIGMA_CLIP,
+                          I18n.STACKING_MODE_WINDOWED_MEDIAN,
+                          I18n.STACKING_MODE_SLIDING_MEAN]
         for stacking_mode in stacking_modes:
             self._ui.cb_stacking_mode.addItem(stacking_mode)
         self._ui.cb_stacking_mode.setCurrentIndex(stacking_modes.index(self._controller.get_stacking_mode()))
@@ -59,6 +63,9 @@ class MainWindow(QMainWindow):
         # update align checkbox
         self._ui.chk_align.setChecked(self._controller.get_align_before_stack())
 
+        # update master dark checkbox
+        self._ui.chk_build_master_dark.setChecked(self._controller.get_build_master_dark())
+
         # update save every frame checkbox
         self._ui.chk_save_every_image.setChecked(self._controller.get_save_every_image())
 
@@ -436,6 +443,16 @@ class MainWindow(QMainWindow):
         """
         self._controller.set_align_before_stack(checked)
 
+    @log
+    def on_chk_build_master_dark_toggled(self, checked: bool):
+        """
+        Qt slot executed when 'build master dark' check box is changed
+
+        :param checked: is checkbox checked ?
+        :type checked: bool
+        """
+        self._controller.set_build_master_dark(checked)
+
     @log
     def on_chk_save_every_image_toggled(self, checked: bool):
         """
@@ -677,6 +694,11 @@ class MainWindow(QMainWindow):
             # handle align + stack mode buttons
             self._ui.chk_align.setEnabled(session_is_stopped)
             self._ui.cb_stacking_mode.setEnabled(session_is_stopped)
+            self._ui.chk_build_master_dark.setEnabled(session_is_stopped)
+            self._ui.btn_drop_last_frame.setEnabled(not session_is_stopped and DYNAMIC_DATA.stack_size > 1)
+            self._ui.btn_restack.setEnabled(session_is_stopped
+                                            and DYNAMIC_DATA.stack_size > 0
+                                            and not DYNAMIC_DATA.stacker_busy)
 
             # handle web stop start buttons
             self._ui.btn_web_start.setEnabled(not web_server_is_running)
@@ -719,6 +741,18 @@ class MainWindow(QMainWindow):
         """Qt slot for mouse clicks on the 'Pause' button"""
         self._controller.pause_session()
 
+    @pyqtSlot(name="on_btn_drop_last_frame_clicked")
+    @log
+    def cb_drop_last_frame(self):
+        """Qt slot for mouse clicks on the 'Drop last frame' button"""
+        self._controller.drop_last_frames()
+
+    @pyqtSlot(name="on_btn_restack_clicked")
+    @log
+    def cb_restack(self):
+        """Qt slot for mouse clicks on the 'Restack' button"""
+        self._controller.restack()
+
     @log
     def _start_www(self):
         """Starts web server"""
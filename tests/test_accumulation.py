@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from als.accumulation import SigmaClipAccumulator, SlidingMeanAccumulator, SumAccumulator, WindowedMedianAccumulator
+
+_SHAPE = (4, 5)
+
+
+def _add_frames(accumulator, values):
+    for value in values:
+        accumulator.add(np.full(_SHAPE, value, dtype=np.float32))
+
+
+def test_sigma_clip_accepts_changes_of_constant_pixels():
+    accumulator = SigmaClipAccumulator(_SHAPE)
+
+    _add_frames(accumulator, [1000.] * 6)
+    _add_frames(accumulator, [1005., 995., 1010.])
+
+    np.testing.assert_allclose(accumulator.get_result(), (6 * 1000. + 1005. + 995. + 1010.) / 9, rtol=1e-6)
+
+
+def test_sigma_clip_accepts_changes_of_constant_zero_pixels():
+    accumulator = SigmaClipAccumulator(_SHAPE)
+
+    _add_frames(accumulator, [0.] * 6)
+    _add_frames(accumulator, [2.])
+
+    np.testing.assert_allclose(accumulator.get_result(), 2. / 7, rtol=1e-6)
+
+
+def test_sigma_clip_still_rejects_outliers_of_constant_pixels():
+    accumulator = SigmaClipAccumulator(_SHAPE)
+
+    _add_frames(accumulator, [1000.] * 6)
+    _add_frames(accumulator, [60000.])
+
+    np.testing.assert_array_equal(accumulator.get_result(), 1000.)
+
+
+def _make_frames(count):
+    rng = np.random.default_rng(2)
+    frames = rng.normal(1000., 30., (count,) + _SHAPE).astype(np.float32)
+    # a few outliers, so kappa-sigma clipping rejects values from some frames
+    frames[5:, 1, 1] = 60000.
+    frames[6:, 2, 3] = 0.
+    return frames
+
+
+def _sigma_clip_variance(accumulator):
+    return accumulator._squared_deviations_sum / np.maximum(accumulator._pixel_counts - 1, 1)
+
+
+@pytest.mark.parametrize("removed_count", [1, 2, 3])
+@pytest.mark.parametrize("make_accumulator", [
+    lambda folder: SumAccumulator(_SHAPE, average=False),
+    lambda folder: SumAccumulator(_SHAPE, average=True),
+    lambda folder: SigmaClipAccumulator(_SHAPE),
+    lambda folder: WindowedMedianAccumulator(_SHAPE, 10, str(folder)),
+    lambda folder: SlidingMeanAccumulator(_SHAPE, 10, str(folder)),
+], ids=["sum", "mean", "kappa-sigma", "median", "sliding mean"])
+def test_remove_last_matches_fresh_accumulator(tmp_path, make_accumulator, removed_count):
+    frames = _make_frames(8)
+    accumulator = make_accumulator(tmp_path)
+    expected = make_accumulator(tmp_path)
+
+    for frame in frames:
+        accumulator.add(frame)
+    for frame in frames[:-removed_count]:
+        expected.add(frame)
+
+    assert accumulator.remove_last(removed_count) == removed_count
+    assert accumulator.count == expected.count == len(frames) - removed_count
+    np.testing.assert_allclose(accumulator.get_result(), expected.get_result(), rtol=1e-5)
+
+    if isinstance(accumulator, SigmaClipAccumulator):
+        np.testing.assert_array_equal(accumulator._pixel_counts, expected._pixel_counts)
+        np.testing.assert_allclose(_sigma_clip_variance(accumulator), _sigma_clip_variance(expected),
+                                   rtol=1e-3, atol=1e-2)
+
+    accumulator.close()
+    expected.close()
+
+
+@pytest.mark.parametrize("accumulator_class", [WindowedMedianAccumulator, SlidingMeanAccumulator])
+def test_remove_last_from_full_window_keeps_remaining_frames(tmp_path, accumulator_class):
+    frames = _make_frames(8)
+    accumulator = accumulator_class(_SHAPE, 4, str(tmp_path))
+    expected = accumulator_class(_SHAPE, 4, str(tmp_path))
+
+    for frame in frames:
+        accumulator.add(frame)
+    # frames which left the window can't come back : only frames 4 and 5 remain
+    for frame in frames[4:6]:
+        expected.add(frame)
+
+    assert accumulator.remove_last(2) == 2
+    np.testing.assert_allclose(accumulator.get_result(), expected.get_result(), rtol=1e-5)
+
+    accumulator.close()
+    expected.close()
+
+
+@pytest.mark.parametrize("make_accumulator, removable_count", [
+    (lambda folder: SumAccumulator(_SHAPE, average=True), 3),
+    (lambda folder: SigmaClipAccumulator(_SHAPE), 3),
+    (lambda folder: SigmaClipAccumulator(_SHAPE, removable_frames_count=0), 0),
+    (lambda folder: SlidingMeanAccumulator(_SHAPE, 10, str(folder)), 7),
+], ids=["mean", "kappa-sigma", "kappa-sigma without removable frames", "sliding mean"])
+def test_remove_last_is_bounded(tmp_path, make_accumulator, removable_count):
+    accumulator = make_accumulator(tmp_path)
+    for frame in _make_frames(8):
+        accumulator.add(frame)
+
+    assert accumulator.remove_last(8) == removable_count
+    assert accumulator.count == 8 - removable_count
+
+    accumulator.close()
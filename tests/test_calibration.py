@@ -0,0 +1,56 @@
+import io
+import os
+
+import numpy as np
+from astropy.io import fits
+
+from als import calibration
+from als.calibration import CalibrationLibrary, MASTER_TYPE_DARK
+
+
+def _write_in_place(path, frame_type):
+    header = fits.Header()
+    if frame_type is not None:
+        header['IMAGETYP'] = frame_type
+    content = io.BytesIO()
+    fits.writeto(content, np.zeros((8, 8), dtype=np.uint16), header)
+
+    # rewrite file content without touching folder entries, as a copy in progress or an in place overwrite does
+    mode = 'r+b' if path.exists() else 'wb'
+    with open(str(path), mode) as file:
+        file.write(content.getvalue())
+        file.truncate()
+
+
+def _refresh_later(library, folder, master_path, modification_time):
+    folder_modification_time = os.stat(str(folder)).st_mtime
+    os.utime(str(master_path), (modification_time, modification_time))
+    os.utime(str(folder), (folder_modification_time, folder_modification_time))
+    library.refresh(str(folder))
+
+
+def test_library_finds_master_completed_in_place(tmp_path, monkeypatch):
+    master_path = tmp_path / "dark.fits"
+    _write_in_place(master_path, None)
+    library = CalibrationLibrary()
+    library.refresh(str(tmp_path))
+    assert library.masters == []
+
+    monkeypatch.setattr(calibration, '_LIBRARY_REFRESH_PERIOD_IN_SEC', 0)
+    _write_in_place(master_path, 'Dark Frame')
+    _refresh_later(library, tmp_path, master_path, master_path.stat().st_mtime + 10)
+
+    assert [master.master_type for master in library.masters] == [MASTER_TYPE_DARK]
+
+
+def test_library_rescans_unchanged_folder_at_most_once_per_period(tmp_path, monkeypatch):
+    master_path = tmp_path / "dark.fits"
+    _write_in_place(master_path, None)
+    library = CalibrationLibrary()
+    library.refresh(str(tmp_path))
+
+    monkeypatch.setattr(calibration, '_LIBRARY_REFRESH_PERIOD_IN_SEC', 3600)
+    _write_in_place(master_path, 'Dark Frame')
+    _refresh_later(library, tmp_path, master_path, master_path.stat().st_mtime + 10)
+
+    assert library.masters == []
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from scipy.signal import convolve2d
+
+from als.crunching import (replace_hot_pixels, bin_data, bin_cfa, superpixel_debayer, green_superpixel,
+                           warp_affine_cfa)
+
+_HOT_PIXEL_RATIO = 2
+_BAYER_PATTERNS = ['RGGB', 'BGGR', 'GRBG', 'GBRG']
+
+
+def _baseline_replace_hot_pixels(data, ratio):
+    # hot pixel removal as it was first implemented, used as reference
+    kernel = np.ones((3, 3))
+    kernel[1, 1] = 0
+
+    neighbor_sum = convolve2d(data, kernel, mode='same', boundary='fill', fillvalue=0)
+    num_neighbor = convolve2d(np.ones(data.shape), kernel, mode='same', boundary='fill', fillvalue=0)
+    means = (neighbor_sum / num_neighbor).astype(data.dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(data / means > ratio, means, data)
+
+
+def _make_frame(dtype, background, hot_value):
+    data = np.random.default_rng(0).normal(background, background / 20, (64, 80))
+    data[10, 20] = hot_value
+    return data.astype(dtype)
+
+
+@pytest.mark.parametrize("dtype, background, hot_value", [
+    ('>i2', 1000, 30000),
+    ('>i4', 1000, 60000),
+    ('>f4', 1000, 60000),
+    ('uint32', 1000, 60000),
+    ('uint16', 1000, 60000),
+])
+def test_replace_hot_pixels_matches_baseline(dtype, background, hot_value):
+    data = _make_frame(dtype, background, hot_value)
+    original = data.copy()
+    expected = _baseline_replace_hot_pixels(data.copy(), _HOT_PIXEL_RATIO)
+
+    replaced_count = replace_hot_pixels(data, _HOT_PIXEL_RATIO)
+
+    assert replaced_count == 1
+    assert data.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(data != original, expected != original)
+
+    if np.issubdtype(data.dtype, np.integer):
+        np.testing.assert_array_equal(data, expected)
+    else:
+        # neighbor sums are float32 instead of float64
+        np.testing.assert_allclose(data, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("dtype", ['>i2', 'int16', 'int32'])
+def test_replace_hot_pixels_matches_baseline_on_signed_data(dtype):
+    data = np.random.default_rng(1).integers(-50, 50, (64, 80)).astype(dtype)
+    expected = _baseline_replace_hot_pixels(data.copy(), _HOT_PIXEL_RATIO)
+
+    replace_hot_pixels(data, _HOT_PIXEL_RATIO)
+
+    np.testing.assert_array_equal(data, expected)
+
+
+def _make_color_planes(height, width):
+    # each color has its own value range, so a misplaced site cannot go unnoticed
+    rng = np.random.default_rng(2)
+    return {name: rng.uniform(low, low + 500, (height, width)).astype(np.float32)
+            for name, low in (('R', 1000), ('G1', 5000), ('G2', 10000), ('B', 20000))}
+
+
+def _make_cfa(planes, bayer_pattern):
+    height, width = planes['R'].shape
+    data = np.empty((2 * height, 2 * width), dtype=np.float32)
+    green_planes = [planes['G1'], planes['G2']]
+
+    for index, color in enumerate(bayer_pattern):
+        plane = green_planes.pop(0) if color == 'G' else planes[color]
+        data[index // 2::2, index % 2::2] = plane
+
+    return data
+
+
+@pytest.mark.parametrize("bayer_pattern", _BAYER_PATTERNS)
+def test_green_superpixel_averages_green_sites(bayer_pattern):
+    planes = _make_color_planes(12, 16)
+    data = _make_cfa(planes, bayer_pattern)
+
+    result = green_superpixel(data, bayer_pattern)
+
+    np.testing.assert_allclose(result, (planes['G1'] + planes['G2']) / 2, rtol=1e-6)
+
+
+@pytest.mark.parametrize("bayer_pattern", _BAYER_PATTERNS)
+def test_superpixel_debayer_puts_colors_in_their_channel(bayer_pattern):
+    planes = _make_color_planes(12, 16)
+    data = _make_cfa(planes, bayer_pattern)
+
+    result = superpixel_debayer(data, bayer_pattern)
+
+    assert result.shape == (3, 12, 16)
+    np.testing.assert_allclose(result[0], planes['R'])
+    np.testing.assert_allclose(result[1], (planes['G1'] + planes['G2']) / 2, rtol=1e-6)
+    np.testing.assert_allclose(result[2], planes['B'])
+
+
+@pytest.mark.parametrize("bayer_pattern", _BAYER_PATTERNS)
+@pytest.mark.parametrize("factor", [2, 3])
+def test_bin_cfa_keeps_each_site_color(bayer_pattern, factor):
+    planes = _make_color_planes(12, 18)
+    # odd trailing row and column are dropped
+    data = np.pad(_make_cfa(planes, bayer_pattern), ((0, 1), (0, 1)))
+
+    result = bin_cfa(data, factor)
+
+    binned_planes = {name: bin_data(plane, factor) for name, plane in planes.items()}
+    np.testing.assert_allclose(result, _make_cfa(binned_planes, bayer_pattern), rtol=1e-6)
+
+
+@pytest.mark.parametrize("shift_x, shift_y", [(1, 0), (0, -2), (3, 1)])
+def test_warp_affine_cfa_even_translation_rolls_sub_planes(shift_x, shift_y):
+    data = _make_cfa(_make_color_planes(24, 32), 'RGGB')
+    # destination superpixel (u, v) comes from source superpixel (u + shift_x, v + shift_y)
+    inverse_matrix = np.array([[1., 0, shift_x], [0, 1, shift_y], [0, 0, 1]])
+    destination = np.empty(data.shape, dtype=np.float32)
+
+    warp_affine_cfa(data, inverse_matrix, destination)
+
+    # sub-plane borders are filled by warping, only compare pixels coming from inside source
+    margin = 2 * max(abs(shift_x), abs(shift_y))
+    inside = (slice(margin, -margin), slice(margin, -margin))
+    for row_offset in (0, 1):
+        for column_offset in (0, 1):
+            sites = (slice(row_offset, None, 2), slice(column_offset, None, 2))
+            expected = np.roll(data[sites], (-shift_y, -shift_x), axis=(0, 1))
+            np.testing.assert_allclose(destination[sites][inside], expected[inside], rtol=1e-5)
+    np.testing.assert_allclose(
+        destination[inside], np.roll(data, (-2 * shift_y, -2 * shift_x), axis=(0, 1))[inside], rtol=1e-5)
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from als.lut import PointwiseChain
+from als.model.base import Image
+from als.processing import Levels, ColorBalance, ConvertForOutput
+
+
+def _make_processors(midtones, black, white, red, blue):
+    levels = Levels()
+    _, black_parameter, midtones_parameter, white_parameter = levels.get_parameters()
+    black_parameter.value = black
+    midtones_parameter.value = midtones
+    white_parameter.value = white
+
+    color_balance = ColorBalance()
+    active_parameter, red_parameter, _, blue_parameter = color_balance.get_parameters()
+    active_parameter.value = True
+    red_parameter.value = red
+    blue_parameter.value = blue
+
+    return [levels, color_balance, ConvertForOutput()]
+
+
+def _process_one_by_one(data, settings):
+    image = Image(data.copy())
+    for processor in _make_processors(*settings):
+        image = processor.process_image(image)
+    return image.data
+
+
+def _process_chained(data, settings):
+    return PointwiseChain(_make_processors(*settings)).process_image(Image(data.copy())).data
+
+
+def _make_data(shape):
+    rng = np.random.default_rng(3)
+    return (rng.gamma(2., 3000., shape) + 500).clip(0, 65535).astype(np.float32)
+
+
+# lookup tables quantize image data range to 65536 levels, so each value may be off by one input step, scaled by the
+# local slope of the processing chain. The slope stays close to 1 with gentle levels, but gets steep near black point
+# with high midtones
+@pytest.mark.parametrize('shape', [(60, 80), (3, 60, 80)])
+@pytest.mark.parametrize('settings, tolerance', [
+    ((1, 0, 65535, 1, 1), 1),
+    ((0.5, 0, 65535, 1, 1), 1),
+    ((1.4, 2000, 50000, 1.2, 0.8), 2),
+    ((2, 1000, 30000, 1.5, 0.6), 10),
+])
+def test_chain_matches_processors_applied_one_by_one(shape, settings, tolerance):
+    data = _make_data(shape)
+
+    expected = _process_one_by_one(data, settings)
+    result = _process_chained(data, settings)
+
+    # output conversion moves colors to last axis : lookup tables must be read along that axis
+    assert result.shape == expected.shape
+    assert result.dtype == expected.dtype
+    difference = np.abs(result.astype(np.int32) - expected.astype(np.int32))
+    assert difference.max() <= tolerance
+    assert difference.mean() < 1
+
+
+@pytest.mark.parametrize('shape', [(20, 30), (3, 20, 30)])
+@pytest.mark.parametrize('infinite', [False, True])
+def test_chain_falls_back_to_one_by_one_when_range_cannot_be_quantized(shape, infinite):
+    if infinite:
+        data = _make_data(shape)
+        data[..., 3, 4] = np.inf
+    else:
+        data = np.full(shape, 1234, dtype=np.float32)
+    settings = (1.4, 2000, 50000, 1.2, 0.8)
+
+    with np.errstate(all='ignore'):
+        expected = _process_one_by_one(data, settings)
+        result = _process_chained(data, settings)
+
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize('shape', [(20, 30), (3, 20, 30)])
+def test_chain_maps_finite_values_of_data_holding_nan(shape):
+    # data minimum and maximum ignore NaN, so lookup tables are used. Output of NaN is undefined either way
+    data = _make_data(shape)
+    data[..., 3, 4] = np.nan
+    settings = (1.4, 2000, 50000, 1.2, 0.8)
+
+    with np.errstate(all='ignore'):
+        expected = _process_one_by_one(data, settings)
+        result = _process_chained(data, settings)
+
+    assert result.shape == expected.shape
+    difference = np.abs(result.astype(np.int32) - expected.astype(np.int32))
+    difference[3, 4] = 0
+    assert difference.max() <= 2
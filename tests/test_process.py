@@ -1,6 +1,56 @@
+import numpy as np
+import pytest
+
+from als.code_utilities import SignalingQueue
+from als.messaging import MESSAGE_HUB
+from als.model.base import Image
+from als.processing import FrameRejectedError, ImageProcessor, Pipeline, ProcessingError
+
+
 # TODO
 
 
 def test_todo():
 
     assert True
+
+
+class _Receiver:
+
+    def __init__(self):
+        self.messages = []
+
+    def on_message(self, message):
+        self.messages.append(message)
+
+
+class _Rejecting(ImageProcessor):
+
+    def __init__(self, error):
+        super().__init__()
+        self._error = error
+
+    def process_image(self, image):
+        raise self._error
+
+
+@pytest.mark.parametrize('error, level, text', [
+    (FrameRejectedError("Too few stars : 3 < 10"), 'INFO', 'rejected : Too few stars'),
+    (ProcessingError("broken"), 'WARNING', 'Image will be ignored'),
+])
+def test_pipeline_reports_rejections_as_information_and_errors_as_warnings(error, level, text):
+    receiver = _Receiver()
+    MESSAGE_HUB.add_receiver(receiver)
+    results = []
+    pipeline = Pipeline("test", SignalingQueue(), [_Rejecting(error)])
+    pipeline.new_result_signal.connect(results.append)
+
+    try:
+        pipeline._handle_image(Image(np.zeros((4, 4), dtype=np.float32)))
+    finally:
+        MESSAGE_HUB.message_signal.disconnect(receiver.on_message)
+
+    assert not results
+    assert len(receiver.messages) == 1
+    assert level in receiver.messages[0]
+    assert text in receiver.messages[0]
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from als import statistics
+from als.statistics import ImageStatistics
+
+_PERCENTS = [0, 0.1, 1, 10, 25, 50, 75, 90, 99, 99.9, 100]
+
+
+def _expected_percentiles(data, percents):
+    # statistics answer the data value at the rank just below wanted percentile, with no interpolation
+    values = np.sort(data, axis=None)
+    return [float(values[int(np.floor(percent / 100 * (values.size - 1)))]) for percent in percents]
+
+
+def _expected_median_absolute_deviation(data):
+    values = np.sort(data, axis=None).astype(np.float64)
+    median = values[(values.size - 1) // 2]
+    deviations = np.sort(np.abs(values - median))
+    return float(deviations[(values.size - 1) // 2])
+
+
+@pytest.mark.parametrize('dtype, high', [(np.uint8, 200), (np.uint16, 4000), (np.uint16, 65535)])
+def test_integer_statistics_are_exact(dtype, high):
+    rng = np.random.default_rng(1)
+    data = rng.integers(10, high, (301, 203)).astype(dtype)
+
+    image_statistics = ImageStatistics(data)
+
+    assert image_statistics.minimum() == data.min()
+    assert image_statistics.maximum() == data.max()
+    assert image_statistics.percentiles(_PERCENTS) == _expected_percentiles(data, _PERCENTS)
+    # odd value count : the median has no interpolation in numpy either
+    assert image_statistics.median() == np.median(data)
+    assert image_statistics.median_absolute_deviation() == np.median(np.abs(data - np.median(data)))
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_float_statistics_are_within_one_bin(dtype):
+    rng = np.random.default_rng(2)
+    data = rng.gamma(2., 1000., (400, 300)).astype(dtype)
+    bin_width = (float(data.max()) - float(data.min())) / 65535
+
+    image_statistics = ImageStatistics(data)
+
+    assert image_statistics.minimum() == pytest.approx(data.min())
+    assert image_statistics.maximum() == pytest.approx(data.max())
+    np.testing.assert_allclose(
+        image_statistics.percentiles(_PERCENTS), _expected_percentiles(data, _PERCENTS), rtol=0, atol=bin_width)
+    assert image_statistics.median() == pytest.approx(np.median(data), abs=bin_width)
+    assert image_statistics.median_absolute_deviation() == pytest.approx(
+        _expected_median_absolute_deviation(data), abs=bin_width)
+
+
+@pytest.mark.parametrize('color_axis', [0, 2])
+def test_color_statistics_are_per_channel(color_axis):
+    rng = np.random.default_rng(3)
+    channels = [rng.integers(low, low + 1000, (51, 71)).astype(np.uint16) for low in (100, 5000, 30000)]
+    data = np.stack(channels, axis=color_axis)
+
+    image_statistics = ImageStatistics(data, color_axis)
+
+    assert image_statistics.channel_count == 3
+    assert image_statistics.minimum() == data.min()
+    assert image_statistics.maximum() == data.max()
+    for index, channel in enumerate(channels):
+        assert image_statistics.minimum(index) == channel.min()
+        assert image_statistics.maximum(index) == channel.max()
+        assert image_statistics.median(index) == np.median(channel)
+        assert image_statistics.median_absolute_deviation(index) == _expected_median_absolute_deviation(channel)
+
+
+@pytest.mark.parametrize('values, median, median_absolute_deviation', [
+    ([0, 1, 2, 3, 10], 2, 1),
+    ([1, 1, 2, 2, 4, 6, 9], 2, 1),
+    ([5, 5, 5, 6, 9], 5, 0),
+    ([1, 7, 9, 9, 9], 9, 0),
+    ([0, 3, 8, 9, 9], 8, 1),
+    ([0, 10, 20, 30], 10, 10),
+    ([7], 7, 0),
+])
+def test_median_absolute_deviation_of_small_data(values, median, median_absolute_deviation):
+    data = np.array([values], dtype=np.uint16)
+
+    image_statistics = ImageStatistics(data)
+
+    assert image_statistics.median() == median
+    assert image_statistics.median_absolute_deviation() == median_absolute_deviation
+
+
+def test_flat_data_statistics():
+    data = np.full((20, 30), 1234.5, dtype=np.float32)
+
+    image_statistics = ImageStatistics(data)
+
+    assert image_statistics.percentiles(_PERCENTS) == [1234.5] * len(_PERCENTS)
+    assert image_statistics.median_absolute_deviation() == 0
+
+
+def test_histograms_of_big_data_are_computed_on_strided_subsample(monkeypatch):
+    monkeypatch.setattr(statistics, '_HISTOGRAM_MAX_SAMPLE_SIZE', 1000)
+    rng = np.random.default_rng(4)
+    data = rng.integers(1000, 3000, (101, 99)).astype(np.uint16)
+    # extremes are out of subsample, but minimum and maximum are still computed on whole data
+    data[1, 1] = 10
+    data[3, 5] = 60000
+
+    image_statistics = ImageStatistics(data)
+
+    # stride is the smallest giving at most about 1000 values : ceil(sqrt(101 * 99 / 1000))
+    sample = data[::4, ::4]
+    assert image_statistics.minimum() == 10
+    assert image_statistics.maximum() == 60000
+    assert image_statistics.percentiles(_PERCENTS) == _expected_percentiles(sample, _PERCENTS)
+    assert image_statistics.median() == _expected_percentiles(sample, [50])[0]
+    assert image_statistics.median_absolute_deviation() == _expected_median_absolute_deviation(sample)
+
+
+def test_explicit_stride_is_used_for_histograms():
+    rng = np.random.default_rng(5)
+    data = rng.integers(0, 50000, (90, 120)).astype(np.uint16)
+
+    image_statistics = ImageStatistics(data, stride=3)
+
+    sample = data[::3, ::3]
+    assert image_statistics.percentiles(_PERCENTS) == _expected_percentiles(sample, _PERCENTS)
+    assert image_statistics.median_absolute_deviation() == _expected_median_absolute_deviation(sample)